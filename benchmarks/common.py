@@ -0,0 +1,163 @@
+import json
+import platform
+import sys
+import time
+
+try:
+    import resource
+except ImportError:
+    # Not available on Windows.
+    resource = None
+
+
+PERCENTILES = (50, 90, 99)
+
+
+def measure(fn, repeat, setup=None):
+    """Call fn repeat times and return the duration of each call.
+
+    setup, if given, is called before each call and isn't timed.
+    """
+    samples = []
+    for _ in range(repeat):
+        if setup is not None:
+            setup()
+        start = time.perf_counter()
+        fn()
+        samples.append(time.perf_counter()-start)
+    return samples
+
+
+def percentile(sorted_samples, p):
+    if not sorted_samples:
+        return None
+    index = (len(sorted_samples)-1)*p/100.0
+    lower = int(index)
+    upper = min(lower+1, len(sorted_samples)-1)
+    fraction = index-lower
+    return (sorted_samples[lower]*(1-fraction)
+            + sorted_samples[upper]*fraction)
+
+
+def summarize(samples, **extra):
+    """Return the statistics of duration samples (in seconds) as a dict.
+
+    Keyword arguments are added to the result as they are.
+    """
+    sorted_samples = sorted(samples)
+    result = {
+        "count": len(samples),
+        "mean": sum(samples)/len(samples) if samples else None,
+        "min": sorted_samples[0] if samples else None,
+        "max": sorted_samples[-1] if samples else None,
+    }
+    for p in PERCENTILES:
+        result["p{0}".format(p)] = percentile(sorted_samples, p)
+    result.update(extra)
+    return result
+
+
+def peak_rss():
+    """The peak resident set size of this process in bytes, or None."""
+    if resource is None:
+        return None
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    if sys.platform == "darwin":
+        return rss
+    # Linux reports kilobytes.
+    return rss*1024
+
+
+def machine_info():
+    return {
+        "python": platform.python_version(),
+        "implementation": platform.python_implementation(),
+        "platform": platform.platform(),
+        "machine": platform.machine(),
+        "time": time.strftime("%Y-%m-%dT%H:%M:%S"),
+    }
+
+
+def add_output_arguments(parser):
+    parser.add_argument("--json",
+                        help="write the results to this file as json")
+    parser.add_argument("--baseline",
+                        help="compare the results with this json file")
+    parser.add_argument("--threshold",
+                        type=float,
+                        default=0.2,
+                        help="relative slowdown reported as a regression")
+
+
+def write_results(results, path):
+    with open(path, "w") as f:
+        json.dump({"machine": machine_info(), "results": results},
+                  f,
+                  indent=1,
+                  sort_keys=True)
+
+
+def load_results(path):
+    with open(path) as f:
+        return json.load(f)["results"]
+
+
+def compare(results, baseline, metric="p50", threshold=0.2):
+    """Return (name, old, new, ratio) for every result slower than baseline.
+
+    A result is slower when its metric is more than threshold (relative)
+    above the baseline one. Results missing from either side are ignored.
+    """
+    regressions = []
+    for name, result in sorted(results.items()):
+        old = baseline.get(name, {}).get(metric)
+        new = result.get(metric)
+        if not old or new is None:
+            continue
+        ratio = new/old
+        if ratio > 1+threshold:
+            regressions.append((name, old, new, ratio))
+    return regressions
+
+
+def format_results(results, columns=("count", "p50", "p90", "p99", "max")):
+    """Format results as a table, durations in milliseconds."""
+    width = max([len(name) for name in results] + [4])
+    lines = ["{0:<{1}}".format("name", width) + "".join(
+        " {0:>10}".format(column) for column in columns)]
+    for name, result in sorted(results.items()):
+        line = "{0:<{1}}".format(name, width)
+        for column in columns:
+            value = result.get(column)
+            if value is None:
+                line += " {0:>10}".format("-")
+            elif column == "count" or isinstance(value, int):
+                line += " {0:>10}".format(value)
+            else:
+                line += " {0:>10.3f}".format(value*1000)
+        lines.append(line)
+    return "\n".join(lines)
+
+
+def report(results, args, columns=None):
+    """Print results and handle the arguments of add_output_arguments.
+
+    Return the process exit code, 1 if a regression was found.
+    """
+    if columns is None:
+        print(format_results(results))
+    else:
+        print(format_results(results, columns))
+    if args.json:
+        write_results(results, args.json)
+    exit_code = 0
+    if args.baseline:
+        regressions = compare(results,
+                              load_results(args.baseline),
+                              threshold=args.threshold)
+        for name, old, new, ratio in regressions:
+            print("REGRESSION {0}: {1:.3f} ms -> {2:.3f} ms ({3:.2f}x)".format(
+                name, old*1000, new*1000, ratio))
+        if regressions:
+            exit_code = 1
+    return exit_code
@@ -0,0 +1,295 @@
+"""Microbenchmarks of the framework core, no Qt needed.
+
+Measures framework.diff.list_diff over a corpus of edit patterns and sizes,
+DataManager push/undo/redo at different history depths with every history
+storage and framework.debug.generate_view_data on synthetic view trees.
+
+    python -m benchmarks.core --json core.json
+    python -m benchmarks.core --baseline core.json
+"""
+import argparse
+import os
+import random
+import sys
+import tempfile
+
+from pyrsistent import pmap
+from pyrsistent import pvector
+
+from benchmarks import common
+from framework import diff
+from framework.data import DataManager
+from framework.debug import generate_view_data
+from framework.history import KeyframeHistoryStorage
+from framework.history import ListHistoryStorage
+from framework.history import SegmentHistoryStorage
+
+
+DEFAULT_SIZES = (100, 1000, 10000, 100000)
+DEFAULT_DEPTHS = (10, 100, 1000)
+# Name -> storage factory taking a directory for the history file.
+STORAGES = {
+    "list": lambda directory: ListHistoryStorage(),
+    "keyframe": lambda directory: KeyframeHistoryStorage(),
+    "segment": lambda directory: SegmentHistoryStorage(
+        os.path.join(directory, "history")),
+}
+# (fanout, depth) of the view trees.
+DEFAULT_TREES = ((10, 2), (10, 3), (10, 4))
+COLUMNS = ("count", "p50", "p90", "max", "items_per_second", "deletes",
+           "inserts", "moves")
+
+
+def _replace_one(keys, rand, next_key):
+    new_keys = list(keys)
+    new_keys[rand.randrange(len(keys))] = next_key()
+    return new_keys
+
+
+def _insert_head(keys, rand, next_key):
+    return [next_key() for _ in range(max(1, len(keys)//100))] + keys
+
+
+def _insert_tail(keys, rand, next_key):
+    return keys + [next_key() for _ in range(max(1, len(keys)//100))]
+
+
+def _move_one(keys, rand, next_key):
+    new_keys = list(keys)
+    new_keys.insert(rand.randrange(len(keys)),
+                    new_keys.pop(rand.randrange(len(keys))))
+    return new_keys
+
+
+def _shuffle(keys, rand, next_key):
+    new_keys = list(keys)
+    rand.shuffle(new_keys)
+    return new_keys
+
+
+def _bulk_delete(keys, rand, next_key):
+    start = rand.randrange(len(keys)//2+1)
+    return keys[:start] + keys[start+len(keys)//2:]
+
+
+def _scattered_delete(keys, rand, next_key):
+    return [key for key in keys if rand.random() >= 0.1]
+
+
+# name -> function(keys, random, next_key) returning the new key list.
+DIFF_PATTERNS = {
+    "replace_one": _replace_one,
+    "insert_head": _insert_head,
+    "insert_tail": _insert_tail,
+    "move_one": _move_one,
+    "shuffle": _shuffle,
+    "bulk_delete": _bulk_delete,
+    "scattered_delete": _scattered_delete,
+}
+
+
+def bench_list_diff(sizes, repeat, seed, strategies=diff.STRATEGIES):
+    results = {}
+    for pattern, change in sorted(DIFF_PATTERNS.items()):
+        for size in sizes:
+            rand = random.Random(seed)
+            counter = [size]
+
+            def next_key():
+                counter[0] += 1
+                return counter[0]
+            old_keys = list(range(size))
+            new_keys = change(old_keys, rand, next_key)
+            for strategy in strategies:
+                samples = common.measure(
+                    lambda: diff.list_diff(old_keys, new_keys, None,
+                                           strategy),
+                    repeat)
+                stats = diff.diff_stats(
+                    diff.list_diff(old_keys, new_keys, None, strategy))
+                best = min(samples)
+                name = "diff/{0}/{1}/{2}".format(pattern, strategy, size)
+                results[name] = common.summarize(
+                    samples,
+                    items_per_second=int(size/best) if best else None,
+                    deletes=stats["delete"],
+                    inserts=stats["insert"],
+                    moves=stats["move"])
+    return results
+
+
+def _make_root(size, rand):
+    return pmap({"items": pvector(pmap({"id": i, "value": rand.random()})
+                                  for i in range(size)),
+                 "selected": None})
+
+
+def _edit(root, rand):
+    items = root["items"]
+    i = rand.randrange(len(items))
+    return root.set("items",
+                    items.set(i, items[i].set("value", rand.random())))
+
+
+def bench_data_manager(depths, repeat, seed, storages=tuple(STORAGES),
+                       size=1000):
+    results = {}
+    for storage in storages:
+        for depth in depths:
+            with tempfile.TemporaryDirectory() as directory:
+                results.update(_bench_data_manager(
+                    STORAGES[storage](directory),
+                    "data_manager/{0}/{1}/".format(storage, depth),
+                    depth,
+                    repeat,
+                    seed,
+                    size))
+    return results
+
+
+def _bench_data_manager(storage, prefix, depth, repeat, seed, size):
+    results = {}
+    rand = random.Random(seed)
+    data_manager = DataManager(_make_root(size, rand), storage=storage)
+    try:
+        for _ in range(depth):
+            data_manager.push_data(_edit(data_manager.get_data(), rand))
+        # Pushes replace the redo entries, undo first so the history depth
+        # stays the same.
+        samples = []
+        for _ in range(repeat):
+            data_manager.undo()
+            new_data = _edit(data_manager.get_data(), rand)
+            samples.extend(common.measure(
+                lambda: data_manager.push_data(new_data), 1))
+        results[prefix + "push"] = common.summarize(samples)
+        steps = min(repeat, depth)
+        results[prefix + "undo"] = common.summarize(
+            common.measure(data_manager.undo, steps))
+        results[prefix + "redo"] = common.summarize(
+            common.measure(data_manager.redo, steps))
+    finally:
+        data_manager.close()
+    return results
+
+
+class SyntheticView(object):
+    """The part of the ViewBase interface generate_view_data uses."""
+
+    def __init__(self, data, children):
+        self._data = data
+        self._children = children
+        self._submit_data_callback = None
+        self._parent_view = None
+        self._debug_dirty = True
+        for child in children:
+            child._parent_view = self
+
+    def set_current_data(self, data):
+        self._data = data
+        view = self
+        while view is not None:
+            view._debug_dirty = True
+            view = view._parent_view
+
+    def get_current_data(self):
+        return self._data
+
+    def iter_child_view(self):
+        return iter(self._children)
+
+
+def _make_view_tree(fanout, depth, data):
+    if depth == 0:
+        return SyntheticView(data, [])
+    return SyntheticView(data, [_make_view_tree(fanout, depth-1, data)
+                                for _ in range(fanout)])
+
+
+def _first_leaf(view):
+    while view._children:
+        view = view._children[0]
+    return view
+
+
+def bench_view_data(trees, repeat):
+    results = {}
+    for fanout, depth in trees:
+        root = _make_view_tree(fanout, depth, pmap())
+        views = sum(fanout**level for level in range(depth+1))
+        prefix = "view_data/{0}x{1}/".format(fanout, depth)
+        samples = common.measure(lambda: generate_view_data(root, None),
+                                 repeat)
+        results[prefix + "full"] = common.summarize(samples, views=views)
+        view_data = generate_view_data(root, None)
+        samples = common.measure(lambda: generate_view_data(root, view_data),
+                                 repeat)
+        results[prefix + "unchanged"] = common.summarize(samples, views=views)
+        leaf = _first_leaf(root)
+        samples = []
+        for i in range(repeat):
+            leaf.set_current_data(pmap({"i": i}))
+            samples.extend(common.measure(
+                lambda: generate_view_data(root, view_data), 1))
+        results[prefix + "one_leaf"] = common.summarize(samples, views=views)
+    return results
+
+
+def format_scaling(results, sizes):
+    """A table of the median list_diff time (ms) of each pattern per size."""
+    rows = {}
+    for name, result in results.items():
+        parts = name.split("/")
+        if parts[0] == "diff":
+            rows.setdefault((parts[1], parts[2]), {})[int(parts[3])] = (
+                result["p50"])
+    lines = ["{0:<32}".format("pattern/strategy") + "".join(
+        " {0:>10}".format(size) for size in sizes)]
+    for (pattern, strategy), times in sorted(rows.items()):
+        line = "{0:<32}".format(pattern + "/" + strategy)
+        for size in sizes:
+            line += " {0:>10.3f}".format(times[size]*1000)
+        lines.append(line)
+    return "\n".join(lines)
+
+
+def parse_args():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--sizes",
+                        default=",".join(str(s) for s in DEFAULT_SIZES))
+    parser.add_argument("--depths",
+                        default=",".join(str(d) for d in DEFAULT_DEPTHS))
+    parser.add_argument("--storages",
+                        default=",".join(STORAGES),
+                        help="history storages DataManager is timed with")
+    parser.add_argument("--repeat", type=int, default=10)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--no-numpy",
+                        action="store_true",
+                        help="don't use the NumPy fast path of list_diff")
+    common.add_output_arguments(parser)
+    return parser.parse_args()
+
+
+def main():
+    args = parse_args()
+    if args.no_numpy:
+        diff.NUMPY_THRESHOLD = float("inf")
+    sizes = [int(size) for size in args.sizes.split(",")]
+    depths = [int(depth) for depth in args.depths.split(",")]
+    results = {}
+    results.update(bench_list_diff(sizes, args.repeat, args.seed))
+    storages = args.storages.split(",")
+    results.update(bench_data_manager(depths,
+                                      args.repeat,
+                                      args.seed,
+                                      storages))
+    results.update(bench_view_data(DEFAULT_TREES, args.repeat))
+    exit_code = common.report(results, args, COLUMNS)
+    print()
+    print(format_scaling(results, sizes))
+    sys.exit(exit_code)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,331 @@
+"""End to end benchmark of the todo and level editors.
+
+Every editor and size runs in its own process under the Qt offscreen
+platform: the RootView of the editor refreshed by a RefreshScheduler from a
+DataManager, like in the apps, on synthetic data. Each operation (add,
+toggle, recolor, move, select, delete, undo, redo) is timed from the push of
+the new data until every refresh it caused is done.
+
+    python -m benchmarks.editors --sizes 1,100,10000 --json result.json
+    python -m benchmarks.editors --baseline result.json
+"""
+import argparse
+import json
+import os
+import random
+import subprocess
+import sys
+import time
+
+# Qt reads it when the QApplication is created.
+os.environ.setdefault("QT_QPA_PLATFORM", "offscreen")
+
+from PySide6 import QtWidgets
+from pyrsistent import pmap
+from pyrsistent import pvector
+
+from benchmarks import common
+from framework.data import DataManager
+from framework.scheduler import RefreshScheduler
+from level.data import HouseData
+from level.data import LevelData
+from level.data import TreeData
+from level.data import Vector2
+from level.view import RootView as LevelRootView
+from level.view import SceneObjectView
+from todo.data import TodoAppData
+from todo.data import TodoItemData
+from todo.view import RootView as TodoRootView
+
+
+DEFAULT_SIZES = (1, 100, 10000, 100000)
+FRAME_BUDGET = 1.0/60
+# A refresh which doesn't settle in this time (in seconds) is a failure.
+SETTLE_TIMEOUT = 600
+COLORS = ("#FFFFFF", "#FF0000", "#00FF00", "#0000FF", "#FFFF00")
+COLUMNS = ("count", "p50", "p90", "p99", "max", "peak_rss", "widgets")
+
+
+class EditorBenchmark(object):
+    """Drives the RootView of an editor through a DataManager."""
+
+    NAME = None
+    OPERATIONS = ()
+
+    def __init__(self, qt_app, size, seed=0):
+        self._qt_app = qt_app
+        self._size = size
+        self._random = random.Random(seed)
+        self._next_data = None
+        self.data_manager = None
+        self.root_view = None
+        self.scheduler = None
+
+    def _generate_data(self, size):
+        raise NotImplementedError(
+            "This method should be implemented in sub-class.")
+
+    def _create_root_view(self, submit_data_callback):
+        raise NotImplementedError(
+            "This method should be implemented in sub-class.")
+
+    def _is_busy(self):
+        """Whether the views are still doing asynchronous work."""
+        return False
+
+    def load(self):
+        initial_data = self._generate_data(self._size)
+        start = time.perf_counter()
+        self.data_manager = DataManager(initial_data, max_entries=1000)
+        self.root_view = self._create_root_view(self._submit)
+        self.root_view.bind_data_source(self.data_manager.get_data)
+        self.root_view.widget.resize(1024, 768)
+        self.root_view.widget.show()
+        self.scheduler = RefreshScheduler(frame_budget=FRAME_BUDGET)
+        self.scheduler.watch(self.data_manager)
+        self.scheduler.add_task(self._update)
+        self._settle()
+        return time.perf_counter()-start
+
+    def _submit(self, new_data, record_in_history=True):
+        self.data_manager.push_data(new_data,
+                                    record_in_history=record_in_history)
+
+    def _update(self):
+        self.root_view.try_refresh(self.data_manager.get_data())
+
+    def _settle(self):
+        deadline = time.perf_counter()+SETTLE_TIMEOUT
+        self._qt_app.processEvents()
+        while self.scheduler.has_pending() or self._is_busy():
+            if time.perf_counter() > deadline:
+                raise RuntimeError("The refresh didn't settle.")
+            self._qt_app.processEvents()
+
+    def run(self, repeat):
+        results = {}
+        load_time = self.load()
+        results["load"] = common.summarize([load_time], **self._stats())
+        for operation in self.OPERATIONS:
+            prepare = getattr(self, "_prepare_" + operation, None)
+            # Most operations prepare new data and push it.
+            samples = common.measure(
+                getattr(self, "_run_" + operation, self._push_next),
+                repeat,
+                prepare)
+            results[operation] = common.summarize(samples, **self._stats())
+        return results
+
+    def _stats(self):
+        return {
+            "peak_rss": common.peak_rss(),
+            "widgets": len(QtWidgets.QApplication.allWidgets()),
+        }
+
+    def _push_next(self):
+        self._submit(self._next_data)
+        self._settle()
+
+    def _run_undo(self):
+        self.data_manager.undo()
+        self._settle()
+
+    def _run_redo(self):
+        self.data_manager.redo()
+        self._settle()
+
+
+class TodoBenchmark(EditorBenchmark):
+    NAME = "todo"
+    OPERATIONS = ("add", "toggle", "recolor", "move", "delete", "undo",
+                  "redo")
+
+    def _generate_data(self, size):
+        return TodoAppData(todo_list=pvector(
+            TodoItemData(done=self._random.random() < 0.5,
+                         content="todo {0}".format(i),
+                         color=self._random.choice(COLORS))
+            for i in range(size)))
+
+    def _create_root_view(self, submit_data_callback):
+        return TodoRootView(submit_data_callback)
+
+    def _set_todo_list(self, todo_list):
+        data = self.data_manager.get_data()
+        self._next_data = data.set("todo_list", todo_list)
+
+    def _random_index(self):
+        todo_list = self.data_manager.get_data().todo_list
+        return todo_list, self._random.randrange(len(todo_list))
+
+    def _prepare_add(self):
+        todo_list = self.data_manager.get_data().todo_list
+        self._set_todo_list(todo_list.append(
+            TodoItemData(done=False, content="new", color=COLORS[0])))
+
+    def _prepare_toggle(self):
+        todo_list, i = self._random_index()
+        self._set_todo_list(todo_list.set(
+            i, todo_list[i].set("done", not todo_list[i].done)))
+
+    def _prepare_recolor(self):
+        todo_list, i = self._random_index()
+        self._set_todo_list(todo_list.set(
+            i, todo_list[i].set("color", self._random.choice(COLORS))))
+
+    def _prepare_move(self):
+        todo_list, i = self._random_index()
+        item = todo_list[i]
+        todo_list = todo_list.delete(i)
+        j = self._random.randrange(len(todo_list)+1)
+        self._set_todo_list(
+            todo_list[:j].append(item).extend(todo_list[j:]))
+
+    def _prepare_delete(self):
+        todo_list, i = self._random_index()
+        self._set_todo_list(todo_list.delete(i))
+
+
+class LevelBenchmark(EditorBenchmark):
+    NAME = "level"
+    OPERATIONS = ("add", "move", "select", "delete", "undo", "redo")
+
+    def __init__(self, qt_app, size, seed=0):
+        super(LevelBenchmark, self).__init__(qt_app, size, seed)
+        # Only the framework is measured, not the simulated texture loading.
+        SceneObjectView.SIMULATED_LOADING_TIME = dict.fromkeys(
+            SceneObjectView.SIMULATED_LOADING_TIME, 0)
+        self._ids = []
+
+    def _random_object(self, id_):
+        factory = self._random.choice((TreeData, HouseData))
+        return factory(id_=id_, pos=self._random_pos())
+
+    def _random_pos(self):
+        return Vector2(x=self._random.randrange(-300, 300),
+                       y=self._random.randrange(-300, 300))
+
+    def _generate_data(self, size):
+        self._ids = list(range(1, size+1))
+        return LevelData(objects=pmap(
+            {id_: self._random_object(id_) for id_ in self._ids}))
+
+    def _create_root_view(self, submit_data_callback):
+        return LevelRootView(submit_data_callback)
+
+    def _is_busy(self):
+        return self.root_view._scene_view._loading
+
+    def _stats(self):
+        stats = super(LevelBenchmark, self)._stats()
+        stats["scene_items"] = len(
+            self.root_view._scene_view.widget.scene().items())
+        return stats
+
+    def _set_objects(self, objects):
+        data = self.data_manager.get_data()
+        self._next_data = data.set("objects", objects)
+
+    def _prepare_add(self):
+        new_id = self._ids[-1]+1 if self._ids else 1
+        self._ids.append(new_id)
+        objects = self.data_manager.get_data().objects
+        self._set_objects(objects.set(new_id, self._random_object(new_id)))
+
+    def _prepare_move(self):
+        objects = self.data_manager.get_data().objects
+        id_ = self._random.choice(self._ids)
+        self._set_objects(objects.set(
+            id_, objects[id_].set("pos", self._random_pos())))
+
+    def _prepare_select(self):
+        objects = self.data_manager.get_data().objects
+        id_ = self._random.choice(self._ids)
+        evolver = objects.evolver()
+        for each_id, object_ in objects.iteritems():
+            if object_.is_selected:
+                evolver.set(each_id, object_.set("is_selected", False))
+        evolver.set(id_, objects[id_].set("is_selected", True))
+        data = self.data_manager.get_data()
+        self._next_data = data.set(objects=evolver.persistent(),
+                                   selected_id=id_)
+
+    def _prepare_delete(self):
+        objects = self.data_manager.get_data().objects
+        id_ = self._ids.pop(self._random.randrange(len(self._ids)))
+        self._set_objects(objects.remove(id_))
+
+
+BENCHMARKS = {
+    TodoBenchmark.NAME: TodoBenchmark,
+    LevelBenchmark.NAME: LevelBenchmark,
+}
+
+
+def run_case(editor, size, repeat, seed):
+    """Run one editor at one size in this process."""
+    qt_app = QtWidgets.QApplication([])
+    benchmark = BENCHMARKS[editor](qt_app, size, seed)
+    results = benchmark.run(repeat)
+    return {"{0}/{1}/{2}".format(editor, size, operation): result
+            for operation, result in results.items()}
+
+
+def run_case_in_subprocess(editor, size, repeat, seed):
+    # A new process per case, so peak RSS and the widgets of one case don't
+    # leak into the next.
+    root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    process = subprocess.run([sys.executable,
+                              "-m",
+                              "benchmarks.editors",
+                              "--case",
+                              "{0}:{1}".format(editor, size),
+                              "--repeat",
+                              str(repeat),
+                              "--seed",
+                              str(seed)],
+                             cwd=root,
+                             stdout=subprocess.PIPE,
+                             universal_newlines=True)
+    lines = process.stdout.strip().splitlines()
+    if not lines:
+        raise RuntimeError("{0}:{1} failed with exit code {2}.".format(
+            editor, size, process.returncode))
+    return json.loads(lines[-1])
+
+
+def parse_args():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--editors", default=",".join(sorted(BENCHMARKS)))
+    parser.add_argument("--sizes",
+                        default=",".join(str(s) for s in DEFAULT_SIZES))
+    parser.add_argument("--repeat", type=int, default=20)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--case", help=argparse.SUPPRESS)
+    common.add_output_arguments(parser)
+    return parser.parse_args()
+
+
+def main():
+    args = parse_args()
+    if args.case:
+        editor, size = args.case.split(":")
+        results = run_case(editor, int(size), args.repeat, args.seed)
+        print(json.dumps(results))
+        sys.stdout.flush()
+        return
+    results = {}
+    for editor in args.editors.split(","):
+        for size in args.sizes.split(","):
+            try:
+                results.update(run_case_in_subprocess(editor,
+                                                      int(size),
+                                                      args.repeat,
+                                                      args.seed))
+            except RuntimeError as e:
+                print(e, file=sys.stderr)
+    sys.exit(common.report(results, args, COLUMNS))
+
+
+if __name__ == "__main__":
+    main()
@@ -1,7 +1,22 @@
+import contextlib
+import functools
+import sys
+import time
 import uuid
+import weakref
+from collections.abc import Sequence
 
 from pyrsistent import field
+from pyrsistent import pmap
+from pyrsistent import pvector
+from pyrsistent import PMap
 from pyrsistent import PRecord
+from pyrsistent import PVector
+
+from framework.history import ListHistoryStorage
+from framework.path import changed_indices
+from framework.path import changed_keys
+from framework.profiler import profiler
 
 
 class RecordWithUUID(PRecord):
@@ -20,6 +35,69 @@ class RecordWithUUID(PRecord):
         return result
 
 
+class InternPool(object):
+    """Maps every value to one shared instance among the equal live ones.
+
+    Values are only referenced weakly, an entry goes away with the last
+    instance using it.
+    """
+
+    def __init__(self):
+        self._refs = {}
+        self.hits = 0
+        self.misses = 0
+
+    def __len__(self):
+        return sum(len(refs) for refs in self._refs.values())
+
+    def intern(self, value):
+        key = (type(value), hash(value))
+        refs = self._refs.get(key)
+        if refs is None:
+            refs = self._refs[key] = []
+        else:
+            for ref in refs:
+                existing = ref()
+                if existing is not None and fast_equal(existing, value):
+                    self.hits += 1
+                    return existing
+        refs.append(weakref.ref(value, functools.partial(self._forget, key)))
+        self.misses += 1
+        return value
+
+    def _forget(self, key, ref):
+        refs = self._refs.get(key)
+        if refs is not None:
+            refs.remove(ref)
+            if not refs:
+                del self._refs[key]
+
+
+intern_pool = InternPool()
+
+
+class InternedRecord(PRecord):
+    """A PRecord whose equal instances share one object.
+
+    Every way of creating a record (constructor, set, evolver, create,
+    unpickling) ends up here, so equal records created at different times,
+    e.g. a position moved back to where it was, are the same object. That
+    saves memory across history snapshots and makes identity based
+    should_refresh checks hit more often. All field values must be
+    hashable.
+    """
+
+    def __new__(cls, **kwargs):
+        record = super(InternedRecord, cls).__new__(cls, **kwargs)
+        if "_precord_buckets" in kwargs:
+            record = intern_pool.intern(record)
+        return record
+
+
+def intern_string(value):
+    return sys.intern(value) if type(value) is str else value
+
+
 class ViewData(PRecord):
     id_ = field()
     name = field()
@@ -28,34 +106,519 @@ class ViewData(PRecord):
     child_views = field()
 
 
+_EMPTY_MAP = pmap()
+_EMPTY_VECTOR = pvector()
+
+
+def estimate_size(new_data, old_data=None):
+    """Estimate the bytes new_data adds on top of old_data.
+
+    Subtrees shared with old_data are not counted, so the cost of estimating
+    a new snapshot against the previous one is proportional to the changed
+    nodes only.
+    """
+    if new_data is old_data:
+        return 0
+    size = sys.getsizeof(new_data)
+    if isinstance(new_data, PMap):
+        if not isinstance(old_data, PMap):
+            old_data = _EMPTY_MAP
+        for key, value in new_data.iteritems():
+            size += estimate_size(value, old_data.get(key))
+    elif isinstance(new_data, PVector):
+        if not isinstance(old_data, PVector):
+            old_data = _EMPTY_VECTOR
+        old_length = len(old_data)
+        for i, value in enumerate(new_data):
+            size += estimate_size(value,
+                                  old_data[i] if i < old_length else None)
+    return size
+
+
+_MISSING = object()
+
+
+def fast_equal(left, right):
+    """Structural equality for persistent data that stays close to
+    O(changed nodes).
+
+    Shared subtrees are skipped by identity, maps whose hashes are both
+    already cached and differ are rejected without a walk, and unlike
+    PMap.__eq__ no temporary dicts are built when two maps differ. Vectors
+    are left to PVector.__eq__.
+    """
+    if left is right:
+        return True
+    # PVector compares its items in C and skips identical ones, walking them
+    # here is several times slower.
+    if type(left) is not type(right) or not isinstance(left, PMap):
+        return left == right
+    if len(left) != len(right):
+        return False
+    # PMap caches its hash the first time it is hashed, e.g. when an
+    # InternedRecord is interned.
+    left_hash = getattr(left, "_cached_hash", None)
+    right_hash = getattr(right, "_cached_hash", None)
+    if (left_hash is not None and right_hash is not None
+            and left_hash != right_hash):
+        return False
+    for key, value in left.iteritems():
+        other = right.get(key, _MISSING)
+        if other is _MISSING or not fast_equal(value, other):
+            return False
+    return True
+
+
+def _edit_path(old_data, new_data):
+    """Return the path of the deepest node holding every change between
+    old_data and new_data, or None if it's the root or nothing changed.
+    """
+    if old_data is new_data:
+        return None
+    path = ()
+    while type(old_data) is type(new_data) and isinstance(
+            new_data, (PMap, PVector)) and len(old_data) == len(new_data):
+        if isinstance(new_data, PMap):
+            changed = changed_keys(old_data, new_data)
+            if changed and changed[0] not in old_data:
+                break
+        else:
+            changed = changed_indices(old_data, new_data)
+        if len(changed) != 1:
+            break
+        path += (changed[0],)
+        old_data = old_data[changed[0]]
+        new_data = new_data[changed[0]]
+    return path or None
+
+
+def _is_prefix(path, other):
+    return len(path) <= len(other) and other[:len(path)] == path
+
+
+class HistoryEntryInfo(PRecord):
+    timestamp = field(initial=0.0)
+    # Estimated bytes not shared with the entry before.
+    size = field(initial=0)
+
+
+class EntryMemoryInfo(PRecord):
+    index = field()
+    # What the storage keeps for the entry, see HistoryStorage.iter_resident.
+    kind = field()
+    timestamp = field()
+    # Nodes and bytes reachable from the entry as if nothing were shared.
+    nodes = field()
+    bytes = field()
+    # Nodes and bytes not already used by an older entry.
+    new_nodes = field()
+    new_bytes = field()
+
+
+class MemoryReport(PRecord):
+    entries = field()
+    unique_nodes = field()
+    shared_nodes = field()
+    unique_bytes = field()
+    total_bytes = field()
+    # Record type name -> bytes of the unique nodes of that type.
+    bytes_by_type = field()
+    history_entries = field()
+    # Bytes of the history kept on disk instead.
+    disk_bytes = field()
+
+
+class _MemoryWalker(object):
+    def __init__(self):
+        # id -> (node, bytes, nodes) of every node seen so far. The node is
+        # kept so its id can't be reused during the walk.
+        self._known = {}
+        self.bytes_by_type = {}
+        self.unique_nodes = 0
+        self.unique_bytes = 0
+
+    def visit(self, data):
+        known = self._known.get(id(data))
+        if known is not None:
+            return known[1], known[2]
+        own_bytes = sys.getsizeof(data)
+        total_bytes = 0
+        total_nodes = 1
+        values = data.itervalues() if isinstance(data, PMap) else data
+        for value in values:
+            # Tuples are the deltas and paths of a delta.
+            if isinstance(value, (PMap, PVector, tuple)):
+                child_bytes, child_nodes = self.visit(value)
+                total_bytes += child_bytes
+                total_nodes += child_nodes
+            else:
+                own_bytes += sys.getsizeof(value)
+        total_bytes += own_bytes
+        self._known[id(data)] = (data, total_bytes, total_nodes)
+        type_name = type(data).__name__
+        self.bytes_by_type[type_name] = (
+            self.bytes_by_type.get(type_name, 0)+own_bytes)
+        self.unique_nodes += 1
+        self.unique_bytes += own_bytes
+        return total_bytes, total_nodes
+
+
+class HistoryView(Sequence):
+    """A read-only view of the first `length` history entries.
+
+    The view is only valid until the entries are popped, truncated or
+    evicted, after that any access raises RuntimeError instead of returning
+    a different entry.
+    """
+
+    def __init__(self, data_manager, history, length):
+        self._data_manager = data_manager
+        self._history = history
+        self._length = length
+        self._history_version = data_manager._history_version
+
+    def __len__(self):
+        self._check_version()
+        return self._length
+
+    def __getitem__(self, index):
+        self._check_version()
+        if isinstance(index, slice):
+            return [self._history[i]
+                    for i in range(*index.indices(self._length))]
+        if index < 0:
+            index += self._length
+        if not 0 <= index < self._length:
+            raise IndexError("history index out of range")
+        return self._history[index]
+
+    def _check_version(self):
+        if self._history_version != self._data_manager._history_version:
+            raise RuntimeError("The history changed since this view was "
+                               "created.")
+
+
+class HistoryProjection(object):
+    """Derived data maintained incrementally over the visible history.
+
+    The visible history is the entries from the oldest one up to the current
+    undo position, so it behaves like a stack: DataManager calls push when an
+    entry becomes visible (push_data, redo), pop when the newest one goes
+    away (undo, or the head being replaced) and evict when the oldest entries
+    are dropped. Entries discarded by a branch truncation were never visible
+    and need no call.
+    """
+
+    @property
+    def result(self):
+        raise NotImplementedError(
+            "This method should be implemented in sub-class.")
+
+    def reset(self, history):
+        for data in history:
+            self.push(data)
+
+    def push(self, data):
+        raise NotImplementedError(
+            "This method should be implemented in sub-class.")
+
+    def pop(self):
+        raise NotImplementedError(
+            "This method should be implemented in sub-class.")
+
+    def evict(self, count):
+        raise NotImplementedError(
+            "This method should be implemented in sub-class.")
+
+
 class DataManager(object):
-    def __init__(self, initial_data):
-        self._history = [initial_data]
-        self._history_index = 0
-        self._record_head_in_history = True
+    def __init__(self,
+                 initial_data,
+                 max_entries=None,
+                 max_bytes=None,
+                 max_age=None,
+                 merge_interval=None,
+                 storage=None):
+        self._max_entries = max_entries
+        self._max_bytes = max_bytes
+        self._max_age = max_age
+        self._merge_interval = merge_interval
+        if storage is None:
+            storage = ListHistoryStorage()
+        self._history = storage
+        if len(storage):
+            # The storage restored the history of a previous session.
+            self._history_index, self._record_head_in_history = (
+                storage.get_cursor())
+            self._history_bytes = sum(
+                storage.get_info(i).size for i in range(len(storage)))
+        else:
+            info = HistoryEntryInfo(timestamp=time.time(),
+                                    size=estimate_size(initial_data))
+            self._history.append(initial_data, info)
+            self._history_bytes = info.size
+            self._history_index = 0
+            self._record_head_in_history = True
+        self._last_push_time = None
+        # The node the last push edited, see should_merge.
+        self._last_edit_path = None
+        self._version = 0
+        # Incremented every time existing entries are removed, see
+        # HistoryView.
+        self._history_version = 0
+        self._change_listeners = []
+        self._projections = []
+        self._transaction_depth = 0
+        self._transaction_data = None
+        self._transaction_record = False
 
     @property
     def history(self):
-        return list(self._history[:self._history_index+1])
+        return HistoryView(self, self._history, self._history_index+1)
+
+    @property
+    def history_bytes(self):
+        return self._history_bytes
+
+    @property
+    def version(self):
+        """Incremented every time get_data starts returning a new root."""
+        return self._version
+
+    def add_change_listener(self, callback):
+        self._change_listeners.append(callback)
+
+    def remove_change_listener(self, callback):
+        self._change_listeners.remove(callback)
+
+    def add_projection(self, projection):
+        projection.reset(self.history)
+        self._projections.append(projection)
+        return projection
+
+    def remove_projection(self, projection):
+        self._projections.remove(projection)
 
     def get_data(self):
+        if self._transaction_data is not None:
+            return self._transaction_data
         return self._history[self._history_index]
 
+    def get_history_info(self, index):
+        return self._history.get_info(index)
+
+    def memory_report(self):
+        """Count the memory the history storage holds and what is shared.
+
+        Only what the storage reports with iter_resident is walked: the
+        snapshots, deltas and cached snapshots it keeps in memory. Nothing
+        is rebuilt or read back from disk. A PMap, PRecord, PVector or delta
+        node is counted once no matter how many of them use it, leaf values
+        are counted with the node holding them.
+        """
+        walker = _MemoryWalker()
+        entries = []
+        total_bytes = 0
+        total_nodes = 0
+        length = len(self._history)
+        for index, kind, data in self._history.iter_resident():
+            unique_nodes = walker.unique_nodes
+            unique_bytes = walker.unique_bytes
+            if isinstance(data, (PMap, PVector, tuple)):
+                entry_bytes, entry_nodes = walker.visit(data)
+            else:
+                entry_bytes, entry_nodes = sys.getsizeof(data), 0
+            if 0 <= index < length:
+                timestamp = self._history.get_info(index).timestamp
+            else:
+                # An evicted entry the first ones are still built on.
+                timestamp = None
+            entries.append(EntryMemoryInfo(
+                index=index,
+                kind=kind,
+                timestamp=timestamp,
+                nodes=entry_nodes,
+                bytes=entry_bytes,
+                new_nodes=walker.unique_nodes-unique_nodes,
+                new_bytes=walker.unique_bytes-unique_bytes))
+            total_bytes += entry_bytes
+            total_nodes += entry_nodes
+        return MemoryReport(entries=pvector(entries),
+                            unique_nodes=walker.unique_nodes,
+                            shared_nodes=total_nodes-walker.unique_nodes,
+                            unique_bytes=walker.unique_bytes,
+                            total_bytes=total_bytes,
+                            bytes_by_type=pmap(walker.bytes_by_type),
+                            history_entries=length,
+                            disk_bytes=self._history.get_disk_bytes())
+
+    def should_merge(self, edit_path, elapsed):
+        """Whether a push replaces the head entry instead of adding one.
+
+        Pushes closer than merge_interval are merged when they edit the same
+        node as the push before, or a node inside or around it, e.g. the
+        keystrokes typed into one field. Quick edits of unrelated nodes stay
+        separate undo steps. edit_path is the path of the node the push
+        edits, None if it edits the root.
+        """
+        if self._merge_interval is None or elapsed >= self._merge_interval:
+            return False
+        last_path = self._last_edit_path
+        return (edit_path is not None and last_path is not None
+                and (_is_prefix(edit_path, last_path)
+                     or _is_prefix(last_path, edit_path)))
+
+    @contextlib.contextmanager
+    def transaction(self):
+        """Batch every push_data inside the block into one history entry.
+
+        get_data returns the latest pushed data inside the block. Nothing is
+        pushed if an exception escapes the block, nested transactions only
+        roll back their own pushes.
+        """
+        saved = (self._transaction_data, self._transaction_record)
+        self._transaction_depth += 1
+        try:
+            yield
+        except BaseException:
+            self._transaction_data, self._transaction_record = saved
+            raise
+        finally:
+            self._transaction_depth -= 1
+        if not self._transaction_depth and self._transaction_data is not None:
+            new_data = self._transaction_data
+            record_in_history = self._transaction_record
+            self._transaction_data = None
+            self._transaction_record = False
+            self.push_data(new_data, record_in_history=record_in_history)
+
     def push_data(self, new_data, record_in_history=True):
+        if self._transaction_depth:
+            self._transaction_data = new_data
+            self._transaction_record = (self._transaction_record
+                                        or record_in_history)
+            return
+        with profiler.scope("push_data", self):
+            self._push_data(new_data, record_in_history)
+
+    def _push_data(self, new_data, record_in_history):
+        old_data = self._history[self._history_index]
+        now = time.time()
+        edit_path = None
+        if self._merge_interval is not None:
+            edit_path = _edit_path(old_data, new_data)
         if self._history_index != len(self._history)-1:
-            self._history = self._history[:self._history_index+1]
-        else:
-            if not self._record_head_in_history:
-                self._history.pop(-1)
-        if not self._history or self._history[-1] != new_data:
-            self._history.append(new_data)
+            self._truncate_history(self._history_index+1)
+        elif not self._record_head_in_history:
+            self._pop_history()
+        elif len(self._history) > 1 and (
+                self._last_push_time is not None) and self.should_merge(
+                    edit_path, now-self._last_push_time):
+            # Later pushes are merged while they stay around the node the
+            # merged ones have in common.
+            edit_path = min(edit_path, self._last_edit_path, key=len)
+            self._pop_history()
+        if not len(self._history) or not fast_equal(self._history[-1],
+                                                    new_data):
+            self._append_history(new_data, now)
         self._history_index = len(self._history)-1
         self._record_head_in_history = record_in_history
+        self._last_push_time = now
+        self._last_edit_path = edit_path
+        self._evict_history(now)
+        self._update_cursor()
+        if self._history[self._history_index] is not old_data:
+            self._notify_change()
 
     def redo(self):
+        self._check_no_transaction()
         if self._history_index < len(self._history)-1:
             self._history_index += 1
+            self._last_push_time = None
+            data = self._history[self._history_index]
+            for projection in self._projections:
+                projection.push(data)
+            self._update_cursor()
+            self._notify_change()
 
     def undo(self):
+        self._check_no_transaction()
         if self._history_index > 0:
             self._history_index -= 1
+            self._last_push_time = None
+            for projection in self._projections:
+                projection.pop()
+            self._update_cursor()
+            self._notify_change()
+
+    def close(self):
+        self._history.close()
+
+    def _check_no_transaction(self):
+        if self._transaction_depth:
+            raise RuntimeError("Can't undo or redo inside a transaction.")
+
+    def _notify_change(self):
+        self._version += 1
+        for callback in list(self._change_listeners):
+            callback()
+
+    def _update_cursor(self):
+        self._history.set_cursor(self._history_index,
+                                 self._record_head_in_history)
+
+    def _append_history(self, new_data, now):
+        old_data = self._history[-1] if len(self._history) else None
+        info = HistoryEntryInfo(timestamp=now,
+                                size=estimate_size(new_data, old_data))
+        self._history.append(new_data, info)
+        self._history_bytes += info.size
+        for projection in self._projections:
+            projection.push(new_data)
+
+    def _pop_history(self):
+        self._history_version += 1
+        self._history_bytes -= self._history.get_info(-1).size
+        self._history.pop()
+        for projection in self._projections:
+            projection.pop()
+
+    def _truncate_history(self, length):
+        self._history_version += 1
+        for index in range(length, len(self._history)):
+            self._history_bytes -= self._history.get_info(index).size
+        self._history.truncate(length)
+
+    def _should_evict(self, info, length, history_bytes, now):
+        return ((self._max_entries is not None
+                 and length > self._max_entries)
+                or (self._max_bytes is not None
+                    and history_bytes > self._max_bytes)
+                or (self._max_age is not None
+                    and now-info.timestamp > self._max_age))
+
+    def _evict_history(self, now):
+        # The oldest entry holds a full snapshot while every other entry
+        # only accounts for the nodes it does not share with the entry
+        # before. Dropping the oldest entry frees roughly what the next
+        # entry replaced, and the next entry becomes the full snapshot.
+        count = 0
+        length = len(self._history)
+        history_bytes = self._history_bytes
+        while count < self._history_index and self._should_evict(
+                self._history.get_info(count),
+                length-count,
+                history_bytes,
+                now):
+            history_bytes -= self._history.get_info(count+1).size
+            count += 1
+        if count:
+            self._history_version += 1
+            base_size = self._history.get_info(0).size
+            self._history.evict(count)
+            self._history.set_info(
+                0, self._history.get_info(0).set("size", base_size))
+            self._history_index -= count
+            self._history_bytes = history_bytes
+            for projection in self._projections:
+                projection.evict(count)
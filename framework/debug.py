@@ -1,16 +1,32 @@
 from framework.data import ViewData
+from framework.profiler import profiler
 
 from pyrsistent import pvector
 
 
 def generate_view_data(root_view, origin_data):
-    current_data = root_view.get_current_data()
+    """Return the ViewData tree of root_view, reusing origin_data.
+
+    Only the views marked dirty since the last call (their data or child
+    views changed, see ViewBase._mark_debug_dirty) and their ancestors are
+    visited, the ViewData of the other subtrees is reused as it is. The
+    flags are cleared, so keep a single ViewData tree per view tree.
+    """
+    with profiler.scope("generate_view_data", root_view):
+        return _generate_view_data(root_view, origin_data)
+
+
+def _generate_view_data(root_view, origin_data):
     if origin_data is None or id(root_view) != origin_data.id_:
         origin_data = ViewData(id_=id(root_view),
                                name=root_view.__class__.__name__,
-                               data=current_data,
+                               data=root_view.get_current_data(),
                                submit_callback=root_view._submit_data_callback,
                                child_views=pvector())
+    elif not root_view._debug_dirty:
+        return origin_data
+    root_view._debug_dirty = False
+    current_data = root_view.get_current_data()
     if current_data is not origin_data.data:
         origin_data = origin_data.set("data", current_data)
     origin_child_view_data = origin_data.child_views
@@ -18,10 +34,10 @@ def generate_view_data(root_view, origin_data):
     new_child_view_data = []
     for i, child_view in enumerate(root_view.iter_child_view()):
         if i < origin_child_view_count:
-            new_child_view_data.append(generate_view_data(
+            new_child_view_data.append(_generate_view_data(
                 child_view, origin_child_view_data[i]))
         else:
-            new_child_view_data.append(generate_view_data(child_view, None))
+            new_child_view_data.append(_generate_view_data(child_view, None))
     new_child_view_count = len(new_child_view_data)
     if origin_child_view_count != new_child_view_count or not all(
         [new_child_view_data[i] is origin_child_view_data[i] for i in range(
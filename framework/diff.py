@@ -1,9 +1,82 @@
-def list_diff(old_list, new_list, get_key):
+import bisect
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+
+DELETE = -1
+MOVE = 0
+INSERT = 1
+
+STRATEGIES = ("heuristic", "myers", "keyed")
+
+# Lists at least this long are compared with NumPy when it's installed and
+# the keys are all ints or all strs.
+NUMPY_THRESHOLD = 10000
+
+
+def list_diff(old_list, new_list, get_key, strategy="heuristic"):
     """Compare two list, return a operation list for updating the old_list to
     new_list.
 
-    This is a heuristic algorithm. Time complexity is O(n). Do not guarantee
-    optimal result. The delete operation is always before insert operation.
+    get_key returns the key of an item, None if the items are the keys.
+    Every operation is an (index, operation, item) tuple and they have to be
+    applied in order. DELETE removes old_list[index] and INSERT inserts item
+    at index. For MOVE index is a (from_index, to_index) tuple, the item is
+    popped from from_index and inserted back at to_index. Deletes always come
+    first (in descending index order), then moves, then inserts (in ascending
+    index order).
+
+    strategy is one of:
+
+    heuristic: see heuristic_diff. O(n), never moves.
+    myers: a minimal edit script made of deletes and inserts, see myers_diff.
+    keyed: a minimal number of moves for lists of unique keys, see
+        keyed_diff.
+
+    Long lists of int or str keys first go through numpy_diff when NumPy is
+    installed.
+    """
+    diff = _STRATEGY_FUNCTIONS.get(strategy)
+    if diff is None:
+        raise ValueError("Unknown diff strategy: {0}".format(strategy))
+    if numpy is not None and (
+            max(len(old_list), len(new_list)) >= NUMPY_THRESHOLD):
+        moves = numpy_diff(old_list, new_list, get_key, diff)
+        if moves is not None:
+            return moves
+    return diff(old_list, new_list, get_key)
+
+
+def diff_stats(moves):
+    """Count the operations of a list_diff result."""
+    stats = {"delete": 0, "insert": 0, "move": 0}
+    for _, operation, _ in moves:
+        if operation == DELETE:
+            stats["delete"] += 1
+        elif operation == INSERT:
+            stats["insert"] += 1
+        else:
+            stats["move"] += 1
+    stats["total"] = len(moves)
+    return stats
+
+
+def compare_strategies(old_list, new_list, get_key, strategies=STRATEGIES):
+    """Return {strategy: diff_stats} of every strategy for the same change."""
+    return dict((strategy, diff_stats(list_diff(old_list,
+                                                 new_list,
+                                                 get_key,
+                                                 strategy)))
+                for strategy in strategies)
+
+
+def heuristic_diff(old_list, new_list, get_key):
+    """This is a heuristic algorithm. Time complexity is O(n). Do not
+    guarantee optimal result. The delete operation is always before insert
+    operation.
 
     This algorithm is inspired by javascript list-diff. list-diff:
     https://github.com/livoras/list-diff/blob/master/lib/diff.js
@@ -11,8 +84,8 @@ def list_diff(old_list, new_list, get_key):
     moves = []
     old_length = len(old_list)
     new_length = len(new_list)
-    old_key_list = [get_key(d) for d in old_list]
-    new_key_list = [get_key(d) for d in new_list]
+    old_key_list = _key_list(old_list, get_key)
+    new_key_list = _key_list(new_list, get_key)
     new_i = old_i = 0
     # Remove the nodes no longer exists.
     sim_key_list = []
@@ -80,3 +153,341 @@ def list_diff(old_list, new_list, get_key):
         moves.append((new_i, 1, new_list[new_i]))
         new_i += 1
     return moves
+
+
+def myers_diff(old_list, new_list, get_key):
+    """Return a minimal edit script of deletes and inserts.
+
+    The common prefix and suffix are skipped first. If the keys of what's left
+    are unique the longest common subsequence is found as the longest
+    increasing subsequence of the old positions in O(n log n), otherwise
+    Myers' O((n+m)d) algorithm is used.
+    """
+    old_key_list = _key_list(old_list, get_key)
+    new_key_list = _key_list(new_list, get_key)
+    old_length = len(old_key_list)
+    new_length = len(new_key_list)
+    start = 0
+    while start < old_length and start < new_length and (
+            old_key_list[start] == new_key_list[start]):
+        start += 1
+    old_end = old_length
+    new_end = new_length
+    while old_end > start and new_end > start and (
+            old_key_list[old_end-1] == new_key_list[new_end-1]):
+        old_end -= 1
+        new_end -= 1
+    matches = _match_unique(old_key_list, new_key_list,
+                            start, old_end, start, new_end)
+    if matches is None:
+        matches = _match_myers(old_key_list, new_key_list,
+                               start, old_end, start, new_end)
+    return _edit_script(old_list, new_list, matches,
+                        start, old_end, start, new_end)
+
+
+def keyed_diff(old_list, new_list, get_key):
+    """Turn old_list into new_list with deletes, moves and inserts.
+
+    Items kept in both lists are never deleted and inserted again. The items
+    forming the longest increasing subsequence of old positions stay where
+    they are and every other kept item is moved once, which is the minimal
+    number of moves. Keys must be unique in each list, otherwise this falls
+    back to myers_diff.
+    """
+    old_key_list = _key_list(old_list, get_key)
+    new_key_list = _key_list(new_list, get_key)
+    new_index = {}
+    for j, key in enumerate(new_key_list):
+        if key in new_index:
+            return myers_diff(old_list, new_list, get_key)
+        new_index[key] = j
+    old_keys = set(old_key_list)
+    if len(old_keys) != len(old_key_list):
+        return myers_diff(old_list, new_list, get_key)
+
+    moves = []
+    for i in range(len(old_key_list)-1, -1, -1):
+        if old_key_list[i] not in new_index:
+            moves.append((i, DELETE, old_list[i]))
+
+    # Position of each kept key in the old list once deleted items are gone.
+    kept_index = {}
+    for key in old_key_list:
+        if key in new_index:
+            kept_index[key] = len(kept_index)
+    # The kept keys in their new order.
+    targets = [j for j, key in enumerate(new_key_list) if key in kept_index]
+    stable = set(_longest_increasing(
+        [kept_index[new_key_list[j]] for j in targets]))
+
+    # The kept items are laid out on a line of slots: for every stable
+    # anchor, the slots of the items moved right before it and then the slot
+    # of its own position in the kept list. A Fenwick tree counting the
+    # occupied slots turns a slot into a list index.
+    to_move = []
+    anchor = len(kept_index)
+    for t in range(len(targets)-1, -1, -1):
+        if t in stable:
+            anchor = kept_index[new_key_list[targets[t]]]
+        else:
+            to_move.append((t, anchor))
+    if to_move:
+        to_move.reverse()
+        kept_count = len(kept_index)
+        group_size = [0]*(kept_count+1)
+        for _, anchor in to_move:
+            group_size[anchor] += 1
+        group_start = [0]*(kept_count+1)
+        kept_slot = [0]*kept_count
+        slot = 0
+        for anchor in range(kept_count+1):
+            group_start[anchor] = slot
+            slot += group_size[anchor]
+            if anchor < kept_count:
+                kept_slot[anchor] = slot
+                slot += 1
+        tree = _FenwickTree(slot, kept_slot)
+        for t, anchor in to_move:
+            j = targets[t]
+            old_slot = kept_slot[kept_index[new_key_list[j]]]
+            from_index = tree.prefix_sum(old_slot)
+            tree.add(old_slot, -1)
+            new_slot = group_start[anchor]
+            group_start[anchor] += 1
+            to_index = tree.prefix_sum(new_slot)
+            tree.add(new_slot, 1)
+            moves.append(((from_index, to_index), MOVE, new_list[j]))
+
+    for j, key in enumerate(new_key_list):
+        if key not in old_keys:
+            moves.append((j, INSERT, new_list[j]))
+    return moves
+
+
+def numpy_diff(old_list, new_list, get_key, diff=None):
+    """Compare two lists of unique int or str keys with array operations.
+
+    The common prefix and suffix are found with NumPy, then the removed and
+    inserted keys between them with sets. When the kept keys are in the same
+    order that's the whole (minimal) edit script, otherwise diff (keyed_diff
+    by default) is only run on the part between the common prefix and
+    suffix. Return None when the keys are not all ints or all strs or are not
+    unique, the caller has to use another diff then.
+    """
+    old_key_list = _key_list(old_list, get_key)
+    new_key_list = _key_list(new_list, get_key)
+    old_keys = _key_array(old_key_list)
+    new_keys = _key_array(new_key_list)
+    if old_keys is None or new_keys is None:
+        return None
+    if len(old_keys) and len(new_keys) and (
+            old_keys.dtype.kind != new_keys.dtype.kind):
+        return None
+    old_length = len(old_keys)
+    new_length = len(new_keys)
+    length = min(old_length, new_length)
+    mismatch = numpy.flatnonzero(old_keys[:length] != new_keys[:length])
+    start = int(mismatch[0]) if len(mismatch) else length
+    length -= start
+    mismatch = numpy.flatnonzero(old_keys[old_length-length:][::-1]
+                                 != new_keys[new_length-length:][::-1])
+    suffix = int(mismatch[0]) if len(mismatch) else length
+    old_middle = old_keys[start:old_length-suffix]
+    new_middle = new_keys[start:new_length-suffix]
+    old_end = old_length-suffix
+    new_end = new_length-suffix
+    # Usually only a few keys are left between the common prefix and suffix.
+    old_set = set(old_key_list[start:old_end])
+    new_set = set(new_key_list[start:new_end])
+    if len(old_set) != len(old_middle) or len(new_set) != len(new_middle):
+        return None
+    old_kept = numpy.fromiter(map(new_set.__contains__,
+                                  old_key_list[start:old_end]),
+                              dtype=bool, count=len(old_middle))
+    new_kept = numpy.fromiter(map(old_set.__contains__,
+                                  new_key_list[start:new_end]),
+                              dtype=bool, count=len(new_middle))
+    if not numpy.array_equal(old_middle[old_kept], new_middle[new_kept]):
+        if diff is None:
+            diff = keyed_diff
+        moves = []
+        for index, operation, item in diff(old_list[start:old_end],
+                                           new_list[start:new_end],
+                                           get_key):
+            if operation == MOVE:
+                index = (index[0]+start, index[1]+start)
+            else:
+                index += start
+            moves.append((index, operation, item))
+        return moves
+    moves = []
+    for i in numpy.flatnonzero(~old_kept)[::-1].tolist():
+        moves.append((start+i, DELETE, old_list[start+i]))
+    for j in numpy.flatnonzero(~new_kept).tolist():
+        moves.append((start+j, INSERT, new_list[start+j]))
+    return moves
+
+
+def _key_list(items, get_key):
+    if get_key is None:
+        return items
+    return list(map(get_key, items))
+
+
+def _key_array(key_list):
+    if not key_list:
+        return numpy.array([], dtype=numpy.int64)
+    types = set(map(type, key_list))
+    if types == {int}:
+        try:
+            return numpy.array(key_list, dtype=numpy.int64)
+        except OverflowError:
+            return None
+    elif types == {str}:
+        # Comparing str objects is faster than converting them to a unicode
+        # array.
+        array = numpy.empty(len(key_list), dtype=object)
+        array[:] = key_list
+        return array
+    return None
+
+
+def _match_unique(old_key_list, new_key_list,
+                  old_start, old_end, new_start, new_end):
+    # Return the matched (old index, new index) pairs of a longest common
+    # subsequence, or None if a key is duplicated.
+    new_index = {}
+    for j in range(new_start, new_end):
+        key = new_key_list[j]
+        if key in new_index:
+            return None
+        new_index[key] = j
+    seen = set()
+    pairs = []
+    for i in range(old_start, old_end):
+        key = old_key_list[i]
+        if key in seen:
+            return None
+        seen.add(key)
+        j = new_index.get(key)
+        if j is not None:
+            pairs.append((i, j))
+    return [pairs[p] for p in _longest_increasing([j for _, j in pairs])]
+
+
+def _longest_increasing(values):
+    # Return the positions of a longest strictly increasing subsequence.
+    tails = []
+    tail_positions = []
+    previous = [None]*len(values)
+    for position, value in enumerate(values):
+        k = bisect.bisect_left(tails, value)
+        if k == len(tails):
+            tails.append(value)
+            tail_positions.append(position)
+        else:
+            tails[k] = value
+            tail_positions[k] = position
+        previous[position] = tail_positions[k-1] if k else None
+    result = []
+    position = tail_positions[-1] if tail_positions else None
+    while position is not None:
+        result.append(position)
+        position = previous[position]
+    result.reverse()
+    return result
+
+
+def _match_myers(old_key_list, new_key_list,
+                 old_start, old_end, new_start, new_end):
+    n = old_end-old_start
+    m = new_end-new_start
+    offset = n+m
+    v = [0]*(2*offset+2)
+    trace = []
+    for d in range(offset+1):
+        trace.append(v[:])
+        for k in range(-d, d+1, 2):
+            if k == -d or (k != d and v[offset+k-1] < v[offset+k+1]):
+                x = v[offset+k+1]
+            else:
+                x = v[offset+k-1]+1
+            y = x-k
+            while x < n and y < m and (
+                    old_key_list[old_start+x] == new_key_list[new_start+y]):
+                x += 1
+                y += 1
+            v[offset+k] = x
+            if x >= n and y >= m:
+                return _myers_backtrack(trace, x, y, d, offset,
+                                        old_start, new_start)
+    return []
+
+
+def _myers_backtrack(trace, x, y, d, offset, old_start, new_start):
+    pairs = []
+    for d in range(d, -1, -1):
+        v = trace[d]
+        k = x-y
+        if k == -d or (k != d and v[offset+k-1] < v[offset+k+1]):
+            previous_k = k+1
+        else:
+            previous_k = k-1
+        previous_x = v[offset+previous_k] if d else 0
+        previous_y = previous_x-previous_k if d else 0
+        while x > previous_x and y > previous_y:
+            x -= 1
+            y -= 1
+            pairs.append((old_start+x, new_start+y))
+        x, y = previous_x, previous_y
+    pairs.reverse()
+    return pairs
+
+
+def _edit_script(old_list, new_list, matches,
+                 old_start, old_end, new_start, new_end):
+    matched_old = set(i for i, _ in matches)
+    matched_new = set(j for _, j in matches)
+    moves = []
+    for i in range(old_end-1, old_start-1, -1):
+        if i not in matched_old:
+            moves.append((i, DELETE, old_list[i]))
+    for j in range(new_start, new_end):
+        if j not in matched_new:
+            moves.append((j, INSERT, new_list[j]))
+    return moves
+
+
+class _FenwickTree(object):
+    def __init__(self, size, ones=()):
+        # Built in O(size) with a 1 at every index of ones.
+        tree = [0]*(size+1)
+        for index in ones:
+            tree[index+1] = 1
+        for index in range(1, size+1):
+            parent = index+(index & -index)
+            if parent <= size:
+                tree[parent] += tree[index]
+        self._tree = tree
+
+    def add(self, index, value):
+        index += 1
+        while index < len(self._tree):
+            self._tree[index] += value
+            index += index & -index
+
+    def prefix_sum(self, index):
+        # Sum of the values before index.
+        result = 0
+        while index > 0:
+            result += self._tree[index]
+            index -= index & -index
+        return result
+
+
+_STRATEGY_FUNCTIONS = {
+    "heuristic": heuristic_diff,
+    "myers": myers_diff,
+    "keyed": keyed_diff,
+}
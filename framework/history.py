@@ -0,0 +1,632 @@
+import collections
+import itertools
+import mmap
+import os
+import pickle
+import struct
+
+from framework.path import diff_paths
+from framework.path import set_in
+
+
+_MISSING = object()
+
+
+class HistoryStorage(object):
+    def __init__(self):
+        self._cursor = (0, True)
+
+    def get_cursor(self):
+        return self._cursor
+
+    def set_cursor(self, index, record_head_in_history):
+        self._cursor = (index, record_head_in_history)
+
+    def iter_resident(self):
+        """Yield (index, kind, data) for everything kept in memory.
+
+        index is the entry the data belongs to, kind tells what data is, a
+        snapshot or a delta of it. Nothing is rebuilt or read back from disk
+        and no cache is touched.
+        """
+        raise NotImplementedError(
+            "This method should be implemented in sub-class.")
+
+    def get_disk_bytes(self):
+        return 0
+
+    def close(self):
+        pass
+
+
+class ListHistoryStorage(HistoryStorage):
+    """Keeps every history entry as a live snapshot."""
+
+    def __init__(self):
+        super(ListHistoryStorage, self).__init__()
+        self._entries = []
+        self._infos = []
+
+    def __len__(self):
+        return len(self._entries)
+
+    def __getitem__(self, index):
+        return self._entries[index]
+
+    def get_info(self, index):
+        return self._infos[index]
+
+    def set_info(self, index, info):
+        self._infos[index] = info
+
+    def append(self, data, info):
+        self._entries.append(data)
+        self._infos.append(info)
+
+    def pop(self):
+        self._entries.pop(-1)
+        self._infos.pop(-1)
+
+    def truncate(self, length):
+        del self._entries[length:]
+        del self._infos[length:]
+
+    def evict(self, count):
+        del self._entries[:count]
+        del self._infos[:count]
+
+    def iter_resident(self):
+        for index, data in enumerate(self._entries):
+            yield index, "snapshot", data
+
+
+class KeyframeHistoryStorage(HistoryStorage):
+    """Keeps a full snapshot every `keyframe_interval` entries and path based
+    deltas (see framework.path.diff_paths) in between.
+
+    The snapshots within `pin_window` entries of the cursor and the newest
+    one are kept as the objects that were appended, so the views and the
+    next delta keep sharing nodes with them. Other snapshots are rebuilt on
+    demand by replaying the deltas on top of the nearest keyframe or kept
+    snapshot, and the most recently rebuilt ones are kept in a small LRU
+    cache.
+    """
+
+    def __init__(self,
+                 keyframe_interval=32,
+                 cache_size=8,
+                 max_delta=64,
+                 pin_window=8):
+        super(KeyframeHistoryStorage, self).__init__()
+        self._keyframe_interval = keyframe_interval
+        self._cache_size = cache_size
+        self._max_delta = max_delta
+        self._pin_window = pin_window
+        # Each entry is a (is_keyframe, snapshot_or_delta) tuple.
+        self._entries = []
+        self._infos = []
+        # Entries are addressed by absolute position in the pinned snapshots
+        # and the cache so evicting from the front doesn't invalidate them.
+        self._offset = 0
+        self._pinned = {}
+        self._cache = collections.OrderedDict()
+        self._last = None
+        self._since_keyframe = 0
+
+    def __len__(self):
+        return len(self._entries)
+
+    def __getitem__(self, index):
+        length = len(self._entries)
+        if index < 0:
+            index += length
+        if not 0 <= index < length:
+            raise IndexError("history index out of range")
+        if index == length-1:
+            return self._last
+        data = self._pinned.get(self._offset+index)
+        if data is None:
+            data = self._rebuild(index)
+            if self._is_pinned(index):
+                self._pinned[self._offset+index] = data
+        return data
+
+    def get_info(self, index):
+        return self._infos[index]
+
+    def set_info(self, index, info):
+        self._infos[index] = info
+
+    def set_cursor(self, index, record_head_in_history):
+        super(KeyframeHistoryStorage, self).set_cursor(index,
+                                                       record_head_in_history)
+        self._unpin()
+
+    def append(self, data, info):
+        delta = None
+        if self._entries and self._since_keyframe < self._keyframe_interval:
+            delta = diff_paths(self._last, data)
+            if len(delta) > self._max_delta:
+                delta = None
+        if delta is None:
+            self._entries.append((True, data))
+            self._since_keyframe = 0
+        else:
+            self._entries.append((False, tuple(delta)))
+            self._since_keyframe += 1
+        self._infos.append(info)
+        self._last = data
+        self._pinned[self._offset+len(self._entries)-1] = data
+
+    def pop(self):
+        self.truncate(len(self._entries)-1)
+
+    def truncate(self, length):
+        if length >= len(self._entries):
+            return
+        last = self[length-1] if length > 0 else None
+        del self._entries[length:]
+        del self._infos[length:]
+        end = self._offset+length
+        for position in [p for p in self._cache if p >= end]:
+            del self._cache[position]
+        for position in [p for p in self._pinned if p >= end]:
+            del self._pinned[position]
+        self._last = last
+        if length > 0:
+            self._pinned[end-1] = last
+        self._since_keyframe = 0
+        for is_keyframe, _ in reversed(self._entries):
+            if is_keyframe:
+                break
+            self._since_keyframe += 1
+
+    def evict(self, count):
+        if count <= 0:
+            return
+        if count >= len(self._entries):
+            self.truncate(0)
+            return
+        front = self[count]
+        del self._entries[:count]
+        del self._infos[:count]
+        self._entries[0] = (True, front)
+        self._offset += count
+        for position in [p for p in self._cache if p < self._offset]:
+            del self._cache[position]
+        for position in [p for p in self._pinned if p < self._offset]:
+            del self._pinned[position]
+
+    def iter_resident(self):
+        for index, (is_keyframe, payload) in enumerate(self._entries):
+            yield index, "keyframe" if is_keyframe else "delta", payload
+        for position, data in list(self._pinned.items()):
+            yield position-self._offset, "pinned", data
+        for position, data in list(self._cache.items()):
+            yield position-self._offset, "cache", data
+
+    def _is_pinned(self, index):
+        return (index == len(self._entries)-1
+                or abs(index-self._cursor[0]) <= self._pin_window)
+
+    def _unpin(self):
+        for position in [p for p in self._pinned
+                         if not self._is_pinned(p-self._offset)]:
+            del self._pinned[position]
+
+    def _rebuild(self, index):
+        start = index
+        data = None
+        while True:
+            position = self._offset+start
+            kept = self._pinned.get(position)
+            if kept is not None:
+                data = kept
+                break
+            cached = self._cache.get(position)
+            if cached is not None:
+                self._cache.move_to_end(position)
+                data = cached
+                break
+            is_keyframe, payload = self._entries[start]
+            if is_keyframe:
+                data = payload
+                break
+            start -= 1
+        for i in range(start+1, index+1):
+            data = set_in(data, self._entries[i][1])
+        if index != start:
+            self._cache_put(self._offset+index, data)
+        return data
+
+    def _cache_put(self, position, data):
+        self._cache[position] = data
+        while len(self._cache) > self._cache_size:
+            self._cache.popitem(last=False)
+
+
+class SegmentHistoryStorage(HistoryStorage):
+    """Keeps the history in an append-only segment file.
+
+    Like KeyframeHistoryStorage the file holds a full snapshot every
+    `keyframe_interval` entries and path based deltas in between, so an edit
+    only writes the nodes it changed. The entries within `hot_window` of the
+    cursor and the newest one stay in memory as live objects, every other
+    entry is rebuilt on demand from the records read back through mmap, on
+    top of the nearest live or cached snapshot so rebuilt entries share
+    their unchanged nodes.
+
+    Every change to the history is appended to the file as a small record,
+    so opening an existing file restores the whole undo stack (including the
+    cursor) without replaying any edit. When the file grows to more than
+    twice the size of the records still in use it is rewritten with only
+    those.
+    """
+
+    MAGIC = b"IMHIST1\n"
+    # (payload length, record kind, length of the info part of the payload)
+    HEADER = struct.Struct("<IBI")
+
+    APPEND = 1
+    POP = 2
+    TRUNCATE = 3
+    EVICT = 4
+    INFO = 5
+    CURSOR = 6
+    DELTA = 7
+
+    # Files smaller than this are never compacted.
+    MIN_COMPACT_SIZE = 1 << 20
+
+    def __init__(self,
+                 path,
+                 hot_window=16,
+                 keyframe_interval=32,
+                 cache_size=8,
+                 max_delta=64):
+        super(SegmentHistoryStorage, self).__init__()
+        self._path = path
+        self._hot_window = hot_window
+        self._keyframe_interval = keyframe_interval
+        self._cache_size = cache_size
+        self._max_delta = max_delta
+        # (file offset, size, is_keyframe) of the record of each entry.
+        self._records = []
+        # The records of evicted entries the first entries are still built
+        # on, starting with a keyframe.
+        self._prefix = []
+        self._infos = []
+        # Live entries and rebuilt snapshots keyed by absolute position, see
+        # _offset.
+        self._live = {}
+        self._cache = collections.OrderedDict()
+        self._offset = 0
+        self._last = None
+        self._since_keyframe = 0
+        # Bytes of the records in _prefix and _records.
+        self._live_bytes = 0
+        self._file_size = 0
+        self._file = None
+        self._map = None
+        self._open()
+
+    def __len__(self):
+        return len(self._records)
+
+    def __getitem__(self, index):
+        length = len(self._records)
+        if index < 0:
+            index += length
+        if not 0 <= index < length:
+            raise IndexError("history index out of range")
+        if index == length-1:
+            return self._last
+        position = self._offset+index
+        data = self._live.get(position, _MISSING)
+        if data is _MISSING:
+            data = self._rebuild(position)
+            if self._is_hot(index):
+                self._live[position] = data
+        return data
+
+    def get_info(self, index):
+        return self._infos[index]
+
+    def set_info(self, index, info):
+        if index < 0:
+            index += len(self._infos)
+        self._infos[index] = info
+        self._write(self.INFO, pickle.dumps((index, info)))
+        self._compact_if_needed()
+
+    def set_cursor(self, index, record_head_in_history):
+        if (index, record_head_in_history) != self._cursor:
+            super(SegmentHistoryStorage, self).set_cursor(
+                index, record_head_in_history)
+            self._write(self.CURSOR, pickle.dumps(self._cursor))
+            self._drop_cold()
+            self._compact_if_needed()
+
+    def append(self, data, info):
+        delta = None
+        if self._records and self._since_keyframe < self._keyframe_interval:
+            delta = diff_paths(self._last, data)
+            if len(delta) > self._max_delta:
+                delta = None
+        info_payload = pickle.dumps(info, pickle.HIGHEST_PROTOCOL)
+        if delta is None:
+            kind = self.APPEND
+            data_payload = pickle.dumps(data, pickle.HIGHEST_PROTOCOL)
+        else:
+            kind = self.DELTA
+            data_payload = pickle.dumps(tuple(delta),
+                                        pickle.HIGHEST_PROTOCOL)
+        payload = info_payload+data_payload
+        offset = self._write(kind, payload, len(info_payload))
+        self._add_record(offset, self.HEADER.size+len(payload), delta is None)
+        self._infos.append(info)
+        self._last = data
+        self._live[self._offset+len(self._records)-1] = data
+
+    def pop(self):
+        last = self[-2] if len(self._records) > 1 else None
+        self._write(self.POP, b"")
+        self._truncate(len(self._records)-1)
+        self._set_last(last)
+        self._compact_if_needed()
+
+    def truncate(self, length):
+        if length < len(self._records):
+            last = self[length-1] if length > 0 else None
+            self._write(self.TRUNCATE, pickle.dumps(length))
+            self._truncate(length)
+            self._set_last(last)
+            self._compact_if_needed()
+
+    def evict(self, count):
+        if count > 0:
+            self._write(self.EVICT, pickle.dumps(count))
+            self._evict(count)
+            self._compact_if_needed()
+
+    def compact(self):
+        """Rewrite the file keeping only the records still in use."""
+        temp_path = self._path+".compact"
+        records = []
+        with open(temp_path, "wb") as f:
+            f.write(self.MAGIC)
+            for offset, size, is_keyframe in self._prefix:
+                records.append((f.tell(), size, is_keyframe))
+                f.write(self._read_record(offset))
+            for (offset, _, is_keyframe), info in zip(self._records,
+                                                     self._infos):
+                # The info may have been changed by an INFO record since.
+                info_payload = pickle.dumps(info, pickle.HIGHEST_PROTOCOL)
+                payload = info_payload+self._read_data(offset)
+                records.append((f.tell(),
+                                self.HEADER.size+len(payload),
+                                is_keyframe))
+                self._write_record(f,
+                                   self.APPEND if is_keyframe else self.DELTA,
+                                   payload,
+                                   len(info_payload))
+            if self._prefix:
+                # Turns the records written first back into the prefix.
+                self._write_record(f,
+                                   self.EVICT,
+                                   pickle.dumps(len(self._prefix)))
+            self._write_record(f, self.CURSOR, pickle.dumps(self._cursor))
+            file_size = f.tell()
+        self.close()
+        os.replace(temp_path, self._path)
+        prefix_length = len(self._prefix)
+        self._prefix = records[:prefix_length]
+        self._records = records[prefix_length:]
+        self._live_bytes = sum(size for _, size, _ in records)
+        self._file_size = file_size
+        self._file = open(self._path, "a+b")
+
+    def close(self):
+        if self._map is not None:
+            self._map.close()
+            self._map = None
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+
+    def iter_resident(self):
+        for position, data in list(self._live.items()):
+            yield position-self._offset, "live", data
+        for position, data in list(self._cache.items()):
+            yield position-self._offset, "cache", data
+
+    def get_disk_bytes(self):
+        return self._file_size
+
+    def _open(self):
+        self._file = open(self._path, "a+b")
+        self._file.seek(0, os.SEEK_END)
+        if self._file.tell() == 0:
+            self._file.write(self.MAGIC)
+            self._file.flush()
+            self._file_size = len(self.MAGIC)
+        else:
+            self._file_size = self._file.tell()
+            self._load()
+            self._compact_if_needed()
+
+    def _load(self):
+        self._remap()
+        if self._map[:len(self.MAGIC)] != self.MAGIC:
+            raise ValueError(
+                "{0} is not a history segment file".format(self._path))
+        position = len(self.MAGIC)
+        end = len(self._map)
+        while position+self.HEADER.size <= end:
+            length, kind, info_length = self.HEADER.unpack_from(self._map,
+                                                                position)
+            start = position+self.HEADER.size
+            if start+length > end:
+                # A partially written record from a crashed session.
+                break
+            payload = self._map[start:start+length]
+            if kind == self.APPEND or kind == self.DELTA:
+                self._add_record(position,
+                                 self.HEADER.size+length,
+                                 kind == self.APPEND)
+                self._infos.append(pickle.loads(payload[:info_length]))
+            elif kind == self.POP:
+                self._truncate(len(self._records)-1)
+            elif kind == self.TRUNCATE:
+                self._truncate(pickle.loads(payload))
+            elif kind == self.EVICT:
+                self._evict(pickle.loads(payload))
+            elif kind == self.INFO:
+                index, info = pickle.loads(payload)
+                self._infos[index] = info
+            elif kind == self.CURSOR:
+                self._cursor = pickle.loads(payload)
+            position = start+length
+        if position != end:
+            self._map.close()
+            self._map = None
+            self._file.truncate(position)
+            self._file_size = position
+        if self._records:
+            self._set_last(self._rebuild(self._offset+len(self._records)-1))
+
+    def _write(self, kind, payload, info_length=0):
+        self._file.seek(0, os.SEEK_END)
+        offset = self._file.tell()
+        self._write_record(self._file, kind, payload, info_length)
+        self._file.flush()
+        self._file_size = self._file.tell()
+        return offset
+
+    def _write_record(self, f, kind, payload, info_length=0):
+        f.write(self.HEADER.pack(len(payload), kind, info_length))
+        f.write(payload)
+
+    def _compact_if_needed(self):
+        if self._file_size > max(self.MIN_COMPACT_SIZE,
+                                 (len(self.MAGIC)+self._live_bytes)*2):
+            self.compact()
+
+    def _remap(self):
+        if self._map is not None:
+            self._map.close()
+        self._map = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+
+    def _read_record(self, offset):
+        if self._map is None or offset+self.HEADER.size > len(self._map):
+            self._remap()
+        length, _, _ = self.HEADER.unpack_from(self._map, offset)
+        end = offset+self.HEADER.size+length
+        if end > len(self._map):
+            self._remap()
+        return self._map[offset:end]
+
+    def _read_data(self, offset):
+        record = self._read_record(offset)
+        _, _, info_length = self.HEADER.unpack_from(record)
+        return record[self.HEADER.size+info_length:]
+
+    def _get_record(self, position):
+        index = position-self._offset
+        if index >= 0:
+            return self._records[index]
+        return self._prefix[index]
+
+    def _rebuild(self, position):
+        start = position
+        while True:
+            data = self._live.get(start, _MISSING)
+            if data is not _MISSING:
+                break
+            data = self._cache.get(start, _MISSING)
+            if data is not _MISSING:
+                self._cache.move_to_end(start)
+                break
+            offset, _, is_keyframe = self._get_record(start)
+            if is_keyframe:
+                # Kept so the entries rebuilt on it share its nodes.
+                data = pickle.loads(self._read_data(offset))
+                self._cache_put(start, data)
+                break
+            start -= 1
+        for each_position in range(start+1, position+1):
+            offset = self._get_record(each_position)[0]
+            data = set_in(data, pickle.loads(self._read_data(offset)))
+        if position != start:
+            self._cache_put(position, data)
+        return data
+
+    def _cache_put(self, position, data):
+        self._cache[position] = data
+        while len(self._cache) > self._cache_size:
+            self._cache.popitem(last=False)
+
+    def _is_hot(self, index):
+        return (index == len(self._records)-1
+                or abs(index-self._cursor[0]) <= self._hot_window)
+
+    def _drop_cold(self):
+        cold = [position for position in self._live
+                if not self._is_hot(position-self._offset)]
+        for position in cold:
+            del self._live[position]
+
+    def _set_last(self, last):
+        self._last = last
+        if self._records:
+            self._live[self._offset+len(self._records)-1] = last
+
+    def _add_record(self, offset, size, is_keyframe):
+        self._records.append((offset, size, is_keyframe))
+        self._live_bytes += size
+        if is_keyframe:
+            self._since_keyframe = 0
+        else:
+            self._since_keyframe += 1
+
+    def _truncate(self, length):
+        for _, size, _ in self._records[length:]:
+            self._live_bytes -= size
+        del self._records[length:]
+        del self._infos[length:]
+        if not self._records:
+            for _, size, _ in self._prefix:
+                self._live_bytes -= size
+            self._prefix = []
+        end = self._offset+length
+        for position in [p for p in self._live if p >= end]:
+            del self._live[position]
+        for position in [p for p in self._cache if p >= end]:
+            del self._cache[position]
+        self._since_keyframe = 0
+        for _, _, is_keyframe in itertools.chain(reversed(self._records),
+                                                 reversed(self._prefix)):
+            if is_keyframe:
+                break
+            self._since_keyframe += 1
+
+    def _evict(self, count):
+        prefix = self._prefix+self._records[:count]
+        del self._records[:count]
+        del self._infos[:count]
+        self._offset += count
+        # Only the records from the last keyframe up to the first entry are
+        # needed to rebuild it.
+        keep = len(prefix)
+        if self._records and not self._records[0][2]:
+            keep = len(prefix)-1
+            while not prefix[keep][2]:
+                keep -= 1
+        for _, size, _ in prefix[:keep]:
+            self._live_bytes -= size
+        self._prefix = prefix[keep:]
+        first = self._offset-len(self._prefix)
+        for position in [p for p in self._live if p < self._offset]:
+            del self._live[position]
+        for position in [p for p in self._cache if p < first]:
+            del self._cache[position]
@@ -0,0 +1,162 @@
+import itertools
+import operator
+
+from pyrsistent import PMap
+from pyrsistent import PVector
+
+
+class _Removed(object):
+    def __repr__(self):
+        return "REMOVED"
+
+    def __reduce__(self):
+        # Unpickled deltas refer to the same REMOVED.
+        return "REMOVED"
+
+
+class _Append(object):
+    def __repr__(self):
+        return "APPEND"
+
+    def __reduce__(self):
+        return "APPEND"
+
+
+# Used as the value of a path update to remove the key at the end of the path.
+REMOVED = _Removed()
+# Used as a path key to append to the PVector the key applies to.
+APPEND = _Append()
+
+
+def _resolve(data, key):
+    # A callable key is called with the node it applies to and returns the
+    # actual key, so it is resolved against the data the path is applied to
+    # and not the data it was created from.
+    if callable(key):
+        key = key(data)
+    return key
+
+
+def get_in(data, path):
+    for key in path:
+        data = data[_resolve(data, key)]
+    return data
+
+
+def set_in(data, updates):
+    """Apply a sequence of (path, value) updates to data.
+
+    Every touched node is rebuilt with a single evolver pass, no matter how
+    many updates go through it. Updates are applied in order, a later update
+    wins over an earlier one on the same path. A key of a path can be APPEND
+    or a callable, see _resolve.
+    """
+    children = {}
+    appended = 0
+    for path, value in updates:
+        if not path:
+            # Replaces data and every update before it.
+            children = {}
+            appended = 0
+            data = value
+        elif path[0] is APPEND:
+            # After the items appended by the updates before.
+            children[len(data)+appended] = [(path[1:], value)]
+            appended += 1
+        else:
+            children.setdefault(_resolve(data, path[0]), []).append(
+                (path[1:], value))
+    return _apply_children(data, children)
+
+
+def _apply_children(data, children):
+    if not children:
+        return data
+    evolver = data.evolver()
+    for key, child_updates in children.items():
+        if len(child_updates) == 1 and not child_updates[0][0]:
+            value = child_updates[0][1]
+        else:
+            value = set_in(data[key], child_updates)
+        if value is REMOVED:
+            if isinstance(data, PVector):
+                evolver.delete(key)
+            else:
+                evolver.remove(key)
+        elif isinstance(data, PVector) and key == len(evolver):
+            evolver.append(value)
+        else:
+            evolver[key] = value
+    return evolver.persistent()
+
+
+def changed_indices(old_vector, new_vector):
+    """Return the indices of new_vector whose item is not the one of
+    old_vector, up to the shorter length. The identity scan runs in C.
+    """
+    return list(itertools.compress(
+        range(len(new_vector)), map(operator.is_not, old_vector, new_vector)))
+
+
+def changed_keys(old_map, new_map):
+    """Return the keys of new_map whose value is not the one of old_map,
+    added keys included and removed ones not.
+
+    A PMap keeps its entries in a PVector of buckets shared with the map it
+    was derived from, so only the buckets of changed keys are walked.
+    """
+    old_buckets = old_map._buckets
+    new_buckets = new_map._buckets
+    if len(old_buckets) != len(new_buckets):
+        return [key for key, value in new_map.iteritems()
+                if old_map.get(key, REMOVED) is not value]
+    changed = []
+    for index in changed_indices(old_buckets, new_buckets):
+        for key, value in new_buckets[index] or ():
+            if old_map.get(key, REMOVED) is not value:
+                changed.append(key)
+    return changed
+
+
+def diff_paths(old_data, new_data):
+    """Return the (path, value) updates turning old_data into new_data.
+
+    Subtrees shared between the two are skipped, so the result only names the
+    nodes that actually changed. set_in(old_data, diff_paths(old_data,
+    new_data)) is equal to new_data.
+    """
+    changes = []
+    _diff_paths(old_data, new_data, (), changes)
+    return changes
+
+
+def _diff_paths(old_data, new_data, path, changes):
+    if old_data is new_data:
+        return
+    if type(old_data) is not type(new_data):
+        changes.append((path, new_data))
+    elif isinstance(new_data, PMap):
+        added = 0
+        for key, value in new_data.iteritems():
+            old_value = old_data.get(key, REMOVED)
+            if old_value is REMOVED:
+                changes.append((path+(key,), value))
+                added += 1
+            else:
+                _diff_paths(old_value, value, path+(key,), changes)
+        if len(old_data)+added != len(new_data):
+            for key in old_data.iterkeys():
+                if key not in new_data:
+                    changes.append((path+(key,), REMOVED))
+    elif isinstance(new_data, PVector):
+        old_length = len(old_data)
+        new_length = len(new_data)
+        if new_length < old_length:
+            changes.append((path, new_data))
+        else:
+            for i in range(old_length):
+                _diff_paths(old_data[i], new_data[i], path+(i,), changes)
+            for i in range(old_length, new_length):
+                changes.append((path+(i,), new_data[i]))
+    elif old_data != new_data:
+        changes.append((path, new_data))
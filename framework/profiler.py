@@ -0,0 +1,194 @@
+import collections
+import json
+import os
+import threading
+import time
+import tracemalloc
+
+from pyrsistent import field
+from pyrsistent import PRecord
+
+
+class _NullScope(object):
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        return False
+
+
+_NULL_SCOPE = _NullScope()
+
+
+class _Scope(object):
+    def __init__(self, profiler, name, obj):
+        self._profiler = profiler
+        self.name = name
+        self.obj = obj
+        self.child_time = 0.0
+
+    def __enter__(self):
+        self._profiler._stack.append(self)
+        self.alloc_start = self._profiler._traced_memory()
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        end = time.perf_counter()
+        profiler = self._profiler
+        alloc = profiler._traced_memory()-self.alloc_start
+        duration = end-self.start
+        stack = profiler._stack
+        stack.pop()
+        if stack:
+            stack[-1].child_time += duration
+        profiler._events.append((self.name,
+                                 type(self.obj).__name__,
+                                 id(self.obj),
+                                 self.start,
+                                 duration,
+                                 duration-self.child_time,
+                                 alloc))
+        return False
+
+
+class ProfileEntry(PRecord):
+    name = field(type=str)
+    class_name = field(type=str)
+    # None when the entry sums every instance of the class.
+    instance = field()
+    count = field(type=int)
+    total = field(type=float)
+    self_time = field(type=float)
+    max = field(type=float)
+    alloc = field(type=int)
+
+
+class Profiler(object):
+    """Records the time views and the data manager spend in each phase.
+
+    The instrumented code wraps its phases in `with profiler.scope(name,
+    obj):`. While the profiler is stopped scope() returns a shared null
+    context, the only cost is that call. Between start() and stop() every
+    scope is recorded with its wall time, the time not spent in nested
+    scopes and, if trace_allocations was set, the change of the memory
+    traced by tracemalloc.
+    """
+
+    def __init__(self):
+        self.enabled = False
+        self._trace_allocations = False
+        self._started_tracemalloc = False
+        self._events = []
+        self._stack = []
+
+    def start(self, trace_allocations=False):
+        self._trace_allocations = trace_allocations
+        if trace_allocations and not tracemalloc.is_tracing():
+            tracemalloc.start()
+            self._started_tracemalloc = True
+        self.enabled = True
+
+    def stop(self):
+        self.enabled = False
+        if self._started_tracemalloc:
+            tracemalloc.stop()
+            self._started_tracemalloc = False
+
+    def clear(self):
+        self._events = []
+
+    def scope(self, name, obj=None):
+        if not self.enabled:
+            return _NULL_SCOPE
+        return _Scope(self, name, obj)
+
+    def _traced_memory(self):
+        if self._trace_allocations and tracemalloc.is_tracing():
+            return tracemalloc.get_traced_memory()[0]
+        return 0
+
+    def aggregate(self, by_instance=False):
+        """Return a ProfileEntry per phase and class, most expensive first.
+
+        With by_instance there is one entry per phase and object instead.
+        """
+        entries = collections.OrderedDict()
+        for (name, class_name, instance, _, duration, self_time,
+             alloc) in self._events:
+            key = (name, class_name, instance if by_instance else None)
+            entry = entries.get(key)
+            if entry is None:
+                entries[key] = [1, duration, self_time, duration, alloc]
+            else:
+                entry[0] += 1
+                entry[1] += duration
+                entry[2] += self_time
+                entry[3] = max(entry[3], duration)
+                entry[4] += alloc
+        result = [ProfileEntry(name=name,
+                               class_name=class_name,
+                               instance=instance,
+                               count=count,
+                               total=total,
+                               self_time=self_time,
+                               max=max_duration,
+                               alloc=alloc)
+                  for (name, class_name, instance), (
+                      count, total, self_time, max_duration, alloc)
+                  in entries.items()]
+        result.sort(key=lambda entry: -entry.self_time)
+        return result
+
+    def format_table(self, by_instance=False, limit=None):
+        entries = self.aggregate(by_instance)
+        if limit is not None:
+            entries = entries[:limit]
+        lines = ["{0:<40} {1:>8} {2:>10} {3:>10} {4:>10} {5:>12}".format(
+            "phase", "count", "total ms", "self ms", "max ms", "alloc B")]
+        for entry in entries:
+            name = "{0}.{1}".format(entry.class_name, entry.name)
+            if entry.instance is not None:
+                name += " {0:#x}".format(entry.instance)
+            lines.append(
+                "{0:<40} {1:>8} {2:>10.3f} {3:>10.3f} {4:>10.3f} {5:>12}"
+                .format(name,
+                        entry.count,
+                        entry.total*1000,
+                        entry.self_time*1000,
+                        entry.max*1000,
+                        entry.alloc))
+        return "\n".join(lines)
+
+    def chrome_trace(self):
+        """The recorded scopes as a Chrome trace-event format dict.
+
+        Load the json dump of it in chrome://tracing or Perfetto.
+        """
+        pid = os.getpid()
+        tid = threading.get_ident()
+        events = []
+        for (name, class_name, instance, start, duration, self_time,
+             alloc) in self._events:
+            events.append({
+                "name": "{0}.{1}".format(class_name, name),
+                "cat": name,
+                "ph": "X",
+                "ts": start*1e6,
+                "dur": duration*1e6,
+                "pid": pid,
+                "tid": tid,
+                "args": {
+                    "instance": "{0:#x}".format(instance),
+                    "self_us": self_time*1e6,
+                    "alloc": alloc,
+                },
+            })
+        return {"traceEvents": events, "displayTimeUnit": "ms"}
+
+    def export_chrome_trace(self, path):
+        with open(path, "w") as f:
+            json.dump(self.chrome_trace(), f)
+
+
+profiler = Profiler()
@@ -0,0 +1,236 @@
+import collections
+import time
+import weakref
+
+from PySide6 import QtCore
+
+
+_schedulers = weakref.WeakSet()
+
+
+def request_refresh():
+    """Ask every live scheduler to run once more.
+
+    Views call this when they need a refresh that isn't caused by a data
+    change, e.g. when an asynchronous load finished.
+    """
+    for scheduler in list(_schedulers):
+        scheduler.request()
+
+
+class SubmitQueue(object):
+    """Keeps the latest pending submit of each source until the next flush.
+
+    High frequency edits (dragging, live color picking) push here instead of
+    submitting directly, so only one new root per source is built each
+    frame. A pending value that should be recorded in history is never folded
+    into a later one, it is submitted first.
+    """
+
+    def __init__(self):
+        self._pending = collections.OrderedDict()
+
+    def push(self, source, submit, new_data, record_in_history=True):
+        pending = self._pending.get(source)
+        if pending is not None and pending[2]:
+            self.flush(source)
+        self._pending[source] = (submit, new_data, record_in_history)
+        request_refresh()
+
+    def has_pending(self, source=None):
+        if source is None:
+            return bool(self._pending)
+        return source in self._pending
+
+    def flush(self, source=None):
+        if source is not None:
+            pending = self._pending.pop(source, None)
+            if pending is not None:
+                submit, new_data, record_in_history = pending
+                submit(new_data, record_in_history)
+        else:
+            while self._pending:
+                _, pending = self._pending.popitem(last=False)
+                submit, new_data, record_in_history = pending
+                submit(new_data, record_in_history)
+
+
+submit_queue = SubmitQueue()
+
+
+class FrameBudget(object):
+    """The time views may still spend refreshing in the current frame.
+
+    Views refreshing many children (list rows, keyed children) check
+    expired() after each child and leave the rest for the next scheduler
+    run once it's True. Outside of a scheduler run with a frame budget it
+    never expires, so everything is refreshed at once.
+    """
+
+    def __init__(self):
+        self._deadline = None
+
+    def start(self, seconds):
+        self._deadline = time.perf_counter()+seconds
+
+    def stop(self):
+        self._deadline = None
+
+    def active(self):
+        return self._deadline is not None
+
+    def expired(self):
+        return self._deadline is not None and (
+            time.perf_counter() >= self._deadline)
+
+
+frame_budget = FrameBudget()
+
+
+class RefreshTask(object):
+    def __init__(self, callback, priority, max_rate, is_visible):
+        self.callback = callback
+        self.priority = priority
+        self.min_interval = 1.0/max_rate if max_rate else 0.0
+        self.is_visible = is_visible
+        self.dirty = True
+        self.last_run = None
+
+    def visible(self):
+        return self.is_visible is None or self.is_visible()
+
+    def wait_time(self, now):
+        if self.last_run is None:
+            return 0.0
+        return self.last_run+self.min_interval-now
+
+
+class RefreshScheduler(object):
+    """Runs the registered refresh tasks only when something asked for it.
+
+    All the requests made within one turn of the Qt event loop are coalesced
+    into a single run at the end of that turn. When nothing changes the
+    scheduler stays idle. Every run starts by flushing submit_queue.
+
+    Tasks run in descending priority. A task is skipped while it's not
+    visible, deferred while it ran less than 1/max_rate seconds ago, and
+    every task but the most important one is deferred to the next turn once
+    the run has taken longer than frame_budget seconds. The same budget is
+    given to the views through the module's FrameBudget, so a big refresh
+    is spread over several turns too.
+    """
+
+    PRIORITY_MAIN = 100
+    PRIORITY_SECONDARY = 0
+
+    def __init__(self, frame_budget=None):
+        self._frame_budget = frame_budget
+        self._tasks = []
+        self._pending = False
+        self._in_refresh = False
+        self._timer_deadline = None
+        _schedulers.add(self)
+
+    def add_task(self,
+                 callback,
+                 priority=PRIORITY_MAIN,
+                 max_rate=None,
+                 is_visible=None):
+        task = RefreshTask(callback, priority, max_rate, is_visible)
+        self._tasks.append(task)
+        self._tasks.sort(key=lambda t: -t.priority)
+        self.request()
+        return task
+
+    def remove_task(self, task):
+        self._tasks.remove(task)
+
+    def watch(self, data_manager):
+        data_manager.add_change_listener(self.request)
+
+    def request(self, task=None):
+        if task is None:
+            for each in self._tasks:
+                each.dirty = True
+        else:
+            task.dirty = True
+        self._schedule(0.0)
+
+    def has_pending(self):
+        """Whether a run is scheduled, now or after a task's rate limit."""
+        return self._pending or self._timer_deadline is not None
+
+    def run_now(self):
+        self._pending = True
+        self._run()
+
+    def _schedule(self, delay):
+        if delay <= 0.0:
+            if not self._pending:
+                self._pending = True
+                QtCore.QTimer.singleShot(0, self._run)
+        else:
+            deadline = time.perf_counter()+delay
+            if self._timer_deadline is None or (
+                    deadline < self._timer_deadline):
+                self._timer_deadline = deadline
+                QtCore.QTimer.singleShot(int(delay*1000)+1,
+                                         self._run_deferred)
+
+    def _run_deferred(self):
+        if self._timer_deadline is not None and (
+                time.perf_counter() >= self._timer_deadline):
+            self._timer_deadline = None
+            self.run_now()
+
+    def _run(self):
+        if not self._pending:
+            return
+        if self._in_refresh:
+            # Requested from a nested event loop, run once the current
+            # refresh is done.
+            QtCore.QTimer.singleShot(0, self._run)
+            return
+        self._in_refresh = True
+        try:
+            submit_queue.flush()
+            # Changes made by the flush are refreshed by this run.
+            self._pending = False
+            self._run_tasks()
+        finally:
+            self._in_refresh = False
+
+    def _run_tasks(self):
+        if self._frame_budget is None:
+            self._run_tasks_in_budget()
+            return
+        frame_budget.start(self._frame_budget)
+        try:
+            self._run_tasks_in_budget()
+        finally:
+            frame_budget.stop()
+
+    def _run_tasks_in_budget(self):
+        start = time.perf_counter()
+        next_delay = None
+        over_budget = False
+        for i, task in enumerate(self._tasks):
+            if not task.dirty or not task.visible():
+                continue
+            now = time.perf_counter()
+            wait = task.wait_time(now)
+            if wait > 0.0:
+                if next_delay is None or wait < next_delay:
+                    next_delay = wait
+                continue
+            if i > 0 and self._frame_budget is not None and (
+                    now-start > self._frame_budget):
+                over_budget = True
+                continue
+            task.dirty = False
+            task.last_run = now
+            task.callback()
+        if over_budget:
+            self._schedule(0.0)
+        if next_delay is not None:
+            self._schedule(next_delay)
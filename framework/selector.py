@@ -0,0 +1,48 @@
+from framework.path import get_in
+
+
+_MISSING = object()
+
+
+class Selector(object):
+    """A memoized data converter for ViewBase.bind_child_view.
+
+    fn is only called again when the input is not the last input and one of
+    the objects at `paths` (key paths into the input, see
+    framework.path.get_in) is not the one it was on the last call. Without
+    paths the whole input is the only dependency.
+
+    Since the same result object is returned while nothing it depends on
+    changed, ViewBase skips the whole subtree of a child bound with a
+    Selector when the result is the one that child already has.
+    """
+
+    def __init__(self, fn, paths=None):
+        self._fn = fn
+        self._paths = [tuple(path) for path in paths] if paths else None
+        self._last_input = _MISSING
+        self._last_dependencies = None
+        self._result = _MISSING
+
+    def __call__(self, data):
+        if data is self._last_input:
+            return self._result
+        dependencies = self._get_dependencies(data)
+        if self._last_dependencies is None or not all(
+                new is old for new, old in zip(dependencies,
+                                               self._last_dependencies)):
+            self._result = self._fn(data)
+        self._last_input = data
+        self._last_dependencies = dependencies
+        return self._result
+
+    def _get_dependencies(self, data):
+        if self._paths is None:
+            return (data,)
+        dependencies = []
+        for path in self._paths:
+            try:
+                dependencies.append(get_in(data, path))
+            except (KeyError, IndexError, TypeError, AttributeError):
+                dependencies.append(_MISSING)
+        return tuple(dependencies)
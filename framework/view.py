@@ -1,15 +1,37 @@
 import collections
+import contextlib
+import itertools
+import operator
 
+from PySide6 import QtCore
 from PySide6 import QtWidgets
+from pyrsistent import pmap
 
+from framework.diff import DELETE
+from framework.diff import diff_stats
+from framework.diff import INSERT
 from framework.diff import list_diff
+from framework.diff import MOVE
+from framework.path import set_in
+from framework.profiler import profiler
+from framework.scheduler import frame_budget
+from framework.scheduler import request_refresh
+from framework.scheduler import submit_queue
+from framework.selector import Selector
 from framework.widget import DebugDialog
+from framework.widget import VirtualListModel
+from framework.widget import VirtualListWidget
 
 
 class _Unintialized(object):
     pass
 
 
+_MISSING = object()
+_EMPTY_MAP = pmap()
+_PHASE_NAMES = {DELETE: "take", MOVE: "move", INSERT: "insert"}
+
+
 class ViewBase(object):
     UNINTIALIZED = _Unintialized()
 
@@ -17,10 +39,26 @@ class ViewBase(object):
         self._submit_data_callback = submit_data_callback
         self._view_children = {}
         self._view_children_data = {}
+        self._view_children_paths = {}
+        self._keyed_child_views = []
+        # The data this view submitted last, until it's refreshed. The
+        # submit_path updates build on it.
+        self._submitted_data = self.UNINTIALIZED
+        # See bind_data_source.
+        self._get_source_data = None
         self._old_data = self.UNINTIALIZED
         self._current_data = self.UNINTIALIZED
         self._in_refresh = False
         self._should_refresh_internally = False
+        # Set when a view below this one should refresh internally.
+        self._subtree_pending = False
+        self._parent_view = None
+        # Set when the debug ViewData of this view or a view below it is out
+        # of date, cleared by framework.debug.generate_view_data.
+        self._debug_dirty = True
+        self._transaction_depth = 0
+        self._transaction_data = self.UNINTIALIZED
+        self._transaction_record = False
         self._create_child_view()
         self._widget = self._create_widget()
 
@@ -35,23 +73,82 @@ class ViewBase(object):
     def _create_child_view(self):
         pass
 
-    def bind_child_view(self, view, data_converter):
+    def bind_child_view(self, view, data_converter, path=None):
+        """Refresh view with data_converter(data) of this view's data.
+
+        If data_converter is a framework.selector.Selector, the child and its
+        subtree are skipped while the selector returns the data the child
+        already has and nothing below it should refresh internally.
+
+        path is where the child's data is in this view's data, a tuple of
+        keys or a callable returning one from this view's data. The
+        submit_path updates of a child bound with a path are forwarded to
+        this view.
+        """
         self._view_children[view] = data_converter
+        if path is not None:
+            self._view_children_paths[view] = path
+        view._parent_view = self
+        if view.has_pending_refresh():
+            self._mark_subtree_pending()
+        self._mark_debug_dirty()
         return view
 
     def unbind_child_view(self, view):
+        self._mark_debug_dirty()
         del self._view_children[view]
         self._view_children_data.pop(view, None)
+        self._view_children_paths.pop(view, None)
+
+    def _get_child_path(self, view):
+        """Return the path of view's data in this view's data, or None."""
+        path = self._view_children_paths.get(view)
+        if callable(path):
+            path = path(self.get_current_data())
+        return path
+
+    def bind_keyed_children(self,
+                            data_converter,
+                            view_factory,
+                            remove_callback=None):
+        """Keep one child view per key of the PMap data_converter returns.
+
+        See KeyedChildViews.
+        """
+        keyed_views = KeyedChildViews(self,
+                                      data_converter,
+                                      view_factory,
+                                      remove_callback)
+        self._keyed_child_views.append(keyed_views)
+        return keyed_views
+
+    def bind_data_source(self, get_data):
+        """Build submit_path updates on get_data() instead of on the data
+        this view submitted last.
+
+        get_data returns the latest data of what submit_data_callback submits
+        to, e.g. DataManager.get_data. Without it an update made after an undo
+        or any other change the view wasn't refreshed with yet is applied to
+        stale data and reverts that change.
+        """
+        self._get_source_data = get_data
 
     def iter_child_view(self):
         for view in self._view_children:
             yield view
+        for keyed_views in self._keyed_child_views:
+            for view in keyed_views:
+                yield view
 
     def set_current_data(self, data):
         self.set_old_data(self._current_data)
         self._current_data = data
+        self._submitted_data = self.UNINTIALIZED
+        self._mark_debug_dirty()
 
     def get_current_data(self):
+        if self._transaction_data is not self.UNINTIALIZED:
+            return self._transaction_data
         return self._current_data
 
     def set_old_data(self, data):
@@ -65,6 +162,38 @@ class ViewBase(object):
 
     def mark_should_refresh_internally(self, flag):
         self._should_refresh_internally = flag
+        if flag:
+            if self._parent_view is not None:
+                self._parent_view._mark_subtree_pending()
+            request_refresh()
+
+    def has_pending_refresh(self):
+        return self.should_refresh_internally() or self._subtree_pending
+
+    def _mark_subtree_pending(self):
+        view = self
+        while view is not None and not view._subtree_pending:
+            view._subtree_pending = True
+            view = view._parent_view
+
+    def _mark_debug_dirty(self):
+        self._debug_dirty = True
+        view = self._parent_view
+        while view is not None and not view._debug_dirty:
+            view._debug_dirty = True
+            view = view._parent_view
+
+    def _defer_refresh(self):
+        """Finish refreshing the children of this view on the next run."""
+        self._mark_subtree_pending()
+        request_refresh()
+
+    def is_visible(self):
+        """Visible views are refreshed first when the frame budget is short."""
+        widget = self.widget
+        if isinstance(widget, QtWidgets.QWidget):
+            return widget.isVisible() and not widget.visibleRegion().isEmpty()
+        return True
 
     def should_refresh(self, new_data, current_data):
         return new_data is not current_data
@@ -78,77 +207,327 @@ class ViewBase(object):
         child_view.try_refresh(child_data)
 
     def try_refresh(self, new_data):
-        if self.should_refresh_internally() or (
-                self.should_refresh(new_data, self.get_current_data())):
-            self.set_current_data(new_data)
-            self._in_refresh = True
-            self.refresh(new_data)
-            self._in_refresh = False
-            self.mark_should_refresh_internally(False)
-        if self.should_refresh_children():
-            for view, data_converter in self._view_children.items():
-                self._view_children_data[view] = data_converter(new_data)
-            for view, data in self._view_children_data.items():
-                self._on_try_refresh_child(view, data)
+        with profiler.scope("try_refresh", self):
+            if self.should_refresh_internally() or (
+                    self.should_refresh(new_data, self.get_current_data())):
+                self.set_current_data(new_data)
+                self._in_refresh = True
+                with profiler.scope("refresh", self):
+                    self.refresh(new_data)
+                self._in_refresh = False
+                self.mark_should_refresh_internally(False)
+            if self.should_refresh_children():
+                subtree_pending = self._subtree_pending
+                self._subtree_pending = False
+                children = []
+                for view, data_converter in self._view_children.items():
+                    data = data_converter(new_data)
+                    if isinstance(data_converter, Selector) and (
+                            data is self._view_children_data.get(view,
+                                                                 _MISSING)
+                            and not view.has_pending_refresh()):
+                        continue
+                    self._view_children_data[view] = data
+                    children.append((view, data))
+                for view, data in children:
+                    self._on_try_refresh_child(view, data)
+                for keyed_views in self._keyed_child_views:
+                    keyed_views.refresh(new_data, subtree_pending)
 
     def refresh(self, new_data):
         pass
 
     def submit_data(self, new_data, record_in_history=True):
+        if submit_queue.has_pending(self):
+            # Keep the order of this view's submits.
+            submit_queue.flush(self)
         if self._submit_data_callback and self.data_valid(new_data):
+            if self._transaction_depth:
+                self._transaction_data = new_data
+                self._transaction_record = (self._transaction_record
+                                            or record_in_history)
+            else:
+                self._submitted_data = new_data
+                self._submit_data_callback(new_data, record_in_history)
+
+    def submit_data_coalesced(self, new_data, record_in_history=True):
+        """Submit new_data on the next scheduler run.
+
+        Only the latest value submitted this way before the run is submitted.
+        """
+        submit_queue.push(self, self.submit_data, new_data, record_in_history)
+
+    def has_pending_submit(self):
+        return submit_queue.has_pending(self)
+
+    def submit_path(self, path, value, record_in_history=True):
+        """Submit value as the new data at path of this view's data.
+
+        The update goes up through the parents this view and its ancestors
+        are bound to with a path (see bind_child_view), each one prefixing
+        the path with the child's one. The first view without one applies
+        the update with framework.path.set_in right away and submits the
+        result with submit_data, so it's part of an open transaction.
+
+        The update is applied to the data of bind_data_source, or else to the
+        data this view submitted last if it wasn't refreshed since, so
+        submits made before the next refresh build on each other. Keys that
+        depend on the data, like an index into a list, can be
+        framework.path.APPEND or callables resolved when the update is
+        applied.
+        """
+        path = tuple(path)
+        parent = self._parent_view
+        data_path = None
+        if parent is not None and not self._transaction_depth:
+            data_path = parent._get_child_path(self)
+        if data_path is not None:
+            parent.submit_path(tuple(data_path)+path,
+                               value,
+                               record_in_history)
+        else:
+            if self._transaction_depth:
+                data = self.get_current_data()
+            elif self._get_source_data is not None:
+                data = self._get_source_data()
+            elif self._submitted_data is not self.UNINTIALIZED:
+                data = self._submitted_data
+            else:
+                data = self.get_current_data()
+            self.submit_data(set_in(data, [(path, value)]), record_in_history)
+
+    @contextlib.contextmanager
+    def transaction(self):
+        """Batch every submit_data of this view inside the block into one.
+
+        Inside the block get_current_data returns the latest submitted data,
+        so edits submitted by different children build on each other. Nothing
+        is submitted if an exception escapes the block.
+        """
+        saved = (self._transaction_data, self._transaction_record)
+        self._transaction_depth += 1
+        try:
+            yield
+        except BaseException:
+            self._transaction_data, self._transaction_record = saved
+            raise
+        finally:
+            self._transaction_depth -= 1
+        if not self._transaction_depth and (
+                self._transaction_data is not self.UNINTIALIZED):
+            new_data = self._transaction_data
+            record_in_history = self._transaction_record
+            self._transaction_data = self.UNINTIALIZED
+            self._transaction_record = False
+            self._submitted_data = new_data
             self._submit_data_callback(new_data, record_in_history)
 
     def data_valid(self, new_data):
         return True
 
 
-class ListViewBase(ViewBase):
+class KeyedChildViews(object):
+    """The child views of a view bound to the entries of a PMap.
+
+    view_factory(key, value) creates the view of a new key, remove_callback
+    (key, view) is called when a key is gone. Only the views whose entry is
+    not the one they got last time are refreshed, unchanged entries cost an
+    identity check and nothing below them is visited. Views not created or
+    refreshed before the frame budget expired are on the next run.
+    """
+
+    def __init__(self,
+                 parent_view,
+                 data_converter,
+                 view_factory,
+                 remove_callback=None):
+        self._parent_view = parent_view
+        self._data_converter = data_converter
+        self._view_factory = view_factory
+        self._remove_callback = remove_callback
+        self._data = _EMPTY_MAP
+        self._views = {}
+        # view -> value, left for the next refresh by the frame budget.
+        self._dirty = {}
+        # key -> value of the new keys whose view is not created yet.
+        self._unbuilt = {}
+
+    def __len__(self):
+        return len(self._views)
+
+    def __iter__(self):
+        return iter(list(self._views.values()))
+
+    def get(self, key, default=None):
+        return self._views.get(key, default)
+
+    def refresh(self, parent_data, subtree_pending=False):
+        data = self._data_converter(parent_data)
+        old_data = self._data
+        if data is old_data and not subtree_pending and not (
+                self._dirty or self._unbuilt):
+            return
+        with profiler.scope("refresh_keyed_children", self._parent_view):
+            self._refresh(data, old_data, subtree_pending)
+
+    def _refresh(self, data, old_data, subtree_pending):
+        views = self._views
+        dirty = self._dirty
+        # Views left by the last refresh are already in order.
+        resumed = bool(dirty)
+        self._dirty = {}
+        if data is not old_data:
+            unbuilt = {}
+            for key, value in data.iteritems():
+                view = views.get(key)
+                if view is None:
+                    unbuilt[key] = value
+                elif value is not old_data[key]:
+                    dirty[view] = value
+            self._unbuilt = unbuilt
+            if len(views)+len(unbuilt) != len(data):
+                for key in [k for k in views if k not in data]:
+                    view = views.pop(key)
+                    dirty.pop(view, None)
+                    if self._remove_callback is not None:
+                        self._remove_callback(key, view)
+                self._parent_view._mark_debug_dirty()
+        if self._unbuilt:
+            self._create_views(dirty)
+        if subtree_pending:
+            for key, view in views.items():
+                if view not in dirty and view.has_pending_refresh():
+                    dirty[view] = data[key]
+        self._data = data
+        dirty = list(dirty.items())
+        if len(dirty) > 1 and not resumed and frame_budget.active():
+            dirty.sort(key=lambda item: not item[0].is_visible())
+        for i, (view, value) in enumerate(dirty):
+            view.try_refresh(value)
+            if i+1 < len(dirty) and frame_budget.expired():
+                self._dirty = dict(dirty[i+1:])
+                self._parent_view._defer_refresh()
+                break
+
+    def _create_views(self, dirty):
+        # At least one view is created per run so a large insert always
+        # makes progress, the rest waits for the next run once the frame
+        # budget expired.
+        unbuilt = self._unbuilt
+        for key in list(unbuilt):
+            value = unbuilt.pop(key)
+            view = self._view_factory(key, value)
+            view._parent_view = self._parent_view
+            self._views[key] = view
+            dirty[view] = value
+            if unbuilt and frame_budget.expired():
+                self._parent_view._defer_refresh()
+                break
+        self._parent_view._mark_debug_dirty()
+
+
+class ElementViewPool(object):
+    """Detached element views kept to be bound to new data later.
+
+    Views are released with the key they showed last. acquire prefers a
+    view which showed the same key, its data is often still the one it
+    has, otherwise the least recently released view is reused. When more
+    than `capacity` views are pooled the least recently released one is
+    passed to destroy_callback.
+    """
+
+    def __init__(self, capacity, destroy_callback=None):
+        self._capacity = capacity
+        self._destroy_callback = destroy_callback
+        # view -> key, least recently released first.
+        self._views = collections.OrderedDict()
+        self._key_views = {}
+        self.hits = 0
+        self.misses = 0
+
+    def __len__(self):
+        return len(self._views)
+
+    def acquire(self, key):
+        """Return a pooled view for key, or None if the pool is empty."""
+        key_views = self._key_views.get(key)
+        if key_views:
+            view = key_views[-1]
+        elif self._views:
+            view = next(iter(self._views))
+        else:
+            self.misses += 1
+            return None
+        self._remove(view)
+        self.hits += 1
+        return view
+
+    def release(self, key, view):
+        self._views[view] = key
+        self._key_views.setdefault(key, []).append(view)
+        while len(self._views) > self._capacity:
+            oldest = next(iter(self._views))
+            self._remove(oldest)
+            if self._destroy_callback is not None:
+                self._destroy_callback(oldest)
+
+    def _remove(self, view):
+        key = self._views.pop(view)
+        key_views = self._key_views[key]
+        key_views.remove(view)
+        if not key_views:
+            del self._key_views[key]
+
+
+class ElementListViewBase(ViewBase):
+    """What ListViewBase and VirtualListViewBase share.
+
+    Subclasses implement _generate_key_list, _get_data_at and
+    _get_element_path for the data, and the row bookkeeping of their widget.
+    """
+
+    # See framework.diff.list_diff.
+    DIFF_STRATEGY = "heuristic"
+
     def __init__(self, element_view_factory, submit_data_callback=None):
-        super(ListViewBase, self).__init__(submit_data_callback)
+        super(ElementListViewBase, self).__init__(submit_data_callback)
         self._element_view_factory = element_view_factory
-        self._current_key_list = []
-        self._current_element_view_list = []
-        self._current_element_view_index = {}
-        self._current_element_view_data = []
         self._selected_key = None
 
     def _on_selection_changed(self, index):
         pass
 
-    def _create_widget(self):
-        list_widget = QtWidgets.QListWidget()
-        list_widget.itemSelectionChanged.connect(
-            self._on_item_selection_changed)
-        return list_widget
-
     def get_selected_data(self):
-        index = self.widget.currentRow()
-        current_data = self.get_current_data()
-        try:
-            key = self._current_key_list[index]
-            data = self._get_data_at(index, key, current_data)
-        except IndexError:
-            data = None
-        return data
-
-    def _insert_item(self, index, item):
-        self.widget.insertItem(index, item)
-
-    def _take_item(self, index):
-        return self.widget.takeItem(index)
+        index = self._get_current_row()
+        if not 0 <= index < len(self._current_key_list):
+            return None
+        key = self._current_key_list[index]
+        return self._get_data_at(index, key, self.get_current_data())
 
     def _create_element_view(self):
         return self._element_view_factory()
 
     def _get_element_view_index(self, element_view):
-        return self._current_element_view_index[element_view]
+        """Return the row of element_view, KeyError if it has none."""
+        raise NotImplementedError(
+            "This method should be implemented in sub-class.")
+
+    def _find_row(self, key):
+        """Return the first row of key, or None."""
+        raise NotImplementedError(
+            "This method should be implemented in sub-class.")
+
+    def _get_current_row(self):
+        raise NotImplementedError(
+            "This method should be implemented in sub-class.")
 
     def _set_current_row(self, index):
-        if self.widget.currentRow() != index:
-            self.widget.setCurrentRow(index)
+        raise NotImplementedError(
+            "This method should be implemented in sub-class.")
 
     def _clear_selection(self):
-        self.widget.setCurrentRow(-1)
+        raise NotImplementedError(
+            "This method should be implemented in sub-class.")
 
     def _generate_key_list(self, data):
         raise NotImplementedError(
@@ -158,66 +537,259 @@ class ListViewBase(ViewBase):
         raise NotImplementedError(
             "This method should be implemented in sub-class.")
 
+    def _get_child_path(self, view):
+        try:
+            row = self._get_element_view_index(view)
+        except KeyError:
+            # The view was removed or released, drop what it submits.
+            return None
+        return self._get_element_path(row, self._current_key_list[row])
+
+    def _get_element_path(self, index, key):
+        """Return the path of the data at index for submit_path."""
+        raise NotImplementedError(
+            "This method should be implemented in sub-class.")
+
     def try_refresh(self, new_data_collection, selected_key=None):
         if not self._in_refresh:
             self._in_refresh = True
-            super(ListViewBase, self).try_refresh(new_data_collection)
-            self.refresh_children()
+            subtree_pending = self._subtree_pending
+            super(ElementListViewBase, self).try_refresh(new_data_collection)
+            self.refresh_children(subtree_pending)
             if self._current_key_list and self._selected_key != selected_key:
+                selected_row = None
                 if selected_key is not None:
-                    selected_row = None
-                    for i, each_key in enumerate(self._current_key_list):
-                        if each_key == selected_key:
-                            selected_row = i
-                            break
-                    if selected_row is not None:
-                        self._set_current_row(selected_row)
-                    else:
-                        self._clear_selection()
+                    selected_row = self._find_row(selected_key)
+                if selected_row is not None:
+                    self._set_current_row(selected_row)
                 else:
                     self._clear_selection()
                 self._selected_key = selected_key
             self._in_refresh = False
 
+    def refresh_children(self, subtree_pending=True):
+        raise NotImplementedError(
+            "This method should be implemented in sub-class.")
+
+
+class ListViewBase(ElementListViewBase):
+    # Element views of removed rows kept for new rows, see ElementViewPool.
+    ELEMENT_VIEW_POOL_SIZE = 0
+
+    def __init__(self, element_view_factory, submit_data_callback=None):
+        super(ListViewBase, self).__init__(element_view_factory,
+                                           submit_data_callback)
+        self._current_key_list = []
+        self._current_element_view_list = []
+        self._current_element_view_index = {}
+        self._current_element_view_data = []
+        # key -> first row of that key and element view -> row. Only the
+        # rows before _row_index_valid_upto are indexed, the rest is indexed
+        # lazily when a lookup needs it. Entries are checked against the
+        # row they point to since stale ones are not removed eagerly.
+        self._current_key_index = {}
+        self._row_index_valid_upto = 0
+        # Element views whose data changed since the last refresh_children.
+        self._dirty_element_views = {}
+        self._diff_stats = collections.Counter()
+        self._element_view_pool = ElementViewPool(
+            self.ELEMENT_VIEW_POOL_SIZE, self._destroy_element_view)
+
+    def _create_widget(self):
+        list_widget = QtWidgets.QListWidget()
+        list_widget.itemSelectionChanged.connect(
+            self._on_item_selection_changed)
+        return list_widget
+
+    def _insert_item(self, index, item):
+        self.widget.insertItem(index, item)
+
+    def _take_item(self, index):
+        return self.widget.takeItem(index)
+
+    def _move_item(self, from_index, to_index, item):
+        self.widget.insertItem(to_index, self.widget.takeItem(from_index))
+
+    def _destroy_element_view(self, element_view):
+        """Called for the element views dropped out of the pool."""
+        pass
+
+    def _get_visible_rows(self):
+        """The range of rows the widget shows, or None if it isn't known."""
+        widget = self.widget
+        if not isinstance(widget, QtWidgets.QListWidget):
+            return None
+        rect = widget.viewport().rect()
+        first = widget.indexAt(rect.topLeft()).row()
+        if first < 0:
+            return None
+        last = widget.indexAt(rect.bottomLeft()).row()
+        if last < 0:
+            last = widget.count()-1
+        return range(first, last+1)
+
+    def _get_element_view_index(self, element_view):
+        row = self._current_element_view_index.get(element_view)
+        if row is None or row >= self._row_index_valid_upto or (
+                self._current_element_view_list[row] is not element_view):
+            row = self._extend_row_index(view=element_view)
+        if row is None:
+            raise KeyError(element_view)
+        return row
+
+    def _find_row(self, key):
+        row = self._current_key_index.get(key)
+        if row is None or row >= self._row_index_valid_upto or (
+                self._current_key_list[row] != key):
+            row = self._extend_row_index(key=key)
+        return row
+
+    def _extend_row_index(self, key=_MISSING, view=None):
+        # Index rows from _row_index_valid_upto until key or view is found.
+        keys = self._current_key_list
+        views = self._current_element_view_list
+        key_index = self._current_key_index
+        view_index = self._current_element_view_index
+        for i in range(self._row_index_valid_upto, len(keys)):
+            each_key = keys[i]
+            row = key_index.get(each_key)
+            if row is None or row >= i or keys[row] != each_key:
+                key_index[each_key] = i
+            view_index[views[i]] = i
+            self._row_index_valid_upto = i+1
+            if (key is not _MISSING and each_key == key) or (
+                    view is not None and views[i] is view):
+                return i
+        return None
+
+    def _invalidate_row_index(self, index):
+        if index < self._row_index_valid_upto:
+            self._row_index_valid_upto = index
+
+    def _get_current_row(self):
+        return self.widget.currentRow()
+
+    def _set_current_row(self, index):
+        if self.widget.currentRow() != index:
+            self.widget.setCurrentRow(index)
+
+    def _clear_selection(self):
+        self.widget.setCurrentRow(-1)
+
+    def get_diff_stats(self):
+        """Operation counts of every list_diff applied by this view."""
+        return dict(self._diff_stats)
+
+    def get_element_view_pool_stats(self):
+        pool = self._element_view_pool
+        return {"hits": pool.hits, "misses": pool.misses, "size": len(pool)}
+
     def refresh(self, new_data_collection):
         # self._clear_selection()
         self._selected_key = None
         current_keys = self._current_key_list
         current_views = self._current_element_view_list
+        current_data = self._current_element_view_data
         new_keys = self._generate_key_list(new_data_collection)
-        moves = list_diff(current_keys, new_keys, lambda k: k)
+        with profiler.scope("diff", self):
+            moves = list_diff(current_keys,
+                              new_keys,
+                              None,
+                              self.DIFF_STRATEGY)
+        self._diff_stats.update(diff_stats(moves))
         view_cache = collections.defaultdict(list)
-        for index, operation, key in moves:
-            if operation == -1:
+        # list_diff returns the deletes, then the moves, then the inserts.
+        for operation, operations in itertools.groupby(
+                moves, operator.itemgetter(1)):
+            with profiler.scope(_PHASE_NAMES[operation], self):
+                self._apply_operations(operations, view_cache)
+        if __debug__:
+            assert current_keys == new_keys
+        for key, element_views in view_cache.items():
+            for element_view in element_views:
+                self._element_view_pool.release(key, element_view)
+        self._current_key_list = new_keys
+        # Only the rows whose data is not the one their view got last time
+        # are refreshed by refresh_children.
+        with profiler.scope("compare", self):
+            dirty_views = self._dirty_element_views
+            get_data_at = self._get_data_at
+            for i, key in enumerate(new_keys):
+                data = get_data_at(i, key, new_data_collection)
+                if data is not current_data[i]:
+                    current_data[i] = data
+                    dirty_views[current_views[i]] = None
+
+    def _apply_operations(self, operations, view_cache):
+        current_keys = self._current_key_list
+        current_views = self._current_element_view_list
+        current_data = self._current_element_view_data
+        for index, operation, key in operations:
+            if operation == DELETE:
+                self._invalidate_row_index(index)
                 if __debug__:
                     del current_keys[index]
                 element_view = current_views.pop(index)
+                del current_data[index]
+                self._dirty_element_views.pop(element_view, None)
                 self._take_item(index)
+                self._current_element_view_index.pop(element_view, None)
+                if self._current_key_index.get(key, -1) >= index:
+                    self._current_key_index.pop(key)
                 view_cache[key].append(element_view)
-            else:
+            elif operation == INSERT:
+                self._invalidate_row_index(index)
                 if __debug__:
                     current_keys.insert(index, key)
                 if view_cache[key]:
                     element_view = view_cache[key].pop()
                 else:
-                    element_view = self._create_element_view()
+                    element_view = self._element_view_pool.acquire(key)
+                    if element_view is None:
+                        element_view = self._create_element_view()
+                        element_view._parent_view = self
                 current_views.insert(index, element_view)
+                current_data.insert(index, _MISSING)
                 self._insert_item(index, element_view.widget)
-        if __debug__:
-            assert current_keys == new_keys
-        self._current_key_list = new_keys
-        self._current_element_view_list = current_views
-        self._current_element_view_index.clear()
-        self._current_element_view_data = [None] * len(
-            self._current_element_view_list)
-        for i, element_view in enumerate(self._current_element_view_list):
-            self._current_element_view_index[element_view] = i
-            self._current_element_view_data[i] = self._get_data_at(
-                i, self._current_key_list[i], new_data_collection)
-
-    def refresh_children(self):
-        for i, data in enumerate(self._current_element_view_data):
-            self._current_element_view_list[i].try_refresh(data)
+            else:
+                from_index, to_index = index
+                self._invalidate_row_index(min(from_index, to_index))
+                if __debug__:
+                    current_keys.insert(to_index,
+                                        current_keys.pop(from_index))
+                element_view = current_views.pop(from_index)
+                current_views.insert(to_index, element_view)
+                current_data.insert(to_index, current_data.pop(from_index))
+                self._move_item(from_index, to_index, element_view.widget)
+
+    def refresh_children(self, subtree_pending=True):
+        with profiler.scope("refresh_children", self):
+            self._refresh_children(subtree_pending)
+
+    def _refresh_children(self, subtree_pending):
+        dirty_views = self._dirty_element_views
+        if subtree_pending:
+            for element_view in self._current_element_view_list:
+                if element_view.has_pending_refresh():
+                    dirty_views[element_view] = None
+        self._dirty_element_views = {}
+        dirty_views = list(dirty_views)
+        if len(dirty_views) > 1 and frame_budget.active():
+            visible_rows = self._get_visible_rows()
+            if visible_rows is not None:
+                visible = set(self._current_element_view_list[
+                    visible_rows.start:visible_rows.stop])
+                dirty_views = ([v for v in dirty_views if v in visible]
+                               + [v for v in dirty_views if v not in visible])
+        for i, element_view in enumerate(dirty_views):
+            row = self._get_element_view_index(element_view)
+            element_view.try_refresh(self._current_element_view_data[row])
+            if i+1 < len(dirty_views) and frame_budget.expired():
+                # The rest is refreshed on the next run, visible rows first.
+                for view in dirty_views[i+1:]:
+                    self._dirty_element_views[view] = None
+                self._defer_refresh()
+                break
 
     def iter_child_view(self):
         for view in self._current_element_view_list:
@@ -229,8 +801,212 @@ class ListViewBase(ViewBase):
             self._on_selection_changed(row)
 
 
+class VirtualListViewBase(ElementListViewBase):
+    """A list view only creating element views for the visible rows.
+
+    Subclasses implement _generate_key_list and _get_data_at like for
+    ListViewBase. The rows are kept in a QAbstractListModel shown by a
+    QListView, element views are only created for the rows in the viewport
+    plus OVERSCAN rows around it, and the views of rows scrolled out are
+    reused for the rows scrolled in, except the one holding the focus. A
+    released view's pending coalesced submit is flushed first and what it
+    submits while released is dropped (_get_child_path returns None).
+    """
+
+    # Rows materialized above and below the viewport.
+    OVERSCAN = 4
+    # Apply bigger diffs as a model reset instead of row by row.
+    RESET_THRESHOLD = 64
+
+    def __init__(self, element_view_factory, submit_data_callback=None):
+        super(VirtualListViewBase, self).__init__(element_view_factory,
+                                                  submit_data_callback)
+        self._current_key_list = self._model.keys
+        self._key_rows = None
+        # The materialized element views by row, their rows and keys.
+        self._row_views = {}
+        self._view_rows = {}
+        self._view_keys = {}
+        self._free_views = []
+
+    def _create_widget(self):
+        self._model = VirtualListModel()
+        widget = VirtualListWidget()
+        widget.setModel(self._model)
+        widget.selectionModel().currentRowChanged.connect(
+            self._on_current_row_changed)
+        widget.viewportChanged.connect(self._update_visible_rows)
+        return widget
+
+    def _get_element_view_index(self, element_view):
+        return self._view_rows[element_view]
+
+    def _find_row(self, key):
+        if self._key_rows is None:
+            self._key_rows = {}
+            for i, each_key in enumerate(self._current_key_list):
+                self._key_rows.setdefault(each_key, i)
+        return self._key_rows.get(key)
+
+    def _get_current_row(self):
+        return self.widget.currentIndex().row()
+
+    def _set_current_row(self, index):
+        if self.widget.currentIndex().row() != index:
+            self.widget.setCurrentIndex(self._model.index(index))
+
+    def _clear_selection(self):
+        self.widget.setCurrentIndex(QtCore.QModelIndex())
+
+    def refresh_children(self, subtree_pending=True):
+        if subtree_pending:
+            self._update_visible_rows()
+
+    def refresh(self, new_data_collection):
+        self._selected_key = None
+        keys = self._current_key_list
+        new_keys = self._generate_key_list(new_data_collection)
+        with profiler.scope("diff", self):
+            moves = list_diff(keys, new_keys, None, self.DIFF_STRATEGY)
+        model = self._model
+        root = QtCore.QModelIndex()
+        if len(moves) > self.RESET_THRESHOLD:
+            model.beginResetModel()
+            keys[:] = new_keys
+            model.endResetModel()
+        else:
+            for index, operation, key in moves:
+                if operation == DELETE:
+                    model.beginRemoveRows(root, index, index)
+                    del keys[index]
+                    model.endRemoveRows()
+                elif operation == INSERT:
+                    model.beginInsertRows(root, index, index)
+                    keys.insert(index, key)
+                    model.endInsertRows()
+                elif operation == MOVE:
+                    from_index, to_index = index
+                    # Qt wants the destination as a row of the list before
+                    # the move.
+                    model.beginMoveRows(root, from_index, from_index, root,
+                                        to_index+1 if to_index > from_index
+                                        else to_index)
+                    keys.insert(to_index, keys.pop(from_index))
+                    model.endMoveRows()
+        if moves:
+            self._key_rows = None
+        self._update_visible_rows()
+
+    def _update_visible_rows(self):
+        with profiler.scope("update_visible_rows", self):
+            self._update_visible_rows_now()
+
+    def _update_visible_rows_now(self):
+        # The rows shown, so the child views, change on scroll too.
+        self._mark_debug_dirty()
+        keys = self._current_key_list
+        data_collection = self._current_data
+        if not keys or data_collection is self.UNINTIALIZED:
+            start = end = 0
+        else:
+            widget = self.widget
+            widget.executeDelayedItemsLayout()
+            viewport = widget.viewport()
+            first = widget.indexAt(QtCore.QPoint(0, 0)).row()
+            last = widget.indexAt(
+                QtCore.QPoint(0, viewport.height()-1)).row()
+            if first < 0:
+                first = 0
+            if last < 0:
+                last = len(keys)-1
+            start = max(0, first-self.OVERSCAN)
+            end = min(len(keys), last+1+self.OVERSCAN)
+
+        # Views keep showing the same key when they can, so their data is
+        # usually the one they already have.
+        old_views = collections.defaultdict(list)
+        for view in self._row_views.values():
+            old_views[self._view_keys[view]].append(view)
+        row_views = {}
+        for row in range(start, end):
+            key = keys[row]
+            candidates = old_views.get(key)
+            if candidates:
+                view = candidates.pop()
+            else:
+                view = None
+            row_views[row] = view
+        focus_widget = QtWidgets.QApplication.focusWidget()
+        for key, candidates in old_views.items():
+            for view in candidates:
+                if focus_widget is not None and (
+                        view.widget is focus_widget
+                        or view.widget.isAncestorOf(focus_widget)):
+                    # Don't take the widget being edited away from the user
+                    # while the row is still there.
+                    row = self._find_row(key)
+                    if row is not None and row not in row_views:
+                        row_views[row] = view
+                        continue
+                self._release_element_view(view)
+        self._row_views = row_views
+        self._view_rows = {}
+        for row, view in row_views.items():
+            if view is None:
+                view = self._acquire_element_view()
+                row_views[row] = view
+            self._view_rows[view] = row
+            self._view_keys[view] = keys[row]
+        if row_views:
+            self._update_row_height()
+            width = self.widget.viewport().width()
+        for row, view in row_views.items():
+            view.try_refresh(self._get_data_at(row, keys[row],
+                                               data_collection))
+            rect = self.widget.visualRect(self._model.index(row))
+            view.widget.setGeometry(0, rect.y(), width, rect.height())
+            view.widget.show()
+
+    def _update_row_height(self):
+        view = next(iter(self._row_views.values()))
+        row_height = max(view.widget.sizeHint().height(), 1)
+        if row_height != self._model.row_height:
+            self._model.row_height = row_height
+            self.widget.doItemsLayout()
+
+    def _acquire_element_view(self):
+        if self._free_views:
+            return self._free_views.pop()
+        view = self._create_element_view()
+        view._parent_view = self
+        view.widget.setParent(self.widget.viewport())
+        return view
+
+    def _release_element_view(self, view):
+        if submit_queue.has_pending(view):
+            # Submit it to the current row of the view's key, or drop it if
+            # the key is gone.
+            row = self._find_row(self._view_keys[view])
+            self._view_rows.pop(view, None)
+            if row is not None:
+                self._view_rows[view] = row
+            submit_queue.flush(view)
+        self._view_rows.pop(view, None)
+        view.widget.hide()
+        self._view_keys.pop(view, None)
+        self._free_views.append(view)
+
+    def iter_child_view(self):
+        for row in sorted(self._row_views):
+            yield self._row_views[row]
+
+    def _on_current_row_changed(self, current, previous):
+        if not self._in_refresh:
+            self._on_selection_changed(current.row())
+
+
 class FormEditViewBase(ViewBase):
-    def __init__(self, submit_data_callback):
+    def __init__(self, submit_data_callback=None):
         super(FormEditViewBase, self).__init__(submit_data_callback)
         self.init_item_edit()
 
@@ -248,22 +1024,20 @@ class FormEditViewBase(ViewBase):
         pass
 
     def append_item_edit(self, label, key, view_factory):
-        view = view_factory(
-            lambda new_v, record_in_history=True: self._update_item(
-                key, new_v, record_in_history))
+        """Add a row editing the key field with a view_factory() view.
+
+        The view submits its edits with submit_path.
+        """
+        view = view_factory()
         self.add_row(label, view.widget)
-        self.bind_child_view(view, lambda data: getattr(data, key))
+        self.bind_child_view(view,
+                             lambda data: getattr(data, key),
+                             path=(key,))
 
     def add_row(self, name, widget):
         label = QtWidgets.QLabel(name)
         self._form_layout.addRow(label, widget)
 
-    def _update_item(self, key, new_v, record_in_history):
-        current_data = self.get_current_data()
-        if current_data is not self.UNINTIALIZED:
-            new_data = current_data.set(key, new_v)
-            self.submit_data(new_data, record_in_history=record_in_history)
-
     def refresh(self, new_data):
         pass
 
@@ -329,3 +1103,52 @@ class DebugView(ViewBase):
         dialog.setTreeWidget(self._tree_view.widget)
         dialog.setMinimumSize(500, 400)
         return dialog
+
+
+class MemoryReportView(ViewBase):
+    """Shows a DataManager.memory_report."""
+
+    def _create_widget(self):
+        dialog = QtWidgets.QDialog()
+        dialog.setWindowTitle("History memory")
+        dialog.setMinimumSize(500, 400)
+        layout = QtWidgets.QVBoxLayout()
+        dialog.setLayout(layout)
+
+        self._summary = QtWidgets.QLabel()
+        layout.addWidget(self._summary)
+
+        self._types = QtWidgets.QTreeWidget()
+        self._types.setRootIsDecorated(False)
+        self._types.setHeaderLabels(["Type", "Bytes"])
+        layout.addWidget(self._types)
+
+        self._entries = QtWidgets.QTreeWidget()
+        self._entries.setRootIsDecorated(False)
+        self._entries.setHeaderLabels(
+            ["Entry", "Kind", "Nodes", "Bytes", "New nodes", "New bytes"])
+        layout.addWidget(self._entries)
+        return dialog
+
+    def refresh(self, report):
+        self._summary.setText(
+            "{0} entries, {1} unique nodes ({2} bytes), "
+            "{3} shared node references, {4} bytes if nothing were "
+            "shared, {5} bytes on disk".format(report.history_entries,
+                                               report.unique_nodes,
+                                               report.unique_bytes,
+                                               report.shared_nodes,
+                                               report.total_bytes,
+                                               report.disk_bytes))
+
+        self._types.clear()
+        for type_name, size in sorted(report.bytes_by_type.items(),
+                                      key=lambda item: -item[1]):
+            QtWidgets.QTreeWidgetItem(self._types, [type_name, str(size)])
+
+        self._entries.clear()
+        for entry in report.entries:
+            QtWidgets.QTreeWidgetItem(self._entries, [
+                str(entry.index), entry.kind, str(entry.nodes),
+                str(entry.bytes),
+                str(entry.new_nodes), str(entry.new_bytes)])
@@ -1,5 +1,11 @@
+import os
+
+from PySide6 import QtCore
+from PySide6 import QtGui
 from PySide6 import QtWidgets
 
+from framework.profiler import profiler
+
 
 class DebugDialog(QtWidgets.QDialog):
     def __init__(self, parent=None):
@@ -10,3 +16,70 @@ class DebugDialog(QtWidgets.QDialog):
 
     def setTreeWidget(self, treeWidget):
         self.layout().addWidget(treeWidget)
+
+
+class VirtualListModel(QtCore.QAbstractListModel):
+    """A model of keys only, the rows are drawn by element view widgets."""
+
+    def __init__(self, parent=None):
+        super(VirtualListModel, self).__init__(parent)
+        self.keys = []
+        self.row_height = 24
+
+    def rowCount(self, parent=QtCore.QModelIndex()):
+        if parent.isValid():
+            return 0
+        return len(self.keys)
+
+    def data(self, index, role=QtCore.Qt.DisplayRole):
+        if role == QtCore.Qt.SizeHintRole:
+            return QtCore.QSize(0, self.row_height)
+        return None
+
+
+class VirtualListWidget(QtWidgets.QListView):
+    """A QListView emitting viewportChanged whenever other rows may show."""
+
+    viewportChanged = QtCore.Signal()
+
+    def __init__(self, parent=None):
+        super(VirtualListWidget, self).__init__(parent)
+        self.setUniformItemSizes(True)
+        self.setVerticalScrollMode(QtWidgets.QAbstractItemView.ScrollPerPixel)
+
+    def scrollContentsBy(self, dx, dy):
+        super(VirtualListWidget, self).scrollContentsBy(dx, dy)
+        self.viewportChanged.emit()
+
+    def resizeEvent(self, event):
+        super(VirtualListWidget, self).resizeEvent(event)
+        self.viewportChanged.emit()
+
+
+class ProfileAction(QtGui.QAction):
+    """The "Profile refresh" debug menu action, toggling the profiler.
+
+    Stopping the profiler asks where to save the Chrome trace and writes the
+    aggregate table next to it, with a .txt extension.
+    """
+
+    TABLE_LIMIT = 30
+
+    def __init__(self, parent=None):
+        super(ProfileAction, self).__init__("Profile refresh", parent)
+        self.triggered.connect(self.toggle_profile)
+
+    def toggle_profile(self):
+        if not profiler.enabled:
+            profiler.clear()
+            profiler.start(trace_allocations=True)
+            self.setText("Stop profiling")
+        else:
+            profiler.stop()
+            self.setText("Profile refresh")
+            filename = QtWidgets.QFileDialog.getSaveFileName(
+                filter="*.json")[0]
+            if filename:
+                profiler.export_chrome_trace(filename)
+                with open(os.path.splitext(filename)[0]+".txt", "w") as f:
+                    f.write(profiler.format_table(limit=self.TABLE_LIMIT))
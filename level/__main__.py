@@ -7,12 +7,13 @@ from level.app import LevelDesigner
 def parse_args():
     parser = argparse.ArgumentParser()
     parser.add_argument("-t", "--test-case")
+    parser.add_argument("--history-file")
     return parser.parse_args()
 
 
 def main():
     args = parse_args()
-    level_designer = LevelDesigner(args.test_case)
+    level_designer = LevelDesigner(args.test_case, args.history_file)
     sys.exit(level_designer.exec_())
 
 
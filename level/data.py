@@ -1,13 +1,15 @@
 from pyrsistent import field
 from pyrsistent import PRecord
 
+from framework.data import InternedRecord
 
-class Vector2(PRecord):
+
+class Vector2(InternedRecord):
     x = field(initial=0)
     y = field(initial=0)
 
 
-class GameObjectDataBase(PRecord):
+class GameObjectDataBase(InternedRecord):
     id_ = field(initial=0)
     pos = field(initial=Vector2(x=0, y=0))  # Vector2
     is_selected = field(initial=False)
@@ -27,3 +29,18 @@ class MountainData(GameObjectDataBase):
 
 class LevelData(PRecord):
     objects = field()   # a [id: object] map
+    # The id of a selected object, so finding it doesn't need a scan.
+    selected_id = field(initial=None)
+
+    @classmethod
+    def create(cls, kwargs, _factory_fields=None, ignore_extra=False):
+        # Recordings and history files written before selected_id existed
+        # only have the objects, it's looked up once when they're loaded.
+        if not isinstance(kwargs, cls) and "selected_id" not in kwargs:
+            kwargs = dict(kwargs)
+            kwargs["selected_id"] = next(
+                (id_ for id_, object_ in kwargs["objects"].iteritems()
+                 if object_.is_selected), None)
+        return super(LevelData, cls).create(kwargs,
+                                            _factory_fields,
+                                            ignore_extra)
@@ -2,9 +2,11 @@ from PySide6 import QtCore
 from PySide6 import QtGui
 from PySide6 import QtWidgets
 
+from framework.path import changed_keys
 from framework.view import ViewBase
 from framework.view import ListViewBase
 from framework.view import FormEditViewBase
+from framework.selector import Selector
 
 from level.data import Vector2
 
@@ -31,17 +33,30 @@ class RootView(ViewBase):
         self._object_list_view = ObjectListView(self._on_objects_changed)
         self.bind_child_view(self._object_list_view,
                              lambda level_data: level_data.objects)
-        self._attr_edit_view = AttrEditView(self._on_object_attr_changed)
-        self.bind_child_view(self._attr_edit_view, self._get_selected_object)
+        # Looking the selected object up is O(1), the selector only keeps
+        # the attribute editor skipped while it returns the same object.
+        self._selected_object = Selector(self._get_selected_object)
+        self._attr_edit_view = AttrEditView()
+        self.bind_child_view(self._attr_edit_view,
+                             self._selected_object,
+                             path=self._get_selected_object_path)
 
     def _get_selected_object(self, level_data):
-        object_ = None
-        for each in level_data.objects.itervalues():
-            if each.is_selected:
-                object_ = each
-                break
+        if level_data.selected_id is None:
+            return None
+        object_ = level_data.objects.get(level_data.selected_id)
+        if object_ is None or not object_.is_selected:
+            # Entries rebuilt from the deltas of a history file written
+            # before selected_id existed may point to a deselected object.
+            return None
         return object_
 
+    def _get_selected_object_path(self, level_data):
+        object_ = self._selected_object(level_data)
+        if object_ is None:
+            return None
+        return ("objects", object_.id_)
+
     def _create_widget(self):
         widget = QtWidgets.QWidget()
         layout = QtWidgets.QHBoxLayout()
@@ -64,14 +79,34 @@ class RootView(ViewBase):
         return main_window
 
     def _on_objects_changed(self, new_objects, record_in_history=True):
-        new_level_data = self.get_current_data().set("objects", new_objects)
-        self.submit_data(new_level_data, record_in_history=record_in_history)
-
-    def _on_object_attr_changed(self, new_object, record_in_history=True):
         level_data = self.get_current_data()
-        new_objects = level_data.objects.set(new_object.id_, new_object)
-        new_level_data = level_data.set("objects", new_objects)
-        self.submit_data(new_level_data, record_in_history=record_in_history)
+        old_selected_id = level_data.selected_id
+        selected_id = self._find_selected_id(level_data.objects,
+                                             new_objects,
+                                             old_selected_id)
+        with self.transaction():
+            self.submit_path(("objects",), new_objects, record_in_history)
+            if selected_id != old_selected_id:
+                self.submit_path(("selected_id",),
+                                 selected_id,
+                                 record_in_history)
+
+    def _find_selected_id(self, old_objects, objects, selected_id):
+        # A move or an edit of the selected object is O(1). When nothing was
+        # selected only the changed objects can be, when the selected one was
+        # deselected or removed another one may still be and every object is
+        # scanned, like the child views do on a selection change.
+        if selected_id is not None:
+            object_ = objects.get(selected_id)
+            if object_ is not None and object_.is_selected:
+                return selected_id
+            ids = objects.iterkeys()
+        else:
+            ids = changed_keys(old_objects, objects)
+        for id_ in ids:
+            if objects[id_].is_selected:
+                return id_
+        return None
 
 
 class ObjectListItemView(ViewBase):
@@ -247,7 +282,10 @@ class SceneObjectView(ViewBase):
                 self._on_object_pos_changed)
             self._scene.addItem(object_)
             self._scene.removeItem(loading_icon)
+            # Placing the item where the data says isn't an edit.
+            self._in_refresh = True
             object_.setPos(data.pos.x, data.pos.y)
+            self._in_refresh = False
             self._widget = object_
             load_finish_callback(data, self._widget)
         # Simulate an async loading.
@@ -257,6 +295,16 @@ class SceneObjectView(ViewBase):
     def _create_widget(self):
         pass
 
+    def is_visible(self):
+        if self._widget is None:
+            return False
+        rect = self._widget.sceneBoundingRect()
+        for view in self._scene.views():
+            if view.mapFromScene(rect).boundingRect().intersects(
+                    view.viewport().rect()):
+                return True
+        return False
+
     def refresh(self, new_data):
         self._widget.setPos(new_data.pos.x, new_data.pos.y)
         self._widget.setEnableBorder(new_data.is_selected)
@@ -273,8 +321,8 @@ class SceneObjectView(ViewBase):
             object_data = self.get_current_data()
             new_object_data = object_data.set("pos",
                                               Vector2(x=pos.x(), y=pos.y()))
-            self.submit_data(new_object_data,
-                             record_in_history=record_in_history)
+            self.submit_data_coalesced(new_object_data,
+                                       record_in_history=record_in_history)
 
 
 class SceneView(ViewBase):
@@ -283,9 +331,15 @@ class SceneView(ViewBase):
 
     def __init__(self, submit_data_callback=None):
         super(SceneView, self).__init__(submit_data_callback)
-        self._id_to_view = {}
+        self._loading_ids = set()
         self._loading = False
 
+    def _create_child_view(self):
+        self._object_views = self.bind_keyed_children(
+            lambda data: data,
+            self._create_object_view,
+            self._remove_object_view)
+
     def _create_widget(self):
         self._scene = QtWidgets.QGraphicsScene()
         brush = QtGui.QBrush(QtGui.QColor("darkgrey"),
@@ -313,42 +367,28 @@ class SceneView(ViewBase):
             result = False
         return result
 
-    def refresh(self, data):
+    def _create_object_view(self, id_, object_data):
+        # Nothing in the scene is refreshed until every new object finished
+        # loading.
         self._loading = True
-        old_data = self.get_old_data()
-        if old_data is self.UNINTIALIZED:
-            old_data = {}
-        for id_ in old_data:
-            if id_ not in data:
-                object_view = self._id_to_view.pop(id_)
-                self._scene.removeItem(object_view.widget)
-                self.unbind_child_view(object_view)
-        new_objects = []
-        for id_ in data:
-            if id_ not in old_data:
-                new_objects.append(id_)
-        if new_objects:
-            loading_ids = set(new_objects)
-            for id_ in new_objects:
-                object_view = SceneObjectView(
-                    self._scene,
-                    data[id_],
-                    lambda object_data, object_: self._on_object_loaded(
-                        object_data, object_, loading_ids),
-                    self._on_object_data_changed)
-                self.bind_child_view(object_view,
-                                     lambda data, id_=id_: data[id_])
-                self._id_to_view[id_] = object_view
-        else:
-            self._finish_refresh()
-
-    def _on_object_loaded(self, object_data, object_, loading_ids):
-        loading_ids.remove(object_data.id_)
-        if not loading_ids:
+        self._loading_ids.add(id_)
+        return SceneObjectView(self._scene,
+                               object_data,
+                               self._on_object_loaded,
+                               self._on_object_data_changed)
+
+    def _remove_object_view(self, id_, object_view):
+        self._scene.removeItem(object_view.widget)
+
+    def _on_object_loaded(self, object_data, object_):
+        self._loading_ids.discard(object_data.id_)
+        if not self._loading_ids:
             self._finish_refresh()
 
     def _finish_refresh(self):
         self._loading = False
+        # Data skipped while loading has to be applied now.
+        self.mark_should_refresh_internally(True)
 
     def _on_object_data_changed(self, new_object_data, record_in_history=True):
         old_objects = self.get_current_data()
@@ -368,7 +408,6 @@ class SceneView(ViewBase):
     def submit_data(self, new_data, record_in_history=True):
         if not self._in_refresh and not self._loading:
             self.set_current_data(new_data)
-            self.refresh(new_data)
             super().submit_data(new_data, record_in_history=record_in_history)
 
 
@@ -398,14 +437,13 @@ class Vector2EditView(ViewBase):
     def _set_value(self, attr, value):
         current_data = self.get_current_data()
         if current_data.get(attr) != value:
-            new_data = current_data.set(attr, value)
-            self.submit_data(new_data)
+            self.submit_path((attr,), value)
 
 
 class AttrEditView(ViewBase):
     def _create_child_view(self):
-        self._inner_view = AttrEditInnerView(self.submit_data)
-        self.bind_child_view(self._inner_view, lambda data: data)
+        self._inner_view = AttrEditInnerView()
+        self.bind_child_view(self._inner_view, lambda data: data, path=())
 
     def _create_widget(self):
         widget = QtWidgets.QGroupBox("Attribute")
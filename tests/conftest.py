@@ -0,0 +1,17 @@
+import os
+
+import pytest
+
+os.environ.setdefault("QT_QPA_PLATFORM", "offscreen")
+
+from PySide6 import QtWidgets  # noqa: E402
+
+
+@pytest.fixture(scope="session")
+def qt_app():
+    # One QApplication for every test, widgets can't be created with a
+    # QCoreApplication.
+    app = QtWidgets.QApplication.instance()
+    if app is None:
+        app = QtWidgets.QApplication([])
+    return app
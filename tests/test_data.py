@@ -0,0 +1,287 @@
+import gc
+import pickle
+
+import pytest
+from pyrsistent import field
+from pyrsistent import pmap
+
+from framework import data
+from framework.data import DataManager
+from framework.data import InternedRecord
+from framework.data import InternPool
+from framework.data import intern_string
+from framework.history import KeyframeHistoryStorage
+from framework.history import SegmentHistoryStorage
+from framework.path import set_in
+
+
+class _Clock(object):
+    def __init__(self):
+        self.now = 1000.0
+
+    def time(self):
+        return self.now
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = _Clock()
+    monkeypatch.setattr(data, "time", clock)
+    return clock
+
+
+def _values(data_manager):
+    return [each["value"] for each in data_manager.history]
+
+
+def _push_values(data_manager, values):
+    for value in values:
+        data_manager.push_data(data_manager.get_data().set("value", value))
+
+
+def test_evict_by_count():
+    data_manager = DataManager(pmap({"value": 0}), max_entries=3)
+    _push_values(data_manager, range(1, 10))
+    assert _values(data_manager) == [7, 8, 9]
+
+
+def test_evict_by_bytes():
+    data_manager = DataManager(pmap({"value": ""}), max_bytes=2000)
+    _push_values(data_manager, ["x"*100*i for i in range(1, 10)])
+    values = _values(data_manager)
+    assert 1 < len(values) < 10
+    assert values[-1] == "x"*900
+    assert data_manager.history_bytes <= 2000
+    assert data_manager.history_bytes == sum(
+        data_manager.get_history_info(i).size for i in range(len(values)))
+
+
+def test_evict_by_age(clock):
+    data_manager = DataManager(pmap({"value": 0}), max_age=10)
+    clock.now += 5
+    _push_values(data_manager, [1])
+    clock.now += 8
+    _push_values(data_manager, [2])
+    assert _values(data_manager) == [1, 2]
+    clock.now += 20
+    _push_values(data_manager, [3])
+    assert _values(data_manager) == [3]
+
+
+@pytest.mark.parametrize("limits", [{"max_entries": 0},
+                                    {"max_bytes": 0},
+                                    {"max_age": -1}])
+def test_never_evicts_the_current_entry(limits):
+    data_manager = DataManager(pmap({"value": 0}), **limits)
+    _push_values(data_manager, range(1, 5))
+    assert _values(data_manager) == [4]
+    data_manager.undo()
+    assert data_manager.get_data()["value"] == 4
+
+
+def test_evict_keeps_the_undo_position():
+    data_manager = DataManager(pmap({"value": 0}), max_entries=3)
+    _push_values(data_manager, range(1, 5))
+    data_manager.undo()
+    data_manager.undo()
+    assert data_manager.get_data()["value"] == 2
+    _push_values(data_manager, [5])
+    assert _values(data_manager) == [2, 5]
+    data_manager.undo()
+    assert data_manager.get_data()["value"] == 2
+
+
+def test_merge_pushes_editing_the_same_node(clock):
+    initial = pmap({"a": pmap({"x": 0, "y": 0}), "b": 0})
+    data_manager = DataManager(initial, merge_interval=1.0)
+
+    def push(path, value):
+        clock.now += 0.5
+        data_manager.push_data(set_in(data_manager.get_data(),
+                                      [(path, value)]))
+
+    push(("a", "x"), 1)
+    push(("a", "x"), 2)
+    push(("a",), pmap({"x": 3, "y": 3}))
+    push(("a", "y"), 4)
+    assert len(data_manager.history) == 2
+    # An unrelated node, right after.
+    push(("b",), 1)
+    push(("a", "x"), 5)
+    assert len(data_manager.history) == 4
+    # The same node, too late.
+    clock.now += 1
+    push(("a", "x"), 6)
+    assert len(data_manager.history) == 5
+    assert [each["a"]["x"] for each in data_manager.history] == [
+        0, 3, 3, 5, 6]
+
+
+def test_no_merge_after_undo(clock):
+    data_manager = DataManager(pmap({"value": 0}), merge_interval=1.0)
+    _push_values(data_manager, [1, 2])
+    assert _values(data_manager) == [0, 2]
+    data_manager.undo()
+    data_manager.redo()
+    _push_values(data_manager, [3, 4])
+    assert _values(data_manager) == [0, 2, 4]
+
+
+def test_history_view_is_invalidated(clock):
+    data_manager = DataManager(pmap({"value": 0}), max_entries=3)
+    _push_values(data_manager, [1, 2])
+    history = data_manager.history
+    assert list(history) == list(data_manager.history)
+    data_manager.undo()
+    data_manager.redo()
+    assert history[-1]["value"] == 2
+    _push_values(data_manager, [3])
+    with pytest.raises(RuntimeError):
+        history[0]
+    history = data_manager.history
+    data_manager.undo()
+    _push_values(data_manager, [4])
+    with pytest.raises(RuntimeError):
+        len(history)
+
+
+def test_transaction_is_one_history_entry():
+    data_manager = DataManager(pmap({"value": 0}))
+    changes = []
+    data_manager.add_change_listener(lambda: changes.append(
+        data_manager.get_data()["value"]))
+    with data_manager.transaction():
+        _push_values(data_manager, [1, 2])
+        assert data_manager.get_data()["value"] == 2
+        assert _values(data_manager) == [0]
+    assert _values(data_manager) == [0, 2]
+    assert changes == [2]
+
+
+def test_transaction_rolls_back_on_exception():
+    data_manager = DataManager(pmap({"value": 0}))
+    with pytest.raises(ValueError):
+        with data_manager.transaction():
+            _push_values(data_manager, [1])
+            raise ValueError()
+    assert data_manager.get_data()["value"] == 0
+    assert _values(data_manager) == [0]
+
+
+def test_nested_transaction_rolls_back_its_own_pushes():
+    data_manager = DataManager(pmap({"value": 0}))
+    with data_manager.transaction():
+        _push_values(data_manager, [1])
+        with pytest.raises(ValueError):
+            with data_manager.transaction():
+                _push_values(data_manager, [2])
+                raise ValueError()
+        assert data_manager.get_data()["value"] == 1
+        with data_manager.transaction():
+            _push_values(data_manager, [3])
+        assert _values(data_manager) == [0]
+    assert _values(data_manager) == [0, 3]
+
+
+def test_no_undo_inside_a_transaction():
+    data_manager = DataManager(pmap({"value": 0}))
+    _push_values(data_manager, [1])
+    with data_manager.transaction():
+        with pytest.raises(RuntimeError):
+            data_manager.undo()
+        with pytest.raises(RuntimeError):
+            data_manager.redo()
+    assert _values(data_manager) == [0, 1]
+
+
+
+class Point(InternedRecord):
+    x = field(initial=0)
+    y = field(initial=0)
+
+
+class OtherPoint(InternedRecord):
+    x = field(initial=0)
+    y = field(initial=0)
+
+
+def test_equal_interned_records_are_one_object():
+    point = Point(x=1, y=2)
+    assert Point(x=1, y=2) is point
+    assert Point(x=1).set("y", 2) is point
+    assert point.set("x", 3).set("x", 1) is point
+    evolver = Point().evolver()
+    evolver["x"] = 1
+    evolver["y"] = 2
+    assert evolver.persistent() is point
+    assert Point.create({"x": 1, "y": 2}) is point
+    assert pickle.loads(pickle.dumps(point)) is point
+    assert OtherPoint(x=1, y=2) is not point
+    assert Point(x=1, y=3) is not point
+
+
+def test_intern_pool_forgets_dead_values():
+    pool = InternPool()
+    value = pmap({"x": 1})
+    assert pool.intern(value) is value
+    assert pool.intern(pmap({"x": 1})) is value
+    assert (pool.hits, pool.misses) == (1, 1)
+    assert len(pool) == 1
+    del value
+    gc.collect()
+    assert len(pool) == 0
+
+
+def test_intern_string():
+    value = "".join(["intern", "ed"])
+    assert intern_string(value) is intern_string("interned")
+    assert intern_string(None) is None
+
+
+def _shared_history(storage=None):
+    big = pmap({i: pmap({"value": i}) for i in range(50)})
+    data_manager = DataManager(pmap({"big": big, "value": 0}),
+                               storage=storage)
+    _push_values(data_manager, [1, 2])
+    return data_manager
+
+
+def test_memory_report_counts_shared_nodes_once():
+    data_manager = _shared_history()
+    report = data_manager.memory_report()
+    entries = report.entries
+    assert [entry.index for entry in entries] == [0, 1, 2]
+    assert {entry.kind for entry in entries} == {"snapshot"}
+    assert report.history_entries == 3
+    assert report.disk_bytes == 0
+    # The later entries only add their root.
+    assert entries[0].nodes == 52
+    assert [entry.new_nodes for entry in entries] == [52, 1, 1]
+    assert report.unique_nodes == 54
+    assert report.shared_nodes == 3*52-54
+    assert report.unique_bytes == sum(entry.new_bytes for entry in entries)
+    assert report.total_bytes == sum(entry.bytes for entry in entries)
+    assert report.total_bytes > 2*report.unique_bytes
+    assert sum(report.bytes_by_type.values()) == report.unique_bytes
+    assert entries[1].timestamp == data_manager.get_history_info(1).timestamp
+
+
+def test_memory_report_of_keyframes_and_deltas():
+    data_manager = _shared_history(KeyframeHistoryStorage(keyframe_interval=8,
+                                                          pin_window=0))
+    kinds = [(entry.index, entry.kind)
+             for entry in data_manager.memory_report().entries]
+    assert (0, "keyframe") in kinds
+    assert (1, "delta") in kinds
+    assert (2, "pinned") in kinds
+
+
+def test_memory_report_of_a_segment_file(tmp_path):
+    storage = SegmentHistoryStorage(str(tmp_path/"history"), hot_window=0)
+    data_manager = _shared_history(storage)
+    try:
+        report = data_manager.memory_report()
+        assert report.disk_bytes == storage.get_disk_bytes() > 0
+        assert report.history_entries == 3
+    finally:
+        data_manager.close()
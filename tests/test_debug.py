@@ -0,0 +1,79 @@
+from pyrsistent import pmap
+
+from framework.debug import generate_view_data
+from framework.view import ViewBase
+
+
+class LeafView(ViewBase):
+    def _create_widget(self):
+        return None
+
+
+class ParentView(ViewBase):
+    def _create_widget(self):
+        return None
+
+    def _create_child_view(self):
+        self.child = self.bind_child_view(LeafView(),
+                                          lambda data: data["child"])
+        self.children = self.bind_keyed_children(
+            lambda data: data["keyed"],
+            lambda key, value: LeafView())
+
+
+def _iter_views(view):
+    yield view
+    for child_view in view.iter_child_view():
+        for each in _iter_views(child_view):
+            yield each
+
+
+def test_generate_view_data_mirrors_the_view_tree():
+    view = ParentView()
+    view.try_refresh(pmap({"child": 0, "keyed": pmap({1: "a", 2: "b"})}))
+    view_data = generate_view_data(view, None)
+    assert view_data.id_ == id(view)
+    assert view_data.name == "ParentView"
+    assert [child.data for child in view_data.child_views] == [0, "a", "b"]
+    assert not any(each._debug_dirty for each in _iter_views(view))
+
+
+def test_clean_subtrees_are_reused():
+    view = ParentView()
+    data = pmap({"child": 0, "keyed": pmap({1: "a", 2: "b"})})
+    view.try_refresh(data)
+    view_data = generate_view_data(view, None)
+    assert generate_view_data(view, view_data) is view_data
+    view.try_refresh(data.set("keyed", data["keyed"].set(2, "c")))
+    assert not view.child._debug_dirty
+    assert view.children.get(2)._debug_dirty
+    assert view._debug_dirty
+    new_view_data = generate_view_data(view, view_data)
+    assert new_view_data is not view_data
+    old_children = view_data.child_views
+    new_children = new_view_data.child_views
+    assert new_children[0] is old_children[0]
+    assert new_children[1] is old_children[1]
+    assert new_children[2].data == "c"
+
+
+def test_added_and_removed_children_are_followed():
+    view = ParentView()
+    data = pmap({"child": 0, "keyed": pmap({1: "a"})})
+    view.try_refresh(data)
+    view_data = generate_view_data(view, None)
+    view.try_refresh(data.set("keyed", pmap({1: "a", 2: "b"})))
+    view_data = generate_view_data(view, view_data)
+    assert [child.data for child in view_data.child_views] == [0, "a", "b"]
+    view.try_refresh(data.set("keyed", pmap({2: "b"})))
+    view_data = generate_view_data(view, view_data)
+    assert [child.data for child in view_data.child_views] == [0, "b"]
+
+
+def test_view_data_of_another_view_is_rebuilt():
+    view = ParentView()
+    view.try_refresh(pmap({"child": 0, "keyed": pmap()}))
+    other_view_data = generate_view_data(LeafView(), None)
+    view_data = generate_view_data(view, other_view_data)
+    assert view_data.id_ == id(view)
+    assert len(view_data.child_views) == 1
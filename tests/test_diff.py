@@ -0,0 +1,220 @@
+import random
+
+import pytest
+
+from framework import diff
+from framework.diff import DELETE
+from framework.diff import diff_stats
+from framework.diff import INSERT
+from framework.diff import list_diff
+from framework.diff import MOVE
+from framework.diff import STRATEGIES
+
+
+def _apply(old_list, moves):
+    result = list(old_list)
+    for index, operation, item in moves:
+        if operation == DELETE:
+            del result[index]
+        elif operation == INSERT:
+            result.insert(index, item)
+        else:
+            from_index, to_index = index
+            result.insert(to_index, result.pop(from_index))
+    return result
+
+
+def _check_order(moves):
+    # Deletes in descending order, then moves, then ascending inserts.
+    operations = [operation for _, operation, _ in moves]
+    assert operations == sorted(operations)
+    deletes = [index for index, operation, _ in moves if operation == DELETE]
+    inserts = [index for index, operation, _ in moves if operation == INSERT]
+    assert deletes == sorted(deletes, reverse=True)
+    assert inserts == sorted(inserts)
+
+
+def _lcs_length(old_list, new_list):
+    lengths = [0]*(len(new_list)+1)
+    for old_item in old_list:
+        previous = 0
+        for j, new_item in enumerate(new_list):
+            current = lengths[j+1]
+            if old_item == new_item:
+                lengths[j+1] = previous+1
+            else:
+                lengths[j+1] = max(lengths[j+1], lengths[j])
+            previous = current
+    return lengths[-1]
+
+
+def _random_lists(rand, unique, keys):
+    if unique:
+        old_list = rand.sample(keys, rand.randrange(len(keys)))
+        new_list = [key for key in old_list if rand.random() < 0.8]
+        if rand.random() < 0.3:
+            rand.shuffle(new_list)
+        for key in keys:
+            if key not in old_list and rand.random() < 0.2:
+                new_list.insert(rand.randrange(len(new_list)+1), key)
+    else:
+        old_list = [rand.choice(keys) for _ in range(rand.randrange(12))]
+        new_list = [rand.choice(keys) for _ in range(rand.randrange(12))]
+    return old_list, new_list
+
+
+CASES = [
+    ([], []),
+    ([], [1, 2]),
+    ([1, 2], []),
+    ([1, 2, 3], [1, 2, 3]),
+    ([1, 2, 6, 2, 4], [1, 2, 5, 2, 4]),
+    ([1, 1, 2, 2], [2, 1, 2, 1]),
+    (["a", "b", "c"], ["c", "a", "b", "d"]),
+    ([1, 2, 3, 4], [4, 1, 2, 3]),
+]
+
+
+@pytest.mark.parametrize("strategy", STRATEGIES)
+@pytest.mark.parametrize("old_list,new_list", CASES)
+def test_cases(strategy, old_list, new_list):
+    moves = list_diff(old_list, new_list, None, strategy)
+    assert _apply(old_list, moves) == new_list
+    _check_order(moves)
+
+
+@pytest.mark.parametrize("strategy", STRATEGIES)
+@pytest.mark.parametrize("unique", [True, False])
+@pytest.mark.parametrize("keys", [list(range(10)), list("abcdefghij")])
+def test_random_lists(strategy, unique, keys):
+    rand = random.Random(strategy+str(unique)+str(keys[0]))
+    for _ in range(300):
+        old_list, new_list = _random_lists(rand, unique, keys)
+        moves = list_diff(old_list, new_list, None, strategy)
+        assert _apply(old_list, moves) == new_list
+        _check_order(moves)
+
+
+@pytest.mark.parametrize("strategy", STRATEGIES)
+def test_get_key(strategy):
+    old_list = [{"id": i, "value": i} for i in range(5)]
+    new_list = [{"id": i, "value": -i} for i in [3, 0, 1, 5, 4]]
+    moves = list_diff(old_list, new_list, lambda item: item["id"], strategy)
+    result = _apply(old_list, moves)
+    assert [item["id"] for item in result] == [3, 0, 1, 5, 4]
+    # Only inserted items come from new_list, kept ones are not replaced.
+    inserted = [item for _, operation, item in moves if operation == INSERT]
+    assert {"id": 5, "value": -5} in inserted
+
+
+def test_unknown_strategy():
+    with pytest.raises(ValueError):
+        list_diff([1], [2], None, "unknown")
+
+
+def test_keyed_rotation_is_one_move():
+    moves = list_diff([1, 2, 3, 4], [4, 1, 2, 3], None, "keyed")
+    assert moves == [((3, 0), MOVE, 4)]
+
+
+def test_keyed_moves_are_minimal():
+    rand = random.Random(0)
+    for _ in range(200):
+        old_list = list(range(rand.randrange(1, 20)))
+        new_list = list(old_list)
+        rand.shuffle(new_list)
+        moves = list_diff(old_list, new_list, None, "keyed")
+        assert _apply(old_list, moves) == new_list
+        # Everything but a longest common subsequence has to move.
+        stats = diff_stats(moves)
+        assert stats["move"] == len(old_list)-_lcs_length(old_list, new_list)
+        assert stats["delete"] == stats["insert"] == 0
+
+
+def test_keyed_falls_back_for_duplicate_keys():
+    moves = list_diff([1, 1, 2], [2, 1, 1], None, "keyed")
+    assert _apply([1, 1, 2], moves) == [2, 1, 1]
+    assert diff_stats(moves)["move"] == 0
+
+
+@pytest.mark.parametrize("unique", [True, False])
+def test_myers_is_minimal(unique):
+    rand = random.Random(1)
+    for _ in range(300):
+        old_list, new_list = _random_lists(rand, unique, list(range(8)))
+        moves = list_diff(old_list, new_list, None, "myers")
+        common = _lcs_length(old_list, new_list)
+        stats = diff_stats(moves)
+        assert stats["delete"] == len(old_list)-common
+        assert stats["insert"] == len(new_list)-common
+
+
+def test_fenwick_tree():
+    tree = diff._FenwickTree(8, [1, 3, 4])
+    sums = [tree.prefix_sum(i) for i in range(9)]
+    assert sums == [0, 0, 1, 1, 2, 3, 3, 3, 3]
+    tree.add(3, -1)
+    tree.add(7, 1)
+    sums = [tree.prefix_sum(i) for i in range(9)]
+    assert sums == [0, 0, 1, 1, 1, 2, 2, 2, 3]
+
+
+@pytest.fixture
+def numpy_path(monkeypatch):
+    pytest.importorskip("numpy")
+    monkeypatch.setattr(diff, "NUMPY_THRESHOLD", 0)
+
+
+def _python_diff(monkeypatch, old_list, new_list, strategy):
+    with monkeypatch.context() as context:
+        context.setattr(diff, "numpy", None)
+        return list_diff(old_list, new_list, None, strategy)
+
+
+@pytest.mark.parametrize("strategy", STRATEGIES)
+@pytest.mark.parametrize("keys", [list(range(30)),
+                                  [str(i) for i in range(30)]])
+def test_numpy_matches_python(numpy_path, monkeypatch, strategy, keys):
+    rand = random.Random(strategy+str(keys[1]))
+    for _ in range(200):
+        old_list, new_list = _random_lists(rand, True, keys)
+        moves = list_diff(old_list, new_list, None, strategy)
+        assert _apply(old_list, moves) == new_list
+        _check_order(moves)
+        if strategy == "heuristic":
+            continue
+        expected = _python_diff(monkeypatch, old_list, new_list, strategy)
+        if [k for k in old_list if k in new_list] == [
+                k for k in new_list if k in old_list]:
+            # Nothing moved, there is one minimal edit script.
+            assert moves == expected
+        else:
+            assert diff_stats(moves) == diff_stats(expected)
+
+
+@pytest.mark.parametrize("old_list,new_list", [
+    # Duplicate keys between the common prefix and suffix.
+    ([0, 1, 1, 2, 9], [0, 2, 1, 1, 9]),
+    # Mixed and object keys.
+    ([0, "a", 1], [0, 1, "a"]),
+    ([(0,), (1,)], [(1,), (0,)]),
+    # Different key types on each side.
+    ([0, 1], ["0", "1"]),
+    # Too big for int64.
+    ([2**70, 1], [1, 2**70]),
+])
+def test_numpy_falls_back(numpy_path, old_list, new_list):
+    assert diff.numpy_diff(old_list, new_list, None) is None
+    for strategy in STRATEGIES:
+        moves = list_diff(old_list, new_list, None, strategy)
+        assert _apply(old_list, moves) == new_list
+
+
+def test_without_numpy(monkeypatch):
+    monkeypatch.setattr(diff, "numpy", None)
+    monkeypatch.setattr(diff, "NUMPY_THRESHOLD", 0)
+    old_list = list(range(20))
+    new_list = old_list[5:]+old_list[:5]
+    for strategy in STRATEGIES:
+        moves = list_diff(old_list, new_list, None, strategy)
+        assert _apply(old_list, moves) == new_list
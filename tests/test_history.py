@@ -0,0 +1,181 @@
+import random
+
+import pytest
+from pyrsistent import pmap
+from pyrsistent import pvector
+
+from framework.data import HistoryEntryInfo
+from framework.history import KeyframeHistoryStorage
+from framework.history import ListHistoryStorage
+from framework.history import SegmentHistoryStorage
+
+
+STORAGES = {
+    "list": lambda path: ListHistoryStorage(),
+    "keyframe": lambda path: KeyframeHistoryStorage(),
+    "keyframe_small": lambda path: KeyframeHistoryStorage(keyframe_interval=3,
+                                                          cache_size=1,
+                                                          pin_window=1),
+    "segment": lambda path: SegmentHistoryStorage(path),
+    "segment_small": lambda path: SegmentHistoryStorage(path,
+                                                        hot_window=2,
+                                                        keyframe_interval=3,
+                                                        cache_size=1),
+}
+
+
+@pytest.fixture(params=sorted(STORAGES))
+def create_storage(request, tmp_path):
+    return lambda: STORAGES[request.param](str(tmp_path/"history"))
+
+
+def _edit(rand, data):
+    items = data["items"]
+    operation = rand.random()
+    if operation < 0.5 and items:
+        index = rand.randrange(len(items))
+        items = items.set(index, items[index].set("value", rand.random()))
+    elif operation < 0.7:
+        items = items.append(pmap({"value": rand.random()}))
+    elif operation < 0.8 and items:
+        items = items[:-1]
+    elif operation < 0.9:
+        return data.set("map", data["map"].set(rand.randrange(20),
+                                               rand.random()))
+    else:
+        return data.set("map", data["map"].discard(rand.randrange(20)))
+    return data.set("items", items)
+
+
+def _check(storage, reference):
+    assert len(storage) == len(reference)
+    for index in range(len(reference)):
+        assert storage[index] == reference[index]
+        assert storage.get_info(index) == reference.get_info(index)
+    assert storage.get_cursor() == reference.get_cursor()
+
+
+def _run(storage, reference, rand, steps, reopen=None):
+    data = pmap({"items": pvector(), "map": pmap()})
+    for each in (storage, reference):
+        each.append(data, HistoryEntryInfo())
+    for step in range(steps):
+        operation = rand.random()
+        length = len(reference)
+        if operation < 0.6:
+            if rand.random() < 0.8:
+                data = _edit(rand, reference[length-1])
+            else:
+                data = _edit(rand, reference[rand.randrange(length)])
+            info = HistoryEntryInfo(size=step)
+            storage.append(data, info)
+            reference.append(data, info)
+        elif operation < 0.7 and length > 1:
+            storage.pop()
+            reference.pop()
+        elif operation < 0.75 and length > 1:
+            new_length = rand.randrange(1, length)
+            storage.truncate(new_length)
+            reference.truncate(new_length)
+        elif operation < 0.82 and length > 1:
+            count = rand.randrange(1, length)
+            storage.evict(count)
+            reference.evict(count)
+        elif operation < 0.85:
+            index = rand.randrange(length)
+            info = HistoryEntryInfo(size=-step)
+            storage.set_info(index, info)
+            reference.set_info(index, info)
+        elif operation < 0.95 or reopen is None:
+            cursor = (rand.randrange(length), rand.random() < 0.5)
+            storage.set_cursor(*cursor)
+            reference.set_cursor(*cursor)
+        else:
+            storage.close()
+            storage = reopen()
+        assert len(storage) == len(reference)
+        last = len(reference)-1
+        for index in rand.sample(range(last+1), min(3, last+1))+[last]:
+            assert storage[index] == reference[index]
+            assert storage.get_info(index) == reference.get_info(index)
+    return storage
+
+
+@pytest.mark.parametrize("seed", range(10))
+def test_round_trip(create_storage, seed):
+    reference = ListHistoryStorage()
+    storage = _run(create_storage(), reference, random.Random(seed), 200)
+    try:
+        _check(storage, reference)
+    finally:
+        storage.close()
+
+
+def test_keyframe_keeps_snapshots_near_the_cursor():
+    storage = KeyframeHistoryStorage(keyframe_interval=4, pin_window=2)
+    pushed = []
+    data = pmap({"items": pvector(), "map": pmap()})
+    rand = random.Random(0)
+    for _ in range(20):
+        data = _edit(rand, data)
+        pushed.append(data)
+        storage.append(data, HistoryEntryInfo())
+    storage.set_cursor(len(pushed)-1, True)
+    assert storage[len(pushed)-1] is pushed[-1]
+    assert storage[len(pushed)-2] is pushed[-2]
+    storage.pop()
+    assert storage[len(storage)-1] is pushed[-2]
+    storage.truncate(len(storage)-1)
+    assert storage[len(storage)-1] is pushed[-3]
+    assert storage[0] == pushed[0]
+
+
+@pytest.mark.parametrize("seed", range(10))
+@pytest.mark.parametrize("hot_window,keyframe_interval", [(0, 1), (2, 3),
+                                                          (16, 32)])
+def test_segment_reopen(tmp_path, seed, hot_window, keyframe_interval):
+    path = str(tmp_path/"history")
+
+    def create_storage():
+        storage = SegmentHistoryStorage(path,
+                                        hot_window=hot_window,
+                                        keyframe_interval=keyframe_interval,
+                                        cache_size=2)
+        # Compact whenever half of the file is unused.
+        storage.MIN_COMPACT_SIZE = 0
+        return storage
+
+    reference = ListHistoryStorage()
+    storage = _run(create_storage(),
+                   reference,
+                   random.Random(seed),
+                   200,
+                   reopen=create_storage)
+    storage.close()
+    storage = create_storage()
+    try:
+        _check(storage, reference)
+    finally:
+        storage.close()
+
+
+def test_segment_compaction_bounds_the_file(tmp_path):
+    storage = SegmentHistoryStorage(str(tmp_path/"history"))
+    storage.MIN_COMPACT_SIZE = 0
+    try:
+        data = pmap({"items": pvector(), "map": pmap()})
+        rand = random.Random(0)
+        for _ in range(200):
+            data = _edit(rand, data)
+            storage.append(data, HistoryEntryInfo())
+            if len(storage) > 10:
+                storage.evict(len(storage)-10)
+        sizes = []
+        for _ in range(600):
+            data = _edit(rand, data)
+            storage.append(data, HistoryEntryInfo())
+            storage.evict(1)
+            sizes.append(storage.get_disk_bytes())
+        assert max(sizes[-100:]) <= 2*max(sizes[:50])
+    finally:
+        storage.close()
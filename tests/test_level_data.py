@@ -0,0 +1,26 @@
+import pickle
+
+from pyrsistent import pmap
+
+from level.data import HouseData
+from level.data import LevelData
+from level.data import TreeData
+
+
+def _objects(selected):
+    return pmap({1: TreeData(id_=1, is_selected=1 in selected),
+                 2: HouseData(id_=2, is_selected=2 in selected)})
+
+
+def test_create_looks_the_selected_id_up_when_missing():
+    assert LevelData.create({"objects": _objects([2])}).selected_id == 2
+    assert LevelData.create({"objects": _objects([])}).selected_id is None
+    # Pickles written before selected_id existed are restored with create.
+    data = LevelData.create({"objects": _objects([1])}, _factory_fields=set())
+    assert data.selected_id == 1
+
+
+def test_create_keeps_the_selected_id():
+    data = LevelData(objects=_objects([1]), selected_id=1)
+    assert LevelData.create(data.serialize()) == data
+    assert pickle.loads(pickle.dumps(data)) == data
@@ -0,0 +1,217 @@
+import random
+
+import pytest
+from pyrsistent import pmap
+from pyrsistent import pvector
+from PySide6 import QtWidgets
+
+from framework.view import ListViewBase
+from framework.view import ViewBase
+from framework.view import VirtualListViewBase
+
+
+pytestmark = pytest.mark.usefixtures("qt_app")
+
+
+class ItemView(ViewBase):
+    def __init__(self, submit_data_callback=None):
+        super(ItemView, self).__init__(submit_data_callback)
+        self.refreshed = []
+
+    def _create_widget(self):
+        return QtWidgets.QListWidgetItem()
+
+    def refresh(self, data):
+        self.refreshed.append(data)
+        self.widget.setText(str(data["value"]))
+
+
+class ItemListView(ListViewBase):
+    def __init__(self, submit_data_callback=None):
+        super(ItemListView, self).__init__(ItemView, submit_data_callback)
+
+    def _generate_key_list(self, data):
+        return [item["key"] for item in data]
+
+    def _get_data_at(self, index, key, data_collection):
+        return data_collection[index]
+
+    def _get_element_path(self, index, key):
+        return (index,)
+
+
+def _items(keys):
+    return pvector(pmap({"key": key, "value": 0}) for key in keys)
+
+
+def _rows(view):
+    return [view.widget.item(i).text() for i in range(view.widget.count())]
+
+
+def test_find_row_indexes_lazily():
+    view = ItemListView()
+    items = _items(range(100))
+    view.try_refresh(items)
+    # Only the inserted row is looked up to refresh it.
+    view.try_refresh(_items([-1])+items)
+    assert view._row_index_valid_upto == 1
+    assert view._find_row(49) == 50
+    assert view._row_index_valid_upto == 51
+    assert view._find_row(9) == 10
+    assert view._row_index_valid_upto == 51
+    assert view._find_row(1000) is None
+    assert view._row_index_valid_upto == 101
+
+
+def test_row_index_follows_the_rows():
+    rand = random.Random(0)
+    view = ItemListView()
+    keys = []
+    for _ in range(50):
+        keys = rand.sample(range(30), rand.randrange(30))
+        if keys and rand.random() < 0.3:
+            # Duplicate keys map to their first row.
+            keys.insert(rand.randrange(len(keys)), rand.choice(keys))
+        view.try_refresh(_items(keys))
+        for key in rand.sample(keys, min(5, len(keys)))+[100]:
+            expected = keys.index(key) if key in keys else None
+            assert view._find_row(key) == expected
+        element_views = view._current_element_view_list
+        for row in rand.sample(range(len(keys)), min(5, len(keys))):
+            assert view._get_element_view_index(element_views[row]) == row
+    assert view._current_key_list == keys
+
+
+def test_only_changed_rows_are_refreshed():
+    view = ItemListView()
+    items = _items(range(5))
+    view.try_refresh(items)
+    element_views = list(view._current_element_view_list)
+    assert [len(each.refreshed) for each in element_views] == [1]*5
+    changed = items[3].set("value", 1)
+    # Moving a row doesn't refresh it, its data is the same.
+    items = pvector([items[4], items[0], items[1], items[2], changed])
+    view.try_refresh(items)
+    assert [len(each.refreshed) for each in element_views] == [1, 1, 1, 2, 1]
+    assert element_views[3].refreshed[-1] is changed
+    assert view._current_element_view_list[0] is element_views[4]
+    view.try_refresh(items.append(pmap({"key": 5, "value": 2})))
+    new_view = view._current_element_view_list[-1]
+    assert new_view.refreshed == [pmap({"key": 5, "value": 2})]
+    assert [len(each.refreshed) for each in element_views] == [1, 1, 1, 2, 1]
+    assert _rows(view) == ["0", "0", "0", "0", "1", "2"]
+
+
+class PooledItemListView(ItemListView):
+    ELEMENT_VIEW_POOL_SIZE = 2
+
+
+def test_removed_row_views_are_reused_up_to_the_pool_size():
+    view = PooledItemListView()
+    view.try_refresh(_items(range(5)))
+    removed = view._current_element_view_list[1:5]
+    view.try_refresh(_items([0]))
+    assert view.get_element_view_pool_stats()["size"] == 2
+    view.try_refresh(_items([0, 5, 6, 7]))
+    new_views = view._current_element_view_list[1:]
+    # Rows are deleted from the end, the views of the first two removed rows
+    # were released last and kept.
+    assert set(new_views[:2]) == set(removed[:2])
+    assert new_views[2] not in removed
+    # The first five rows missed too.
+    assert view.get_element_view_pool_stats() == {"hits": 2,
+                                                  "misses": 6,
+                                                  "size": 0}
+    assert _rows(view) == ["0", "0", "0", "0"]
+    assert [each.get_current_data()["key"] for each in new_views] == [5, 6, 7]
+
+class WidgetItemView(ViewBase):
+    created = 0
+
+    def __init__(self, submit_data_callback=None):
+        super(WidgetItemView, self).__init__(submit_data_callback)
+        WidgetItemView.created += 1
+        self.refreshed = []
+
+    def _create_widget(self):
+        return QtWidgets.QLabel()
+
+    def refresh(self, data):
+        self.refreshed.append(data)
+        self.widget.setText(str(data["key"]))
+
+
+class ItemVirtualListView(VirtualListViewBase):
+    def __init__(self, submit_data_callback=None):
+        super(ItemVirtualListView, self).__init__(WidgetItemView,
+                                                  submit_data_callback)
+
+    def _generate_key_list(self, data):
+        return [item["key"] for item in data]
+
+    def _get_data_at(self, index, key, data_collection):
+        return data_collection[index]
+
+    def _get_element_path(self, index, key):
+        return (index,)
+
+
+@pytest.fixture
+def virtual_list_view():
+    WidgetItemView.created = 0
+    view = ItemVirtualListView()
+    view.widget.resize(200, 300)
+    view.widget.show()
+    yield view
+    view.widget.close()
+
+
+def _check_materialized(view, items):
+    for row, element_view in view._row_views.items():
+        assert element_view.get_current_data() is items[row]
+        assert element_view.widget.isVisible()
+
+
+def test_only_visible_rows_are_materialized(virtual_list_view):
+    view = virtual_list_view
+    items = _items(range(1000))
+    view.try_refresh(items)
+    rows = sorted(view._row_views)
+    assert rows[0] == 0
+    assert 0 < len(rows) < 100
+    assert rows == list(range(len(rows)))
+    assert WidgetItemView.created == len(rows)
+    _check_materialized(view, items)
+
+
+def test_scrolled_out_views_are_reused(virtual_list_view):
+    view = virtual_list_view
+    items = _items(range(1000))
+    view.try_refresh(items)
+    count = len(view._row_views)
+    scroll_bar = view.widget.verticalScrollBar()
+    first_rows = []
+    for value in [scroll_bar.maximum()//2, scroll_bar.maximum(), 0]:
+        scroll_bar.setValue(value)
+        view._update_visible_rows()
+        _check_materialized(view, items)
+        first_rows.append(min(view._row_views))
+    assert 0 < first_rows[0] < first_rows[1]
+    assert first_rows[2] == 0
+    assert WidgetItemView.created <= count+2*view.OVERSCAN
+
+
+def test_views_keep_their_key(virtual_list_view):
+    view = virtual_list_view
+    items = _items(range(1000))
+    view.try_refresh(items)
+    views_by_key = {element_view.get_current_data()["key"]: element_view
+                    for element_view in view._row_views.values()}
+    items = _items([-1])+items.delete(3)
+    view.try_refresh(items)
+    _check_materialized(view, items)
+    for element_view in view._row_views.values():
+        key = element_view.get_current_data()["key"]
+        if key in views_by_key and key != -1:
+            assert element_view is views_by_key[key]
+            assert len(element_view.refreshed) == 1
@@ -0,0 +1,125 @@
+import random
+
+import pytest
+from pyrsistent import PMap
+from pyrsistent import pmap
+from pyrsistent import PVector
+from pyrsistent import pvector
+
+from framework.path import APPEND
+from framework.path import changed_indices
+from framework.path import changed_keys
+from framework.path import diff_paths
+from framework.path import get_in
+from framework.path import REMOVED
+from framework.path import set_in
+
+
+def _random_value(rand, depth):
+    kind = rand.random()
+    if depth <= 0 or kind < 0.4:
+        return rand.choice([rand.randrange(5), str(rand.randrange(5)), None])
+    if kind < 0.7:
+        return pvector(_random_value(rand, depth-1)
+                       for _ in range(rand.randrange(4)))
+    return pmap({rand.randrange(6): _random_value(rand, depth-1)
+                 for _ in range(rand.randrange(4))})
+
+
+def _random_edit(rand, data, depth):
+    """Return data with a few nodes changed, sharing the others."""
+    if isinstance(data, PVector) and data and rand.random() < 0.7:
+        operation = rand.random()
+        if operation < 0.2:
+            return data.append(_random_value(rand, depth))
+        if operation < 0.3:
+            return data[:rand.randrange(len(data))]
+        index = rand.randrange(len(data))
+        return data.set(index, _random_edit(rand, data[index], depth-1))
+    if isinstance(data, PMap) and rand.random() < 0.7:
+        key = rand.randrange(6)
+        operation = rand.random()
+        if operation < 0.2:
+            return data.discard(key)
+        if key in data:
+            return data.set(key, _random_edit(rand, data[key], depth-1))
+        return data.set(key, _random_value(rand, depth))
+    return _random_value(rand, depth)
+
+
+@pytest.mark.parametrize("seed", range(200))
+def test_set_in_diff_paths_round_trip(seed):
+    rand = random.Random(seed)
+    old_data = _random_value(rand, 4)
+    new_data = old_data
+    for _ in range(rand.randrange(1, 4)):
+        new_data = _random_edit(rand, new_data, 4)
+    changes = diff_paths(old_data, new_data)
+    assert set_in(old_data, changes) == new_data
+    assert diff_paths(new_data, new_data) == []
+
+
+def test_diff_paths_skips_shared_subtrees():
+    shared = pmap({"a": pvector([1, 2, 3])})
+    old_data = pmap({"shared": shared, "value": 1})
+    new_data = old_data.set("value", 2)
+    assert diff_paths(old_data, new_data) == [(("value",), 2)]
+
+
+def test_set_in_applies_updates_in_order():
+    data = pmap({"a": pmap({"b": 1, "c": 2}), "d": pvector([1, 2])})
+    result = set_in(data, [
+        (("a", "b"), 10),
+        (("a", "b"), 11),
+        (("a", "c"), REMOVED),
+        (("d", 2), 3),
+    ])
+    assert result == pmap({"a": pmap({"b": 11}), "d": pvector([1, 2, 3])})
+    assert get_in(result, ("a", "b")) == 11
+
+
+def test_set_in_empty_path_replaces_the_updates_before():
+    data = pmap({"a": 1})
+    replacement = pmap({"b": 2})
+    result = set_in(data, [(("a",), 3), ((), replacement), (("c",), 4)])
+    assert result == pmap({"b": 2, "c": 4})
+    assert set_in(data, [((), replacement)]) is replacement
+
+
+def test_set_in_keeps_untouched_nodes():
+    data = pmap({"a": pmap({"x": 1}), "b": pmap({"y": 2})})
+    result = set_in(data, [(("a", "x"), 3)])
+    assert result["b"] is data["b"]
+
+
+def test_set_in_resolves_append_and_callable_keys():
+    data = pmap({"items": pvector([pmap({"id": "a", "done": False})])})
+    result = set_in(data, [
+        (("items", APPEND), pmap({"id": "b", "done": False})),
+        (("items", APPEND), pmap({"id": "c", "done": False})),
+    ])
+    assert [item["id"] for item in result["items"]] == ["a", "b", "c"]
+
+    def find_b(items):
+        return [item["id"] for item in items].index("b")
+
+    result = set_in(result, [(("items", find_b, "done"), True)])
+    assert [item["done"] for item in result["items"]] == [False, True, False]
+    assert get_in(result, ("items", find_b, "id")) == "b"
+
+
+@pytest.mark.parametrize("size", [3, 1000])
+def test_changed_keys(size):
+    old_map = pmap({i: pmap({"value": i}) for i in range(size)})
+    new_map = old_map.set(1, pmap({"value": 1})).set(2, 2).remove(0)
+    assert sorted(changed_keys(old_map, new_map)) == [1, 2]
+    # Growing the map rebuilds its buckets.
+    new_map = new_map.update({size+i: i for i in range(size)})
+    assert sorted(changed_keys(old_map, new_map)) == [1, 2]+[
+        size+i for i in range(size)]
+
+
+def test_changed_indices():
+    old_vector = pvector([pmap({"value": i}) for i in range(100)])
+    new_vector = old_vector.set(3, pmap({"value": 3})).set(50, 0).append(1)
+    assert changed_indices(old_vector, new_vector) == [3, 50]
@@ -0,0 +1,96 @@
+import json
+
+import pytest
+
+from framework.profiler import Profiler
+
+
+class Owner(object):
+    pass
+
+
+def _record(profiler, owners):
+    for owner in owners:
+        with profiler.scope("outer", owner):
+            with profiler.scope("inner", owner):
+                pass
+            with profiler.scope("inner", owner):
+                pass
+
+
+@pytest.fixture
+def profiler():
+    profiler = Profiler()
+    yield profiler
+    profiler.stop()
+
+
+def test_stopped_profiler_records_nothing(profiler):
+    assert profiler.scope("outer") is profiler.scope("inner")
+    _record(profiler, [Owner()])
+    assert profiler.aggregate() == []
+
+
+def test_aggregate(profiler):
+    owners = [Owner(), Owner()]
+    profiler.start()
+    _record(profiler, owners)
+    entries = {entry.name: entry for entry in profiler.aggregate()}
+    assert entries["outer"].count == 2
+    assert entries["inner"].count == 4
+    assert entries["inner"].class_name == "Owner"
+    assert entries["inner"].instance is None
+    outer = entries["outer"]
+    assert outer.self_time == pytest.approx(
+        outer.total-entries["inner"].total)
+    assert outer.max <= outer.total
+    by_instance = profiler.aggregate(by_instance=True)
+    assert len(by_instance) == 4
+    assert {entry.instance for entry in by_instance} == {
+        id(owner) for owner in owners}
+    profiler.clear()
+    assert profiler.aggregate() == []
+
+
+def test_allocations(profiler):
+    profiler.start(trace_allocations=True)
+    with profiler.scope("alloc"):
+        kept = [object() for _ in range(10000)]
+    entry = profiler.aggregate()[0]
+    assert entry.alloc > 0
+    assert entry.class_name == "NoneType"
+    assert len(kept) == 10000
+
+
+def test_format_table(profiler):
+    profiler.start()
+    _record(profiler, [Owner()])
+    lines = profiler.format_table().splitlines()
+    assert lines[0].split() == ["phase", "count", "total", "ms", "self",
+                                "ms", "max", "ms", "alloc", "B"]
+    assert sorted(line.split()[0] for line in lines[1:]) == [
+        "Owner.inner", "Owner.outer"]
+    assert len(profiler.format_table(limit=1).splitlines()) == 2
+    assert " 0x" in profiler.format_table(by_instance=True).splitlines()[1]
+
+
+def test_chrome_trace(profiler, tmp_path):
+    owner = Owner()
+    profiler.start()
+    _record(profiler, [owner])
+    path = str(tmp_path/"trace.json")
+    profiler.export_chrome_trace(path)
+    with open(path) as f:
+        trace = json.load(f)
+    events = trace["traceEvents"]
+    assert [event["name"] for event in events] == [
+        "Owner.inner", "Owner.inner", "Owner.outer"]
+    outer = events[-1]
+    assert outer["ph"] == "X"
+    assert outer["cat"] == "outer"
+    assert outer["args"]["instance"] == "{0:#x}".format(id(owner))
+    # Nested scopes are inside their parent.
+    for inner in events[:2]:
+        assert outer["ts"] <= inner["ts"]
+        assert inner["ts"]+inner["dur"] <= outer["ts"]+outer["dur"]
+    assert outer["args"]["self_us"] <= outer["dur"]
@@ -0,0 +1,65 @@
+import pytest
+
+from framework.scheduler import RefreshScheduler
+from framework.scheduler import SubmitQueue
+
+
+pytestmark = pytest.mark.usefixtures("qt_app")
+
+
+def test_submit_queue_keeps_the_latest_submit_of_each_source():
+    queue = SubmitQueue()
+    submitted = []
+
+    def submit(source):
+        return lambda data, record: submitted.append((source, data, record))
+
+    queue.push("a", submit("a"), 1, False)
+    queue.push("b", submit("b"), 2, False)
+    queue.push("a", submit("a"), 3, False)
+    assert queue.has_pending("a")
+    queue.flush()
+    assert submitted == [("a", 3, False), ("b", 2, False)]
+    assert not queue.has_pending()
+
+
+def test_submit_queue_never_folds_a_recorded_submit():
+    queue = SubmitQueue()
+    submitted = []
+
+    def submit(data, record):
+        submitted.append((data, record))
+
+    queue.push("a", submit, 1, True)
+    queue.push("a", submit, 2, False)
+    assert submitted == [(1, True)]
+    queue.flush("a")
+    assert submitted == [(1, True), (2, False)]
+
+
+def test_scheduler_runs_visible_tasks_by_priority():
+    scheduler = RefreshScheduler()
+    ran = []
+    scheduler.add_task(lambda: ran.append("low"),
+                       priority=RefreshScheduler.PRIORITY_SECONDARY)
+    scheduler.add_task(lambda: ran.append("main"),
+                       priority=RefreshScheduler.PRIORITY_MAIN)
+    scheduler.add_task(lambda: ran.append("hidden"),
+                       is_visible=lambda: False)
+    scheduler.run_now()
+    assert ran == ["main", "low"]
+
+
+def test_scheduler_only_runs_requested_tasks():
+    scheduler = RefreshScheduler()
+    ran = []
+    task = scheduler.add_task(lambda: ran.append("a"))
+    scheduler.add_task(lambda: ran.append("b"),
+                       priority=RefreshScheduler.PRIORITY_SECONDARY)
+    scheduler.run_now()
+    del ran[:]
+    scheduler.run_now()
+    assert ran == []
+    scheduler.request(task)
+    scheduler.run_now()
+    assert ran == ["a"]
@@ -0,0 +1,82 @@
+from pyrsistent import pmap
+from pyrsistent import pvector
+
+from framework.selector import Selector
+from framework.view import ViewBase
+
+
+class _Counter(object):
+    def __init__(self, fn):
+        self._fn = fn
+        self.calls = 0
+
+    def __call__(self, data):
+        self.calls += 1
+        return self._fn(data)
+
+
+def test_same_input_is_not_recomputed():
+    fn = _Counter(lambda data: data["items"][0])
+    selector = Selector(fn)
+    data = pmap({"items": pvector([1, 2])})
+    assert selector(data) == 1
+    assert selector(data) == 1
+    assert fn.calls == 1
+    assert selector(data.set("other", 0)) == 1
+    assert fn.calls == 2
+
+
+def test_only_the_paths_are_dependencies():
+    fn = _Counter(lambda data: pmap({"first": data["items"][0]}))
+    selector = Selector(fn, paths=[("items", 0)])
+    data = pmap({"items": pvector([pmap({"a": 1}), 2]), "other": 0})
+    result = selector(data)
+    assert selector(data.set("other", 1)) is result
+    assert selector(data.set("items", data["items"].set(1, 3))) is result
+    assert fn.calls == 1
+    data = data.set("items", data["items"].set(0, pmap({"a": 2})))
+    assert selector(data) == pmap({"first": pmap({"a": 2})})
+    assert fn.calls == 2
+
+
+def test_missing_paths_are_dependencies():
+    fn = _Counter(lambda data: data.get("value"))
+    selector = Selector(fn, paths=[("value",)])
+    assert selector(pmap()) is None
+    assert selector(pmap({"other": 1})) is None
+    assert fn.calls == 1
+    assert selector(pmap({"value": 1})) == 1
+    assert selector(pmap()) is None
+    assert fn.calls == 3
+
+
+class _CountingView(ViewBase):
+    def __init__(self, submit_data_callback=None):
+        super(_CountingView, self).__init__(submit_data_callback)
+        self.try_refresh_calls = 0
+
+    def _create_widget(self):
+        return None
+
+    def try_refresh(self, new_data):
+        self.try_refresh_calls += 1
+        super(_CountingView, self).try_refresh(new_data)
+
+
+class _ParentView(_CountingView):
+    def _create_child_view(self):
+        self.child = self.bind_child_view(
+            _CountingView(),
+            Selector(lambda data: data["child"], paths=[("child",)]))
+
+
+def test_view_skips_a_child_with_the_same_selected_data():
+    parent = _ParentView()
+    data = pmap({"child": pmap({"value": 0}), "other": 0})
+    parent.try_refresh(data)
+    assert parent.child.try_refresh_calls == 1
+    parent.try_refresh(data.set("other", 1))
+    assert parent.child.try_refresh_calls == 1
+    parent.try_refresh(data.set("child", pmap({"value": 1})))
+    assert parent.child.try_refresh_calls == 2
+    assert parent.child.get_current_data() == pmap({"value": 1})
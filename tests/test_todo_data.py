@@ -0,0 +1,56 @@
+import random
+
+import pytest
+from pyrsistent import pvector
+
+from framework.data import DataManager
+from todo.data import ColorHistoryProjection
+from todo.data import TodoAppData
+from todo.data import TodoItemData
+
+COLORS = ["#FFFFFF", "#FF0000", "#00FF00"]
+
+
+def _recompute(data_manager):
+    return [data.todo_list[0].color for data in data_manager.history
+            if data.todo_list]
+
+
+def _edit(rand, data):
+    todo_list = data.todo_list
+    if todo_list and rand.random() < 0.3:
+        return data.set("todo_list", todo_list[1:])
+    item = TodoItemData(done=False, content="", color=rand.choice(COLORS))
+    if todo_list and rand.random() < 0.5:
+        return data.set("todo_list", todo_list.set(0, item))
+    return data.set("todo_list", pvector([item])+todo_list)
+
+
+@pytest.mark.parametrize("seed", range(5))
+@pytest.mark.parametrize("max_entries", [None, 5])
+def test_color_history_matches_a_recompute(seed, max_entries):
+    rand = random.Random(seed)
+    data_manager = DataManager(TodoAppData(todo_list=pvector()),
+                               max_entries=max_entries)
+    projection = data_manager.add_projection(ColorHistoryProjection())
+    for _ in range(300):
+        operation = rand.random()
+        if operation < 0.6:
+            data_manager.push_data(_edit(rand, data_manager.get_data()),
+                                   record_in_history=rand.random() < 0.9)
+        elif operation < 0.8:
+            data_manager.undo()
+        else:
+            data_manager.redo()
+        assert list(projection.result) == _recompute(data_manager)
+
+
+def test_undo_gives_back_the_same_result():
+    data_manager = DataManager(TodoAppData(todo_list=pvector()))
+    projection = data_manager.add_projection(ColorHistoryProjection())
+    rand = random.Random(0)
+    data_manager.push_data(_edit(rand, data_manager.get_data()))
+    before = projection.result
+    data_manager.push_data(_edit(rand, data_manager.get_data()))
+    data_manager.undo()
+    assert projection.result is before
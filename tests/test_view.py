@@ -0,0 +1,163 @@
+from pyrsistent import pmap
+from pyrsistent import pvector
+
+from framework.data import DataManager
+from framework.path import APPEND
+from framework.scheduler import RefreshScheduler
+from framework.view import ElementViewPool
+from framework.view import ViewBase
+
+
+class RecordingView(ViewBase):
+    """A view without a widget recording the data it's refreshed with."""
+
+    def __init__(self, submit_data_callback=None):
+        super(RecordingView, self).__init__(submit_data_callback)
+        self.refreshed = []
+
+    def _create_widget(self):
+        return None
+
+    def refresh(self, new_data):
+        self.refreshed.append(new_data)
+
+
+class KeyedParentView(RecordingView):
+    def __init__(self, submit_data_callback=None):
+        self.removed = []
+        super(KeyedParentView, self).__init__(submit_data_callback)
+
+    def _create_child_view(self):
+        self.children = self.bind_keyed_children(
+            lambda data: data,
+            lambda key, value: RecordingView(),
+            lambda key, view: self.removed.append(key))
+
+
+def test_keyed_children_follow_the_keys():
+    parent = KeyedParentView()
+    data = pmap({1: "a", 2: "b"})
+    parent.try_refresh(data)
+    assert sorted(view.refreshed for view in parent.children) == [["a"],
+                                                                  ["b"]]
+    data = data.remove(1).set(3, "c")
+    parent.try_refresh(data)
+    assert parent.removed == [1]
+    assert parent.children.get(1) is None
+    assert parent.children.get(3).refreshed == ["c"]
+
+
+def test_keyed_children_only_refresh_changed_entries():
+    parent = KeyedParentView()
+    data = pmap({1: "a", 2: "b"})
+    parent.try_refresh(data)
+    unchanged = parent.children.get(1)
+    changed = parent.children.get(2)
+    parent.try_refresh(data.set(2, "c"))
+    assert unchanged.refreshed == ["a"]
+    assert changed.refreshed == ["b", "c"]
+
+
+def test_keyed_children_are_created_over_several_runs(qt_app):
+    parent = KeyedParentView()
+    data = [pmap({i: str(i) for i in range(50)})]
+    # Every run is over budget once its first view is created.
+    scheduler = RefreshScheduler(frame_budget=0.0)
+    scheduler.add_task(lambda: parent.try_refresh(data[0]))
+    counts = []
+    while scheduler.has_pending():
+        scheduler.run_now()
+        counts.append(len(parent.children))
+    assert counts[0] < 50
+    assert counts == sorted(counts)
+    assert counts[-1] == 50
+    assert sorted(view.refreshed for view in parent.children) == sorted(
+        [value] for value in data[0].values())
+
+
+def test_keyed_children_not_created_yet_follow_the_keys(qt_app):
+    parent = KeyedParentView()
+    data = [pmap({i: str(i) for i in range(50)})]
+    scheduler = RefreshScheduler(frame_budget=0.0)
+    scheduler.add_task(lambda: parent.try_refresh(data[0]))
+    scheduler.run_now()
+    built = {key for key in data[0] if parent.children.get(key)}
+    assert 0 < len(built) < 50
+    data[0] = pmap({key: "new" for key in [min(built), 49, 50]})
+    while scheduler.has_pending():
+        scheduler.run_now()
+    assert sorted(parent.removed) == sorted(built-{min(built)})
+    assert sorted(key for key in data[0] if parent.children.get(key)) == [
+        min(built), 49, 50]
+    assert parent.children.get(min(built)).refreshed[-1] == "new"
+    assert len(parent.children) == 3
+
+
+class PathParentView(RecordingView):
+    def _create_child_view(self):
+        self.child = RecordingView()
+        self.bind_child_view(self.child,
+                             lambda data: data["items"],
+                             path=("items",))
+
+
+def test_submit_path_builds_on_the_last_submitted_data():
+    submitted = []
+    parent = PathParentView(lambda data, record: submitted.append(data))
+    parent.try_refresh(pmap({"items": pvector(), "count": 0}))
+    parent.child.submit_path((APPEND,), "a")
+    parent.child.submit_path((APPEND,), "b")
+    assert submitted[-1] == pmap({"items": pvector(["a", "b"]), "count": 0})
+    parent.try_refresh(submitted[-1])
+    assert parent.child.get_current_data() == pvector(["a", "b"])
+
+
+def test_submit_path_keeps_an_undo_made_before_the_refresh():
+    data_manager = DataManager(pmap({"items": pvector(), "count": 0}))
+    parent = PathParentView(
+        lambda data, record: data_manager.push_data(data, record))
+    parent.bind_data_source(data_manager.get_data)
+    parent.try_refresh(data_manager.get_data())
+    parent.child.submit_path((APPEND,), "a")
+    parent.submit_path(("count",), 1)
+    data_manager.undo()
+    parent.child.submit_path((APPEND,), "b")
+    assert data_manager.get_data() == pmap({"items": pvector(["a", "b"]),
+                                            "count": 0})
+
+
+def test_submit_path_is_part_of_a_transaction():
+    submitted = []
+    parent = PathParentView(lambda data, record: submitted.append(data))
+    parent.try_refresh(pmap({"items": pvector(["a"]), "count": 0}))
+    with parent.transaction():
+        parent.child.submit_path((0,), "b")
+        parent.submit_path(("count",), 1)
+    assert submitted == [pmap({"items": pvector(["b"]), "count": 1})]
+
+
+def test_element_view_pool_prefers_the_same_key():
+    pool = ElementViewPool(3)
+    assert pool.acquire("a") is None
+    pool.release("a", "view_a")
+    pool.release("b", "view_b")
+    pool.release("c", "view_c")
+    assert pool.acquire("b") == "view_b"
+    # Least recently released first for other keys.
+    assert pool.acquire("x") == "view_a"
+    assert len(pool) == 1
+    assert (pool.hits, pool.misses) == (2, 1)
+
+
+def test_element_view_pool_destroys_past_its_capacity():
+    destroyed = []
+    pool = ElementViewPool(2, destroyed.append)
+    for i in range(5):
+        pool.release(i, "view_{0}".format(i))
+    assert destroyed == ["view_0", "view_1", "view_2"]
+    assert len(pool) == 2
+    assert pool.acquire(0) == "view_3"
+    empty = ElementViewPool(0, destroyed.append)
+    empty.release("a", "view_a")
+    assert destroyed[-1] == "view_a"
+    assert empty.acquire("a") is None
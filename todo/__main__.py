@@ -1,10 +1,18 @@
+import argparse
 import sys
 
 from todo.app import TodoApp
 
 
+def parse_args():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--history-file")
+    return parser.parse_args()
+
+
 def main():
-    todo_app = TodoApp()
+    args = parse_args()
+    todo_app = TodoApp(args.history_file)
     sys.exit(todo_app.exec_())
 
 
@@ -1,4 +1,3 @@
-from PySide6 import QtCore
 from PySide6 import QtGui
 from PySide6 import QtWidgets
 
@@ -7,29 +6,70 @@ import qdarktheme
 
 from framework.data import DataManager
 from framework.debug import generate_view_data
+from framework.history import KeyframeHistoryStorage
+from framework.history import SegmentHistoryStorage
+from framework.scheduler import RefreshScheduler
 from framework.view import DebugView
+from framework.view import MemoryReportView
+from framework.widget import ProfileAction
 
+from todo.data import ColorHistoryProjection
 from todo.data import TodoAppData
 from todo.debug import ColorHistoryView
 from todo.view import RootView
 
 
 class TodoApp(object):
-    def __init__(self):
+    HISTORY_MAX_ENTRIES = 1000
+    HISTORY_MAX_BYTES = 64*1024*1024
+    # Edits of the same node closer than this (in seconds) are folded into
+    # one undo step.
+    HISTORY_MERGE = 0.3
+    FRAME_BUDGET = 1.0/60
+
+    def __init__(self, history_file=None):
         self._debug_data = None
-        self._data_manager = DataManager(TodoAppData(todo_list=pvector()))
+        self._data_manager = DataManager(TodoAppData(todo_list=pvector()),
+                                         max_entries=self.HISTORY_MAX_ENTRIES,
+                                         max_bytes=self.HISTORY_MAX_BYTES,
+                                         merge_interval=self.HISTORY_MERGE,
+                                         storage=self._create_storage(
+                                             history_file))
 
         self._qt_app = QtWidgets.QApplication([])
         self._qt_app.setStyleSheet(qdarktheme.load_stylesheet())
         self._root_view = RootView(self._todo_data_updated)
+        self._root_view.bind_data_source(self._data_manager.get_data)
 
         self._debug_view = DebugView()
+        self._memory_report_view = MemoryReportView()
+        self._color_history_projection = self._data_manager.add_projection(
+            ColorHistoryProjection())
         self._color_history_view = ColorHistoryView()
 
         self._setup_menu(self._root_view.widget.menuBar())
 
-        self._update_timer = QtCore.QTimer()
-        self._update_timer.timeout.connect(self._update)
+        self._scheduler = RefreshScheduler(frame_budget=self.FRAME_BUDGET)
+        self._scheduler.watch(self._data_manager)
+        self._scheduler.add_task(self._update,
+                                 priority=RefreshScheduler.PRIORITY_MAIN,
+                                 max_rate=60)
+        self._scheduler.add_task(self._update_debug,
+                                 priority=RefreshScheduler.PRIORITY_SECONDARY,
+                                 max_rate=2,
+                                 is_visible=self._debug_view.widget.isVisible)
+        # Walking the whole history is slow, don't do it more than once every
+        # two seconds.
+        self._scheduler.add_task(
+            self._update_memory_report,
+            priority=RefreshScheduler.PRIORITY_SECONDARY,
+            max_rate=0.5,
+            is_visible=self._memory_report_view.widget.isVisible)
+        self._scheduler.add_task(
+            self._update_color_history,
+            priority=RefreshScheduler.PRIORITY_SECONDARY,
+            max_rate=2,
+            is_visible=self._color_history_view.widget.isVisible)
 
     def _setup_menu(self, menubar):
         self._undo = QtGui.QAction("Undo")
@@ -54,28 +94,54 @@ class TodoApp(object):
         debug_menu.addAction(self._view_tree)
         debug_menu.addAction(self._color_history)
 
+        self._memory_report = QtGui.QAction("History memory")
+        self._memory_report.triggered.connect(self._show_memory_report)
+        debug_menu.addAction(self._memory_report)
+
+        self._profile_toggle = ProfileAction()
+        debug_menu.addAction(self._profile_toggle)
+
     def _show_view_tree(self):
         self._debug_view.widget.show()
+        self._scheduler.request()
+
+    def _show_memory_report(self):
+        self._memory_report_view.widget.show()
+        self._scheduler.request()
 
     def _show_color_history(self):
         self._color_history_view.widget.show()
+        self._scheduler.request()
 
     def exec_(self):
         self._root_view.widget.show()
-        self._update()
-        self._update_timer.start(33)
-        return self._qt_app.exec_()
+        self._scheduler.run_now()
+        result = self._qt_app.exec_()
+        self._data_manager.close()
+        return result
+
+    def _create_storage(self, history_file):
+        if history_file is not None:
+            storage = SegmentHistoryStorage(history_file)
+        else:
+            storage = KeyframeHistoryStorage()
+        return storage
 
     def _update(self):
         self._root_view.try_refresh(self._data_manager.get_data())
+
+    def _update_debug(self):
         self._debug_data = generate_view_data(self._root_view,
                                               self._debug_data)
         self._debug_view.try_refresh(self._debug_data)
-        color_history = []
-        for record in reversed(self._data_manager.history):
-            if record.todo_list:
-                color_history.append(record.todo_list[0].color)
-        self._color_history_view.try_refresh(color_history)
+
+    def _update_memory_report(self):
+        self._memory_report_view.try_refresh(
+            self._data_manager.memory_report())
+
+    def _update_color_history(self):
+        self._color_history_view.try_refresh(
+            self._color_history_projection.result)
 
     def _todo_data_updated(self, new_todo_data, record_in_history=True):
         self._data_manager.push_data(new_todo_data,
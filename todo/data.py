@@ -1,14 +1,65 @@
 from pyrsistent import field
+from pyrsistent import pvector
 from pyrsistent import PRecord
 
+from framework.data import HistoryProjection
+from framework.data import intern_string
+from framework.data import InternedRecord
 from framework.data import RecordWithUUID
 
 
-class TodoItemData(RecordWithUUID):
+class TodoItemData(InternedRecord, RecordWithUUID):
     done = field()
     content = field()
-    color = field()
+    color = field(factory=intern_string)
 
 
 class TodoAppData(PRecord):
     todo_list = field()   # a list of TodoItemData
+
+
+class ColorHistoryProjection(HistoryProjection):
+    """The color of the first todo of every visible history entry, oldest
+    first.
+
+    Push, pop (undo) and evict cost O(1) per entry. Every state of the
+    result is kept on a stack, so an undo gives back the exact same object
+    the view saw before.
+    """
+
+    def __init__(self):
+        self._colors = pvector()
+        # Number of colors evicted before the first one in self._colors.
+        self._base = 0
+        self._removed = 0
+        # (colors, base, contributed a color) before each visible entry.
+        self._stack = []
+
+    @property
+    def result(self):
+        self._trim()
+        return self._colors
+
+    def push(self, data):
+        contributed = bool(data.todo_list)
+        self._stack.append((self._colors, self._base, contributed))
+        if contributed:
+            self._colors = self._colors.append(data.todo_list[0].color)
+
+    def pop(self):
+        self._colors, self._base, _ = self._stack.pop()
+
+    def evict(self, count):
+        self._removed += sum(1 for _, _, contributed in self._stack[:count]
+                             if contributed)
+        del self._stack[:count]
+        # Slicing is O(colors), only do it once the evicted colors are more
+        # than the visible ones so eviction stays O(1) amortized. The stack
+        # is bounded by the history, so are the colors its states hold.
+        if (self._removed-self._base)*2 > len(self._colors):
+            self._trim()
+
+    def _trim(self):
+        if self._base != self._removed:
+            self._colors = self._colors[self._removed-self._base:]
+            self._base = self._removed
@@ -37,6 +37,9 @@ class ColorView(ViewBase):
 
 
 class ColorHistoryView(ListViewBase):
+    # Every new color is a new key, reuse the widgets of the dropped ones.
+    ELEMENT_VIEW_POOL_SIZE = 32
+
     def __init__(self, submit_data_callback=None):
         super(ColorHistoryView, self).__init__(ColorView, submit_data_callback)
 
@@ -67,6 +70,9 @@ class ColorHistoryView(ListViewBase):
                 self._get_element_view_index(view), new_v, record_in_history))
         return view
 
+    def _destroy_element_view(self, element_view):
+        element_view.widget.deleteLater()
+
     def _insert_item(self, index, item):
         self._layout.insertWidget(index, item)
         self._layout.invalidate()
@@ -75,11 +81,17 @@ class ColorHistoryView(ListViewBase):
         item = self._layout.takeAt(index)
         item.widget().setParent(None)
 
+    def _move_item(self, from_index, to_index, item):
+        self._layout.takeAt(from_index)
+        self._layout.insertWidget(to_index, item)
+        self._layout.invalidate()
+
     def _update_triggered(self, index, new_value, record_in_history=True):
         pass
 
+    # The color history is stored oldest first, show the newest on top.
     def _generate_key_list(self, data_list):
-        return data_list
+        return list(reversed(data_list))
 
     def _get_data_at(self, index, key, data_collection):
-        return data_collection[index]
+        return data_collection[len(data_collection)-1-index]
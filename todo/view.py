@@ -1,8 +1,11 @@
+import functools
+
 from PySide6 import QtCore
 from PySide6 import QtWidgets
 
+from framework.path import APPEND
 from framework.view import ViewBase
-from framework.view import ListViewBase
+from framework.view import VirtualListViewBase
 
 from todo.data import TodoItemData
 
@@ -26,17 +29,19 @@ class RootView(ViewBase):
         super(RootView, self).__init__(submit_data_callback)
 
     def _create_child_view(self):
-        self._input_view = TodoInputView(self._todo_list_updated)
+        self._input_view = TodoInputView()
         self.bind_child_view(self._input_view,
-                             lambda todo_app_data: todo_app_data.todo_list)
+                             lambda todo_app_data: todo_app_data.todo_list,
+                             path=("todo_list",))
 
         self._counter_view = TodoCounterView()
         self.bind_child_view(self._counter_view,
                              lambda todo_app_data: todo_app_data.todo_list)
 
-        self._list_view = TodoListView(self._todo_list_updated)
+        self._list_view = TodoListView()
         self.bind_child_view(self._list_view,
-                             lambda todo_app_data: todo_app_data.todo_list)
+                             lambda todo_app_data: todo_app_data.todo_list,
+                             path=("todo_list",))
 
     def _create_widget(self):
         widget = QtWidgets.QWidget()
@@ -55,11 +60,6 @@ class RootView(ViewBase):
 
         return main_window
 
-    def _todo_list_updated(self, new_todo_list, record_in_history=True):
-        current_data = self.get_current_data()
-        new_data = current_data.set("todo_list", new_todo_list)
-        self.submit_data(new_data, record_in_history=record_in_history)
-
 
 class TodoInputView(ViewBase):
     def _create_widget(self):
@@ -75,8 +75,7 @@ class TodoInputView(ViewBase):
                 new_item = TodoItemData(done=False,
                                         content=content,
                                         color="#FFFFFF")
-                new_data = current_data.append(new_item)
-                self.submit_data(new_data)
+                self.submit_path((APPEND,), new_item)
                 self.widget.setText("")
 
 
@@ -119,8 +118,7 @@ class TodoItemView(ViewBase):
         current_data = self.get_current_data()
         if current_data is not self.UNINTIALIZED and (
                 current_data.done != value):
-            new_data = current_data.set("done", value)
-            self.submit_data(new_data)
+            self.submit_path(("done",), value)
 
     def _pick_label_color(self):
         dialog = QtWidgets.QColorDialog(self.widget)
@@ -129,53 +127,55 @@ class TodoItemView(ViewBase):
         def current_color_changed(color):
             current_data = self.get_current_data()
             new_data = current_data.set("color", color.name())
-            self.submit_data(new_data, False)
+            self.submit_data_coalesced(new_data, False)
         dialog.currentColorChanged.connect(current_color_changed)
 
         def color_selected(color):
             current_data = self.get_current_data()
             new_data = current_data.set("color", color.name())
-            self.submit_data(new_data, True)
+            self.submit_data_coalesced(new_data, True)
         dialog.colorSelected.connect(color_selected)
 
         origin_color = self.get_current_data().color
         if not dialog.exec_():
             current_data = self.get_current_data()
-            if current_data.color != origin_color:
+            if self.has_pending_submit() or (
+                    current_data.color != origin_color):
                 new_data = current_data.set("color", origin_color)
                 self.submit_data(new_data)
 
 
-class TodoListView(ListViewBase):
+def _find_item(id_, index, todo_list):
+    if index < len(todo_list) and todo_list[index].id_ == id_:
+        return index
+    for i, item in enumerate(todo_list):
+        if item.id_ == id_:
+            return i
+    raise KeyError(id_)
+
+
+class TodoListView(VirtualListViewBase):
+    # Items have unique ids, reordering them moves rows of the model.
+    DIFF_STRATEGY = "keyed"
+
     def __init__(self, submit_data_callback=None):
         super(TodoListView, self).__init__(TodoItemView, submit_data_callback)
 
-    def _create_widget(self):
-        list_widget = QtWidgets.QWidget()
-        self._layout = QtWidgets.QVBoxLayout()
-        self._layout.setAlignment(QtCore.Qt.AlignTop)
-        self._layout.setContentsMargins(0, 0, 0, 0)
-        list_widget.setLayout(self._layout)
-        return list_widget
-
     def _create_element_view(self):
         view = self._element_view_factory(
             lambda new_v, record_in_history=True: self._update_triggered(
-                self._get_element_view_index(view), new_v, record_in_history))
+                view, new_v, record_in_history))
         return view
 
-    def _insert_item(self, index, item):
-        self._layout.insertWidget(index, item)
+    def _update_triggered(self, view, new_value, record_in_history=True):
+        path = self._get_child_path(view)
+        # Views released while scrolling have no row.
+        if path is not None:
+            self.submit_path(path, new_value, record_in_history)
 
-    def _take_item(self, index):
-        item = self._layout.takeAt(index)
-        item.widget().deleteLater()
-
-    def _update_triggered(self, index, new_value, record_in_history=True):
-        current_data = self.get_current_data()
-        if current_data is not self.UNINTIALIZED:
-            new_data = current_data.set(index, new_value)
-            self.submit_data(new_data, record_in_history=record_in_history)
+    def _get_element_path(self, index, key):
+        # Items may be inserted or removed before the update is applied.
+        return (functools.partial(_find_item, key, index),)
 
     def _generate_key_list(self, data_list):
         return [item.id_ for item in data_list]